@@ -1,5 +1,6 @@
 import os, sys
-from json import load
+import threading
+import time
 import pygame
 import grid_info
 
@@ -9,47 +10,242 @@ import AlgorNX_runner as runner
 import AlgorNX_editor as editor
 import AlgorNX_images as images
 
-def draw_test_on_surface(surface, test, robot_position, robot_direction):
-    for y, line in enumerate(test, 1):
-        for x, square_type in enumerate(line, 1):
-            surface.blit(images.images[grid_info.get_image_from_type(square_type)], (x*grid_info.IMAGE_SIZE, y*grid_info.IMAGE_SIZE))
-
-        surface.blit(images.images["robot_{}".format(robot_direction)], (robot_position["x"]*grid_info.IMAGE_SIZE, robot_position["y"]*grid_info.IMAGE_SIZE))
-
-def load_level(level_folder):
-    with open(os.path.join(level_folder, "level.json")) as f:
-        level_data = load(f)
-    return level_data
-
-def load_program(level_folder):
-    try:
-        with open(os.path.join(level_folder, "program.py")) as f:
-            program_data = f.read()
-        return program_data
-    except OSError:
+SLOW_SPEEDS_FRAMES = (60, 20)  # Frames between two steps for the > and >> speeds
+INSTANT_SPEED = 2  # As many steps per frame as fit in the time budget
+COMPLETION_SPEED = 3  # The same, but the grid is only drawn once the program is done
+STEP_TIME_BUDGET = 0.008
+STEPS_BETWEEN_TIME_CHECKS = 16
+FRAME_RATE = 60
+IDLE_WAIT_TIMEOUT = 250  # Milliseconds, when nothing runs and nothing changed
+
+class Viewport():
+    """Scrollable and zoomable view of a test grid, drawn on a fixed size surface.
+
+    Only the visible squares are drawn, so neither the memory nor the time taken depends on the
+    pixel size of the whole grid. Squares are numbered from 1 like in the game, and the first
+    IMAGE_SIZE pixels of each side are kept for the coordinates.
+    """
+    MIN_CELL_SIZE = 4
+    MAX_CELL_SIZE = 40
+
+    def __init__(self, surface, grid_width, grid_height):
+        self.surface = surface
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.margin = grid_info.IMAGE_SIZE
+        self.cell_size = grid_info.IMAGE_SIZE
+        self.scroll_x = self.scroll_y = 0  # Squares hidden on the left and on the top
+        self.scaled_images = {grid_info.IMAGE_SIZE: images.images}
+        self.test = None
+        self.mismatches = None
+        self.drawn_view = None
+
+    def get_visible_size(self):
+        """Number of columns and lines at least partly visible."""
+        return (min(self.grid_width - self.scroll_x, -(-(self.surface.get_width() - self.margin) // self.cell_size)),
+                min(self.grid_height - self.scroll_y, -(-(self.surface.get_height() - self.margin) // self.cell_size)))
+
+    def scroll(self, dx, dy):
+        full_columns = max(1, (self.surface.get_width() - self.margin) // self.cell_size)
+        full_lines = max(1, (self.surface.get_height() - self.margin) // self.cell_size)
+        self.scroll_x = max(0, min(self.scroll_x + dx, self.grid_width - full_columns))
+        self.scroll_y = max(0, min(self.scroll_y + dy, self.grid_height - full_lines))
+
+    def zoom(self, steps):
+        cell_size = max(self.MIN_CELL_SIZE, min(self.MAX_CELL_SIZE, self.cell_size + steps * 4))
+        if cell_size != self.cell_size:
+            self.cell_size = cell_size
+            self.scroll(0, 0)
+
+    def follow(self, x, y):
+        """Scrolls just enough for the square (x, y) to be visible."""
+        full_columns = max(1, (self.surface.get_width() - self.margin) // self.cell_size)
+        full_lines = max(1, (self.surface.get_height() - self.margin) // self.cell_size)
+        dx = min(0, x - 1 - self.scroll_x) + max(0, x - self.scroll_x - full_columns)
+        dy = min(0, y - 1 - self.scroll_y) + max(0, y - self.scroll_y - full_lines)
+        if dx or dy:
+            self.scroll(dx, dy)
+
+    def get_position(self, x, y):
+        """Pixel position of the square (x, y) on the surface, None when it isn't visible."""
+        columns, lines = self.get_visible_size()
+        if self.scroll_x < x <= self.scroll_x + columns and self.scroll_y < y <= self.scroll_y + lines:
+            return (self.margin + (x-1-self.scroll_x)*self.cell_size, self.margin + (y-1-self.scroll_y)*self.cell_size)
         return None
 
+    def get_images(self):
+        scaled_images = self.scaled_images.get(self.cell_size)
+        if scaled_images is None:
+            size = (self.cell_size, self.cell_size)
+            scaled_images = {name: pygame.transform.scale(image, size) for name, image in images.images.items() if image.get_size() == (grid_info.IMAGE_SIZE, grid_info.IMAGE_SIZE)}
+            self.scaled_images[self.cell_size] = scaled_images
+        return scaled_images
+
+    def draw_coords(self, columns, lines):
+        # Only every few coordinates when the squares are too small for all of them
+        every = max(1, -(-images.font.size(str(max(self.grid_width, self.grid_height)))[0] // self.cell_size))
+        for x in range(self.scroll_x + 1, self.scroll_x + columns + 1):
+            if x % every == 0 or every == 1:
+                text = images.render_text(str(x), (0, 0, 0))
+                self.surface.blit(text, (self.margin + (x-1-self.scroll_x)*self.cell_size + (self.cell_size - text.get_width())//2, 3))
+        every = max(1, -(-images.font.get_height() // self.cell_size))
+        for y in range(self.scroll_y + 1, self.scroll_y + lines + 1):
+            if y % every == 0 or every == 1:
+                text = images.render_text(str(y), (0, 0, 0))
+                self.surface.blit(text, ((self.margin - text.get_width())//2, self.margin + (y-1-self.scroll_y)*self.cell_size + (self.cell_size - text.get_height())//2))
+
+    def add_square_blits(self, blits, scaled_images, square_type, position):
+        if square_type & grid_info.NUMBER:
+            blits.append((scaled_images[grid_info.get_image_from_type(grid_info.EMPTY)], position))
+            if self.cell_size >= grid_info.IMAGE_SIZE:
+                text = images.render_text(str(grid_info.square_number_get(square_type)), (0, 0, 0))
+                blits.append((text, (position[0] + (self.cell_size - text.get_width())//2, position[1] + (self.cell_size - text.get_height())//2)))
+        else:
+            blits.append((scaled_images[grid_info.get_image_from_type(square_type)], position))
+
+    def draw(self, squares, robot_position, robot_direction):
+        """Draws a grid, given as a flat sequence of square types, and the robot unless robot_position is None."""
+        self.test = (squares, robot_position, robot_direction)
+        self.mismatches = None
+        self.redraw()
+
+    def redraw(self):
+        if self.test is None:
+            return
+        squares, robot_position, robot_direction = self.test
+        scaled_images = self.get_images()
+        columns, lines = self.get_visible_size()
+        self.drawn_view = (self.scroll_x, self.scroll_y, self.cell_size)
+
+        self.surface.fill(images.clear_color)
+        self.draw_coords(columns, lines)
+        blits = []
+        for y in range(self.scroll_y, self.scroll_y + lines):
+            row_start = y*self.grid_width + self.scroll_x
+            pixel_y = self.margin + (y - self.scroll_y)*self.cell_size
+            for x, square_type in enumerate(squares[row_start:row_start + columns]):
+                self.add_square_blits(blits, scaled_images, square_type, (self.margin + x*self.cell_size, pixel_y))
+
+        robot_pixels = self.get_position(robot_position["x"], robot_position["y"]) if robot_position is not None else None
+        if robot_pixels is not None:
+            blits.append((scaled_images["robot_{}".format(robot_direction)], robot_pixels))
+        self.surface.blits(blits, False)
+
+        if self.mismatches is not None:
+            self.draw_mismatches(*self.mismatches)
+
+    def update(self, squares, robot_position, robot_direction, changed_squares):
+        """Redraws only the changed squares and the old and new squares of the robot.
+
+        Returns the rects of the surface that were drawn. Everything is drawn again when the changes
+        aren't known, or when the view scrolled or zoomed since the last drawing.
+        """
+        if changed_squares is None or self.test is None or self.mismatches is not None or self.drawn_view != (self.scroll_x, self.scroll_y, self.cell_size):
+            self.draw(squares, robot_position, robot_direction)
+            return [self.surface.get_rect()]
+
+        old_position, old_direction = self.test[1], self.test[2]
+        self.test = (squares, robot_position, robot_direction)
+        indices = set(changed_squares)
+        if old_position != robot_position or old_direction != robot_direction:
+            indices.add((old_position["y"]-1)*self.grid_width + old_position["x"]-1)
+            indices.add((robot_position["y"]-1)*self.grid_width + robot_position["x"]-1)
+
+        scaled_images = self.get_images()
+        surface_rect = self.surface.get_rect()
+        blits = []
+        rects = []
+        for index in indices:
+            position = self.get_position(index % self.grid_width + 1, index // self.grid_width + 1)
+            if position is not None:
+                self.add_square_blits(blits, scaled_images, squares[index], position)
+                rects.append(pygame.Rect(position, (self.cell_size, self.cell_size)).clip(surface_rect))
+
+        robot_pixels = self.get_position(robot_position["x"], robot_position["y"])
+        if robot_pixels is not None and (robot_position["y"]-1)*self.grid_width + robot_position["x"]-1 in indices:
+            blits.append((scaled_images["robot_{}".format(robot_direction)], robot_pixels))
+        self.surface.blits(blits, False)
+        return rects
+
+    def draw_mismatches(self, mismatches, color):
+        self.mismatches = (mismatches, color)
+        for x, y in mismatches:
+            position = self.get_position(x, y)
+            if position is not None:
+                pygame.draw.rect(self.surface, color, position + (self.cell_size, self.cell_size), 2)
+
+    def draw_heatmap(self, square_visits):
+        most_visits = max(square_visits)
+        if not most_visits:
+            return
+        heat_square = pygame.Surface((self.cell_size, self.cell_size), pygame.SRCALPHA)
+        columns, lines = self.get_visible_size()
+        for y in range(self.scroll_y, self.scroll_y + lines):
+            row_start = y*self.grid_width + self.scroll_x
+            for x, visits in enumerate(square_visits[row_start:row_start + columns]):
+                if visits:
+                    heat_square.fill((255, 0, 0, 40 + 160*visits//most_visits))
+                    self.surface.blit(heat_square, (self.margin + x*self.cell_size, self.margin + (y - self.scroll_y)*self.cell_size))
+
+class Layer():
+    """Part of the screen kept on its own surface, drawn again only when the state it shows changes."""
+    def __init__(self, rect, render):
+        self.rect = pygame.Rect(rect)
+        self.surface = pygame.Surface(self.rect.size)
+        self.render = render
+        self.state = None
+
+    def draw(self, screen, state):
+        """Blits the layer on the screen, returns True when it had to be drawn again."""
+        changed = state != self.state
+        if changed:
+            self.state = state
+            self.surface.fill(images.clear_color)
+            self.render(self.surface)
+        screen.blit(self.surface, self.rect)
+        return changed
+
+def draw_test_on_surface(viewport, squares, robot_position, robot_direction):
+    viewport.draw(squares, robot_position, robot_direction)
+
+def draw_test_changes_on_surface(viewport, squares, robot_position, robot_direction, changed_squares):
+    return viewport.update(squares, robot_position, robot_direction, changed_squares)
+
 def save_program(level_folder, source):
     with open(os.path.join(level_folder, "program.py"), "w") as f:
         f.write(source)
 
 class AlgorNX():
     def add_button_text(self, key, value):
-        self.running_buttons_text[key] = (images.font.render(value, False, self.text_color), images.font.size(value))
+        self.running_buttons_text[key] = (images.render_text(value, self.text_color), images.font.size(value))
 
-    def __init__(self, level_folder):
+    def __init__(self, level_folder, replay_path=None, step_time_budget=STEP_TIME_BUDGET):
         self.running = True
+        self.step_time_budget = step_time_budget
         self.screen = pygame.display.set_mode((1280, 720), pygame.HWSURFACE)
         self.screen_surface = pygame.display.get_surface()
+        images.convert_images()
         self.clock = pygame.time.Clock()
         self.program_runner = None
+        self.timeline = None
+        self.validating = False
+        self.validation_results = []
+        self.show_heatmap = False
+        self.full_update = True  # Set when something else than the running test changed on the screen
+        self.frames_drawn = 0
+        self.idle_time = 0.0  # Seconds the idle loop slept, waiting for input
 
         self.control_buttons_height = 40
         self.tests_width = 480
-        self.control_buttons_surface = self.screen_surface.subsurface((0, 0, self.tests_width, self.control_buttons_height))
+        self.control_buttons_layer = Layer((0, 0, self.tests_width, self.control_buttons_height), self.draw_control_buttons)
+        self.tests_headers_layer = Layer((0, self.control_buttons_height, self.tests_width, 720-self.control_buttons_height), self.draw_tests_headers)
 
-        self.level_data = load_level(level_folder)
-        self.program_source = load_program(level_folder)
+        self.level_data = runner.load_level(level_folder)
+        self.program_source = runner.load_program(level_folder)
+        self.replay_data = None
+        if replay_path is not None:
+            with open(replay_path, "rb") as f:
+                self.replay_data = f.read()
 
         self.text_color = (0,0,0)
 
@@ -64,23 +260,19 @@ class AlgorNX():
         self.header_rect_inner.fill((221, 237, 248))
         self.header_rect_inner = (self.header_rect_inner, (2, 2))
 
-        self.tests_header_text = [(images.font.render("Test {}".format(i+1), False, self.text_color), (4,4)) for i in range(len(self.level_data["tests"]))]
-        self.tests_header_arrow_right = (images.font.render("\u25ba", False, self.text_color), (self.tests_width-26,2))
-        self.tests_header_arrow_down = (images.font.render("\u25bc", False, self.text_color), (self.tests_width-26,2))
-
-        self.test_coords_text = [(images.font.render(str(i+1), False, self.text_color), images.font.size(str(i+1))[0]) for i in range(max(self.level_data["size"]["width"], self.level_data["size"]["height"]))]
+        self.tests_header_text = [(images.render_text("Test {}".format(i+1), self.text_color), (4,4)) for i in range(len(self.level_data["tests"]))]
+        self.tests_header_arrow_right = (images.render_text("\u25ba", self.text_color), (self.tests_width-26,2))
+        self.tests_header_arrow_down = (images.render_text("\u25bc", self.text_color), (self.tests_width-26,2))
 
+        # Big grids are seen through a viewport that fits the panel under the headers of every test
+        tests_headers_height = len(self.level_data["tests"]) * (self.test_header_height + 4)
+        self.actual_tests_width = min(self.actual_tests_width, self.tests_width - 40)
+        self.actual_tests_height = min(self.actual_tests_height, 720 - self.control_buttons_height - tests_headers_height - 8)
         self.tests_surface = pygame.Surface((self.actual_tests_width, self.actual_tests_height))
+        self.viewport = Viewport(self.tests_surface, self.level_data["size"]["width"], self.level_data["size"]["height"])
 
-        self.tests_surface.fill(images.clear_color)
-        for x in range(self.level_data["size"]["width"]):
-            self.tests_surface.blit(self.test_coords_text[x][0], ((x+1)*grid_info.IMAGE_SIZE + (grid_info.IMAGE_SIZE - self.test_coords_text[x][1])//2, 3))
-
-        for y in range(self.level_data["size"]["height"]):
-            self.tests_surface.blit(self.test_coords_text[y][0], ((grid_info.IMAGE_SIZE - self.test_coords_text[y][1])//2, (y+1)*grid_info.IMAGE_SIZE + 2))
-
-        self.running_button_width, self.running_button_height = 80, 32
-        self.running_button_gap = 15
+        self.running_button_width, self.running_button_height = 66, 32
+        self.running_button_gap = 12
         self.running_button_outer = pygame.Surface((self.running_button_width, self.running_button_height))
         self.running_button_outer.fill((161, 207, 237))
         self.running_button_inner = pygame.Surface((self.running_button_width-4, self.running_button_height-4))
@@ -94,20 +286,31 @@ class AlgorNX():
         self.add_button_text("normal_speed", ">")
         self.add_button_text("fast_speed", ">>")
         self.add_button_text("instant_speed", ">>>")
+        self.add_button_text("completion_speed", ">|")
 
         self.running_buttons_handlers = (
             self.validate_program_button_action,
             self.run_program_button_action,
             lambda: self.select_speed_mode(0),
             lambda: self.select_speed_mode(1),
-            lambda: self.select_speed_mode(2),
+            lambda: self.select_speed_mode(INSTANT_SPEED),
+            lambda: self.select_speed_mode(COMPLETION_SPEED),
         )
 
         green_color = (0,255,128)
         self.red_color = (255,60,60)
-        self.success_text = images.font.render("Test passed sucessfully!", False, green_color)
-        self.validate_success_text = images.font.render("All tests passed sucessfully!", False, green_color)
-        self.failure_text = images.font.render("Test failed!", False, self.red_color)
+        self.success_text = images.render_text("Test passed sucessfully!", green_color)
+        self.validate_success_text = images.render_text("All tests passed sucessfully!", green_color)
+        self.failure_text = images.render_text("Test failed!", self.red_color)
+        self.validate_failure_text = images.render_text("Some tests failed!", self.red_color)
+        self.validate_stopped_text = images.render_text("Validation stopped", self.text_color)
+        self.validation_colors = {
+            "passed": green_color,
+            "failed": self.red_color,
+            "error": self.red_color,
+            "limit_exceeded": self.red_color,
+            "stopped": self.text_color,
+        }
 
         self.editor_surface_width = 1280-self.tests_width
         self.editor_surface_height = 720-self.control_buttons_height
@@ -117,43 +320,55 @@ class AlgorNX():
 
         self.editor = editor.Editor(self.editor_surface, self.program_source, self.level_data["allowed_keywords"])
 
-        self.select_test(0)
+        self.select_test(runner.read_trace_header(self.replay_data)[1] if self.replay_data is not None else 0)
+
+    @property
+    def frames_skipped(self):
+        """Frames the idle loop didn't draw, that a constant frame rate would have."""
+        return int(self.idle_time * FRAME_RATE)
+
+    def is_idle(self):
+        return not (self.test_running or self.validating or self.full_update)
 
     def mainloop(self):
         while self.running:
+            if self.is_idle():
+                # Nothing would change on the screen, sleep until some input comes
+                start = time.perf_counter()
+                event = pygame.event.wait(IDLE_WAIT_TIMEOUT)
+                self.idle_time += time.perf_counter() - start
+                if event.type != pygame.NOEVENT:
+                    self.events([event] + pygame.event.get())
+                continue
+
             self.draw()
-            self.events()
+            self.frames_drawn += 1
+            self.events(pygame.event.get())
 
-            self.clock.tick(60)
+            self.clock.tick(FRAME_RATE)
 
     def clear_message(self):
         self.message_surface.fill(images.clear_color)
+        self.full_update = True
 
     def set_message_on_surface(self, surface):
         self.clear_message()
         self.message_surface.blit(surface, ((self.message_surface.get_width() - surface.get_width())//2, (self.message_surface.get_height() - surface.get_height())//2))
 
     def set_error_message(self, message):
-        self.set_message_on_surface(images.font.render(message, False, self.red_color))
+        self.set_message_on_surface(images.render_text(message, self.red_color))
 
     def draw_source_running(self, lineno):
         pass
 
-    def draw_control_buttons(self):
+    def draw_control_buttons(self, surface):
         control_buttons_surfaces = []
 
         x_speed = x_text = 6
 
-        control_buttons_surfaces.append((self.running_button_outer, (x_speed+4, 4)))
-        x_speed += self.running_button_width + self.running_button_gap
-        control_buttons_surfaces.append((self.running_button_outer, (x_speed+4, 4)))
-        x_speed += self.running_button_width + self.running_button_gap
-        control_buttons_surfaces.append((self.running_button_outer, (x_speed+4, 4)))
-        x_speed += self.running_button_width + self.running_button_gap
-        control_buttons_surfaces.append((self.running_button_outer, (x_speed+4, 4)))
-        x_speed += self.running_button_width + self.running_button_gap
-        control_buttons_surfaces.append((self.running_button_outer, (x_speed+4, 4)))
-        x_speed += self.running_button_width + self.running_button_gap
+        for i in range(len(self.running_buttons_handlers)):
+            control_buttons_surfaces.append((self.running_button_outer, (x_speed+4, 4)))
+            x_speed += self.running_button_width + self.running_button_gap
 
         def add_button_text_to_surfaces(self, id):
             nonlocal control_buttons_surfaces
@@ -177,11 +392,45 @@ class AlgorNX():
         add_button_text_to_surfaces(self, "normal_speed")
         add_button_text_to_surfaces(self, "fast_speed")
         add_button_text_to_surfaces(self, "instant_speed")
-
-        self.control_buttons_surface.blits(control_buttons_surfaces, False)
-
-    def draw_tests_headers(self):
-        for i, test_header in enumerate(self.tests_header_surfaces):
+        add_button_text_to_surfaces(self, "completion_speed")
+
+        surface.blits(control_buttons_surfaces, False)
+
+    def get_validation_status(self, test_id):
+        if test_id < len(self.validation_results) and self.validation_results[test_id]:
+            result = self.validation_results[test_id]
+            return "{} ({} steps)".format(result["outcome"].replace("_", " "), result["steps"]), self.validation_colors[result["outcome"]]
+        elif self.validating and test_id == self.validation_test and self.validation_runner:
+            return "running ({} steps)".format(self.validation_runner.lines_executed), self.text_color
+        elif self.validating:
+            return "waiting", self.text_color
+        return None, None
+
+    def get_tests_headers_state(self):
+        return (self.selected_test,) + tuple(self.get_validation_status(i) for i in range(len(self.level_data["tests"])))
+
+    def step_program(self):
+        """Runs the program for one frame, returns True when the grid should be drawn."""
+        if self.selected_speed < INSTANT_SPEED:
+            if self.framecnt % SLOW_SPEEDS_FRAMES[self.selected_speed] == 0:
+                self.program_runner.update()
+                self.draw_source_running(self.program_runner.line_no)
+            return True
+
+        # Simulation isn't tied to the frame rate, the steps of a frame are drawn at once
+        program_runner = self.program_runner
+        deadline = time.perf_counter() + self.step_time_budget
+        while not program_runner.program_done and time.perf_counter() < deadline:
+            for i in range(STEPS_BETWEEN_TIME_CHECKS):
+                program_runner.update()
+                if program_runner.program_done:
+                    break
+        self.draw_source_running(program_runner.line_no)
+        return self.selected_speed != COMPLETION_SPEED or program_runner.program_done
+
+    def draw_tests_headers(self, surface):
+        for i, test_header_rect in enumerate(self.tests_header_rects):
+            test_header = surface.subsurface(test_header_rect.move(0, -self.control_buttons_height))
             surfaces = [self.header_rect_outer]
             if i == self.selected_test:
                 surfaces.append(self.header_rect_inner)
@@ -191,53 +440,106 @@ class AlgorNX():
 
             surfaces.append(self.tests_header_text[i])
 
+            status, color = self.get_validation_status(i)
+            if status:
+                status_text = images.render_text(status, color)
+                surfaces.append((status_text, (self.tests_width-40-status_text.get_width(), 4)))
+
             test_header.blits(surfaces, False)
 
     def draw(self):
-        self.screen.fill(images.clear_color)
-
-        self.editor.draw()
-
-        self.draw_control_buttons()
-        self.draw_tests_headers()
-
+        # The screen is only made of layers, each one drawn again only when its state changed
+        rects = []
+        if self.editor.draw():
+            rects.append(self.editor_surface.get_rect(topleft=self.editor_surface.get_abs_offset()))
+        if self.control_buttons_layer.draw(self.screen_surface, (self.test_running, self.test_running and self.selected_speed)):
+            rects.append(self.control_buttons_layer.rect)
+        if self.tests_headers_layer.draw(self.screen_surface, self.get_tests_headers_state()):
+            rects.append(self.tests_headers_layer.rect)
+
+        tests_rects = []
         if self.test_running:
             self.framecnt += 1
             self.framecnt %= 240
             try:
-                speeds = [1, 20, 60]
-                if self.framecnt % speeds[2-self.selected_speed] == 0:
-                    self.program_runner.update()
-                    self.draw_source_running(self.program_runner.line_no)
-                self.program_runner.draw(draw_test_on_surface, self.tests_surface)
-            except Exception as e:
+                if self.step_program():
+                    self.viewport.follow(self.program_runner.robot.x, self.program_runner.robot.y)
+                    if self.show_heatmap and self.program_runner.profiler is not None:
+                        self.program_runner.draw(draw_test_on_surface, self.viewport)
+                        self.viewport.draw_heatmap(self.program_runner.profiler.square_visits)
+                        self.full_update = True
+                    else:
+                        tests_rects = self.program_runner.draw_changes(draw_test_changes_on_surface, self.viewport)
+            except (Exception, runner.LimitExceeded) as e:
                 self.set_error_message(str(e))
                 self.run_program_button_action()  # Stop the test
 
+        if self.validating and not self.validation_thread.is_alive():
+            self.validating = False
+            if self.validation_stop_event.is_set():
+                self.set_message_on_surface(self.validate_stopped_text)
+            elif all(result and result["passed"] for result in self.validation_results):
+                self.set_message_on_surface(self.validate_success_text)
+            else:
+                self.set_message_on_surface(self.validate_failure_text)
+
         if self.test_running and self.program_runner.program_done:
             if self.program_runner.is_success():
                 self.set_message_on_surface(self.success_text)
             else:
                 self.set_message_on_surface(self.failure_text)
+                self.viewport.draw_mismatches(self.program_runner.get_mismatches(), self.red_color)
             self.run_program_button_action()  # Stop the test
 
         self.screen_surface.blit(self.message_surface, (1280-self.message_surface.get_width(), 720-self.message_surface.get_height()))
 
         self.screen_surface.blit(self.tests_surface, self.tests_surface_pos)
-        pygame.display.update()
+        if not self.full_update:
+            # Only the layers drawn again and the squares drawn by the running test go to the display
+            pygame.display.update(rects + [rect.move(self.tests_surface_pos) for rect in tests_rects])
+        else:
+            pygame.display.update()
+        self.full_update = False
+
+    def validation_target(self):
+        for i in range(len(self.level_data["tests"])):
+            self.validation_test = i
+            self.validation_runner = None
+            self.validation_results[i] = runner.run_test(self.level_data, i, self.program_source, on_start=self.set_validation_runner, stop_event=self.validation_stop_event)
+            if self.validation_stop_event.is_set():
+                break
+
+    def set_validation_runner(self, program_runner):
+        self.validation_runner = program_runner
 
     def validate_program_button_action(self):
-        if not self.test_running:
+        if self.validating:
+            self.validation_stop_event.set()
+        elif not self.test_running:
+            # Runs every test at full speed on another thread, the headers show the progress
             self.validating = True
+            self.validation_test = 0
+            self.validation_runner = None
+            self.validation_results = [None] * len(self.level_data["tests"])
+            self.validation_stop_event = threading.Event()
+            self.validation_thread = threading.Thread(target=self.validation_target, daemon=True)
+            self.validation_thread.start()
+            self.clear_message()
 
     def run_program_button_action(self):
         if self.test_running:
             self.test_running = False
             self.program_runner.stop()
+            self.timeline = self.program_runner.timeline
+            self.timeline_step = len(self.timeline)
             self.program_runner = None
-        else:
+        elif not self.validating:
             try:
-                self.program_runner = runner.validate_and_start_program(self.program_source, self.level_data, self.selected_test)
+                self.timeline = None
+                if self.replay_data is not None:
+                    self.program_runner = runner.TraceReplayer(self.level_data, self.replay_data, record_timeline=True)
+                else:
+                    self.program_runner = runner.validate_and_start_program(self.program_source, self.level_data, self.selected_test, record_timeline=True, limits={"lines": None, "time": None}, profile=True)  # Watching a run is slow on purpose, and can be stopped
                 self.test_running = True
                 self.selected_speed = 0
                 self.framecnt = 0
@@ -245,23 +547,40 @@ class AlgorNX():
             except Exception as e:
                 self.set_error_message(str(e))
 
+    def seek_timeline(self, step):
+        self.timeline_step = max(0, min(step, len(self.timeline)))
+        squares, robot_position, robot_direction, _ = self.timeline.state_at(self.timeline_step)
+        self.viewport.follow(robot_position["x"], robot_position["y"])
+        draw_test_on_surface(self.viewport, squares, robot_position, robot_direction)
+        message = "Step {}/{}".format(self.timeline_step, len(self.timeline))
+        if self.timeline.truncated:
+            message += " (recording stopped)"
+        self.set_message_on_surface(images.render_text(message, self.text_color))
+
     def select_speed_mode(self, speed_mode):
         if self.test_running:
             self.selected_speed = speed_mode
+            if speed_mode == COMPLETION_SPEED:
+                self.set_message_on_surface(images.render_text("Running to completion...", self.text_color))
+            else:
+                self.clear_message()
 
-    def events(self):
-        events = pygame.event.get()
+    def events(self, events):
         pos = pygame.mouse.get_pos()
         self.editor.handle_mouse_hover(pos)
         for e in events:
+            if e.type != pygame.MOUSEMOTION:
+                self.full_update = True
             if e.type == pygame.QUIT:
+                if self.validating:
+                    self.validation_stop_event.set()  # Not joined, the daemon thread can be in a long builtin call
                 if self.program_runner:
                     self.program_runner.stop()
                     self.program_runner = None
                 self.running = False
             elif e.type == pygame.MOUSEBUTTONDOWN:
                 if e.button == 1:
-                    if not self.test_running:
+                    if not self.test_running and self.replay_data is None:  # A trace only replays its own test
                         for i, test_header in enumerate(self.tests_header_rects):
                             if test_header.collidepoint(pos):
                                 self.select_test(i)
@@ -273,26 +592,53 @@ class AlgorNX():
                             break
 
                     self.editor.handle_mouse_click(pos)
+            elif e.type == pygame.MOUSEWHEEL:
+                if self.tests_surface.get_rect(topleft=self.tests_surface_pos).collidepoint(pos):
+                    if pygame.key.get_mods() & pygame.KMOD_CTRL:
+                        self.viewport.zoom(e.y)
+                    elif pygame.key.get_mods() & pygame.KMOD_SHIFT:
+                        self.viewport.scroll(-e.y * 3, 0)
+                    else:
+                        self.viewport.scroll(-e.x * 3, -e.y * 3)
+                    self.viewport.redraw()
+            elif e.type == pygame.KEYDOWN:
+                if e.key == pygame.K_h:
+                    self.show_heatmap = not self.show_heatmap
+                elif e.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                    self.viewport.zoom(1)
+                    self.viewport.redraw()
+                elif e.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    self.viewport.zoom(-1)
+                    self.viewport.redraw()
+                if self.timeline is not None and not self.test_running:
+                    if e.key == pygame.K_LEFT:
+                        self.seek_timeline(self.timeline_step - 1)
+                    elif e.key == pygame.K_RIGHT:
+                        self.seek_timeline(self.timeline_step + 1)
+                    elif e.key == pygame.K_HOME:
+                        self.seek_timeline(0)
+                    elif e.key == pygame.K_END:
+                        self.seek_timeline(len(self.timeline))
 
     def select_test(self, id):
         self.selected_test = id
+        self.timeline = None
         total_extra_height = 0
         self.tests_header_rects = []
-        self.tests_header_surfaces = []
         for i in range(len(self.level_data["tests"])):
             y = self.control_buttons_height + total_extra_height
             self.tests_header_rects.append(pygame.Rect(5, y, self.tests_width-10, self.test_header_height))
-            self.tests_header_surfaces.append(self.screen_surface.subsurface(self.tests_header_rects[-1]))
             y += self.test_header_height + 4
             total_extra_height += self.test_header_height + 4
             if i == self.selected_test:
                 self.tests_surface_pos = (20, y)
                 total_extra_height += self.actual_tests_height + 4
 
-        draw_test_on_surface(self.tests_surface, self.level_data["tests"][self.selected_test]["shown"], self.level_data["spawn"], "right")
+        self.viewport.follow(self.level_data["spawn"]["x"], self.level_data["spawn"]["y"])
+        draw_test_on_surface(self.viewport, grid_info.grid_to_array(self.level_data["tests"][self.selected_test]["shown"]), self.level_data["spawn"], "right")
 
 def main():
-    game = AlgorNX(sys.argv[1])
+    game = AlgorNX(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
     game.mainloop()
 
 if __name__ == "__main__":
@@ -11,7 +11,7 @@ class EditorMenu():
         sub_menus_surfaces = (pygame.Surface((108, EDITOR_BUTTONS_SIZE//2)) for i in range(len(sub_menus)))
         self.sub_menus = []
         for sub_menu_surface, sub_menu_text in zip(sub_menus_surfaces, sub_menus):
-            text = images.font.render(sub_menu_text, False, (255,255,255))
+            text = images.render_text(sub_menu_text, (255,255,255))
             sub_menu_surface.fill(color)
             sub_menu_surface.blit(text, ((sub_menu_surface.get_width() - text.get_width())//2, (sub_menu_surface.get_height() - text.get_height())//2))
             self.sub_menus.append(sub_menu_surface)
@@ -124,13 +124,24 @@ class Editor():
 
         self.block_in_hand = None
 
+        # The menus are kept drawn on their own surface, drawn again when another menu opens
+        self.layer = pygame.Surface(surface.get_size())
+        self.layer_menu = None
+
     def draw(self):
+        """Blits the editor on its surface, returns True when it changed since the last call."""
         start = self.scroll_y // BLOCK_HEIGHT
         y = self.scroll_y
 
-        self.surface.blits(self.buttons_with_pos, False)
-        if self.selected_menu >= 0:
-            self.surface.blits(self.sub_menus_with_pos[self.selected_menu], False)
+        changed = self.layer_menu != self.selected_menu
+        if changed:
+            self.layer_menu = self.selected_menu
+            self.layer.fill(images.clear_color)
+            self.layer.blits(self.buttons_with_pos, False)
+            if self.selected_menu >= 0:
+                self.layer.blits(self.sub_menus_with_pos[self.selected_menu], False)
+        self.surface.blit(self.layer, (0, 0))
+        return changed
 
     def handle_mouse_click(self, pos):
         off = self.surface.get_offset()[0]
@@ -0,0 +1,303 @@
+import os, sys
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # No window, also on servers without a display
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from json import load, dump, dumps
+import argparse
+import hashlib
+import struct
+import time
+import pygame
+import grid_info
+import AlgorNX_runner as runner
+import AlgorNX
+images = AlgorNX.images
+
+# Exports are written in <output>/<level folder name>/:
+#     test1_shown.png, test1_wanted.png   thumbnails of every test
+#     test1.gif (or test1_frames/step000000.png, ...)   the run of the level's program on every test
+#     export.json   what was exported and from what, so unchanged levels are skipped
+# Run from the game folder, like the game itself, which finds its images relative to it.
+
+EXPORT_VERSION = 1
+EXPORT_MAX_SIZE = 1024  # Pixels, bigger grids are drawn with smaller squares
+DEFAULT_DELAY = 5  # Hundredths of a second per frame
+END_DELAY = 200  # The last frame of a GIF stays longer before it loops
+MISMATCH_COLOR = (255, 60, 60)
+
+GIF_MAX_CODES = 4096
+
+def lzw_encode(indices, min_code_size):
+    """GIF flavoured LZW of a sequence of palette indices, as bytes packed from the least significant bit."""
+    clear_code = 1 << min_code_size
+    end_code = clear_code + 1
+    bits = 0
+    bits_count = 0
+    out = bytearray()
+
+    def emit(code, code_size):
+        nonlocal bits, bits_count
+        bits |= code << bits_count
+        bits_count += code_size
+        while bits_count >= 8:
+            out.append(bits & 0xff)
+            bits >>= 8
+            bits_count -= 8
+
+    codes = {}
+    code_size = min_code_size + 1
+    next_code = end_code + 1
+    emit(clear_code, code_size)
+    prefix = indices[0]
+    for index in indices[1:]:
+        key = prefix << 8 | index
+        code = codes.get(key)
+        if code is not None:
+            prefix = code
+            continue
+
+        emit(prefix, code_size)
+        if next_code < GIF_MAX_CODES:
+            codes[key] = next_code
+            next_code += 1
+            # Decoders add each code one step later, so the size grows once the table is past the limit
+            if next_code > 1 << code_size and code_size < 12:
+                code_size += 1
+        else:
+            emit(clear_code, code_size)
+            codes = {}
+            code_size = min_code_size + 1
+            next_code = end_code + 1
+        prefix = index
+    emit(prefix, code_size)
+    emit(end_code, code_size)
+    if bits_count:
+        out.append(bits & 0xff)
+    return bytes(out)
+
+class GifWriter():
+    """Animated GIF written to disk frame by frame.
+
+    Each frame only holds the rect that changed since the previous one, drawn over it. Frames are
+    written one frame late, so that frames without any change make the previous one last longer.
+    """
+    def __init__(self, path, size, palette):
+        self.file = open(path, "wb")
+        self.min_code_size = max(2, (len(palette) - 1).bit_length())
+        palette = list(palette) + [(0, 0, 0)] * ((1 << self.min_code_size) - len(palette))
+        self.file.write(b"GIF89a")
+        self.file.write(struct.pack("<HHBBB", size[0], size[1], 0x80 | 0x70 | (self.min_code_size - 1), 0, 0))
+        self.file.write(b"".join(bytes(color[:3]) for color in palette))
+        self.file.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")  # Loops forever
+        self.pending = None
+        self.frames = 0
+
+    def add_frame(self, surface, rect, delay):
+        """Adds the rect of an 8 bit surface as the next frame, or makes the previous frame longer if rect is None."""
+        if rect is None:
+            if self.pending is not None:
+                self.pending[1] += delay
+            return
+        self.flush()
+        self.pending = [(rect, pygame.image.tobytes(surface.subsurface(rect), "P")), delay]
+
+    def flush(self):
+        if self.pending is None:
+            return
+        (rect, indices), delay = self.pending
+        self.pending = None
+        self.frames += 1
+        self.file.write(struct.pack("<BBBBHBB", 0x21, 0xf9, 4, 1 << 2, min(delay, 0xffff), 0, 0))
+        self.file.write(struct.pack("<BHHHHB", 0x2c, rect.x, rect.y, rect.width, rect.height, 0))
+        self.file.write(bytes((self.min_code_size,)))
+        data = lzw_encode(indices, self.min_code_size)
+        for i in range(0, len(data), 255):
+            self.file.write(bytes((len(data[i:i+255]),)) + data[i:i+255])
+        self.file.write(b"\x00")
+
+    def close(self, end_delay=0):
+        if self.pending is not None:
+            self.pending[1] += end_delay
+        self.flush()
+        self.file.write(b"\x3b")
+        self.file.close()
+
+class PngWriter():
+    """Frame sequence, one PNG per frame named after the step it shows."""
+    def __init__(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        for filename in os.listdir(folder):
+            if filename.endswith(".png"):
+                os.remove(os.path.join(folder, filename))
+        self.folder = folder
+        self.frames = 0
+
+    def add_frame(self, surface, rect, step):
+        if rect is not None:
+            self.frames += 1
+            pygame.image.save(surface, os.path.join(self.folder, "step{:06}.png".format(step)))
+
+    def close(self):
+        pass
+
+def get_export_palette():
+    # Every color the viewport can draw: the tiles and robot, the background, the texts and the mismatches
+    palette = []
+    for color in [tuple(color)[:3] for color in images.atlas.get_palette()] + [images.clear_color, (0, 0, 0), MISMATCH_COLOR]:
+        if color not in palette:
+            palette.append(color)
+    return palette
+
+def make_viewport(level_data, palette):
+    width, height = level_data["size"]["width"], level_data["size"]["height"]
+    cell_size = max(AlgorNX.Viewport.MIN_CELL_SIZE, min(grid_info.IMAGE_SIZE, (EXPORT_MAX_SIZE - grid_info.IMAGE_SIZE) // max(width, height)))
+    surface = pygame.Surface((grid_info.IMAGE_SIZE + width * cell_size, grid_info.IMAGE_SIZE + height * cell_size), 0, 8)
+    surface.set_palette(palette)
+    viewport = AlgorNX.Viewport(surface, width, height)
+    viewport.cell_size = cell_size
+    return viewport
+
+def export_thumbnails(level_data, folder, palette):
+    filenames = []
+    viewport = make_viewport(level_data, palette)
+    for i, test in enumerate(level_data["tests"]):
+        viewport.draw(grid_info.grid_to_array(test["shown"]), level_data["spawn"], "right")
+        filenames.append("test{}_shown.png".format(i+1))
+        pygame.image.save(viewport.surface, os.path.join(folder, filenames[-1]))
+        viewport.draw(grid_info.grid_to_array(test["wanted"]), None, None)
+        filenames.append("test{}_wanted.png".format(i+1))
+        pygame.image.save(viewport.surface, os.path.join(folder, filenames[-1]))
+    return filenames
+
+def get_bounding_rect(rects):
+    if not rects:
+        return None
+    return rects[0].unionall(rects[1:])
+
+def export_run(level_data, test_id, program_source, folder, palette, frames_format="gif", every=1, delay=DEFAULT_DELAY, limits=None):
+    """Runs the program on a test, writing a frame every `every` steps as they are drawn."""
+    viewport = make_viewport(level_data, palette)
+    surface_rect = viewport.surface.get_rect()
+    if frames_format == "gif":
+        filename = "test{}.gif".format(test_id+1)
+        writer = GifWriter(os.path.join(folder, filename), viewport.surface.get_size(), palette)
+    else:
+        filename = "test{}_frames".format(test_id+1)
+        writer = PngWriter(os.path.join(folder, filename))
+
+    result = {"test": test_id, "outcome": "error", "steps": 0, "error": None, "output": filename}
+    program_runner = None
+    try:
+        program_runner = runner.validate_and_start_program(program_source, level_data, test_id, limits=runner.get_limits(level_data, limits))
+        program_runner.draw_changes(AlgorNX.draw_test_changes_on_surface, viewport)
+        writer.add_frame(viewport.surface, surface_rect, delay if frames_format == "gif" else 0)
+        with runner.TimeWatchdog(program_runner):
+            while not program_runner.program_done:
+                program_runner.update()
+                if program_runner.lines_executed % every == 0 or program_runner.program_done:
+                    viewport.follow(program_runner.robot.x, program_runner.robot.y)
+                    rect = get_bounding_rect(program_runner.draw_changes(AlgorNX.draw_test_changes_on_surface, viewport))
+                    writer.add_frame(viewport.surface, rect, delay if frames_format == "gif" else program_runner.lines_executed)
+        result["outcome"] = "passed" if program_runner.is_success() else "failed"
+        if result["outcome"] == "failed":
+            viewport.draw_mismatches(program_runner.get_mismatches(), MISMATCH_COLOR)
+            writer.add_frame(viewport.surface, surface_rect, delay if frames_format == "gif" else program_runner.lines_executed)
+    except runner.LimitExceeded as e:
+        result["outcome"] = "limit_exceeded"
+        result["error"] = str(e)
+    except Exception as e:
+        result["error"] = str(e)
+    finally:
+        if program_runner:
+            program_runner.stop()
+            result["steps"] = program_runner.lines_executed
+        if frames_format == "gif":
+            writer.close(END_DELAY)
+        else:
+            writer.close()
+    result["frames"] = writer.frames
+    return result
+
+def get_export_key(level_data, program_source, options):
+    key = hashlib.sha256(dumps(level_data, sort_keys=True).encode())
+    key.update((program_source or "").encode())
+    key.update(dumps(dict(options, version=EXPORT_VERSION), sort_keys=True).encode())
+    return key.hexdigest()
+
+def load_program_file(level_folder, program_filename):
+    try:
+        with open(os.path.join(level_folder, program_filename)) as f:
+            return f.read()
+    except OSError:
+        return None
+
+def export_level(level_folder, output_folder, options, force=False):
+    start = time.perf_counter()
+    level_data = runner.load_level(level_folder)
+    program_source = load_program_file(level_folder, options["program"])
+    folder = os.path.join(output_folder, os.path.basename(os.path.normpath(level_folder)))
+    info_path = os.path.join(folder, "export.json")
+    key = get_export_key(level_data, program_source, options)
+
+    report = {"level": level_folder, "output": folder, "skipped": False}
+    if not force:
+        try:
+            with open(info_path) as f:
+                info = load(f)
+            if info["key"] == key and all(os.path.exists(os.path.join(folder, filename)) for filename in info["files"]):
+                report["skipped"] = True
+                return report
+        except (OSError, ValueError, KeyError):
+            pass
+
+    os.makedirs(folder, exist_ok=True)
+    palette = get_export_palette()
+    files = export_thumbnails(level_data, folder, palette)
+    runs = []
+    if program_source is not None:
+        for i in range(len(level_data["tests"])):
+            runs.append(export_run(level_data, i, program_source, folder, palette, options["format"], options["every"], options["delay"], options["limits"]))
+            files.append(runs[-1]["output"])
+    with open(info_path, "w") as f:
+        dump({"key": key, "files": files, "runs": runs}, f, indent=4)
+
+    report["runs"] = runs
+    report["time"] = time.perf_counter() - start
+    return report
+
+def export_level_safely(level_folder, output_folder, options, force):
+    try:
+        return export_level(level_folder, output_folder, options, force)
+    except Exception as e:
+        return {"level": level_folder, "error": str(e)}
+
+def export_command(args):
+    options = {"program": args.program, "format": args.format, "every": args.every, "delay": args.delay, "limits": runner.limits_from_args(args)}
+    failed = False
+    with ProcessPoolExecutor(args.workers) as executor:
+        futures = [executor.submit(export_level_safely, level_folder, args.output, options, args.force) for level_folder in args.level_folders]
+        for future in as_completed(futures):
+            report = future.result()
+            failed = failed or "error" in report
+            print(dumps(report), flush=True)
+    return 1 if failed else 0
+
+def main():
+    parser = argparse.ArgumentParser(prog="AlgorNX_export", description="Export thumbnails of the tests of levels and animations of their program, without a window")
+    parser.add_argument("level_folders", nargs="+")
+    parser.add_argument("--output", default="export", help="folder where each level gets a folder of exports (default: export)")
+    parser.add_argument("--program", default="program.py", help="program of the level folders to animate (default: program.py)")
+    parser.add_argument("--format", choices=("gif", "png"), default="gif", help="animated GIF, or a folder of PNG frames")
+    parser.add_argument("--every", type=int, default=1, help="steps between two frames")
+    parser.add_argument("--delay", type=int, default=DEFAULT_DELAY, help="GIF frame duration, in hundredths of a second")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="export levels again even if nothing changed")
+    runner.add_limit_arguments(parser, sandbox=False)
+    parser.set_defaults(handler=export_command)
+
+    args = parser.parse_args()
+    sys.exit(args.handler(args))
+
+if __name__ == "__main__":
+    main()
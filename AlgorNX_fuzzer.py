@@ -0,0 +1,223 @@
+import os, sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from json import load, dump, dumps
+import argparse
+import hashlib
+import random
+import time
+import grid_info
+import AlgorNX_runner as runner
+
+# A level opts in with a "generator" entry in level.json:
+#     "generator": {
+#         "reference": "reference.py",  # solution in the level folder, run to make each variant's wanted grid
+#         "rules": [
+#             {"where": [0], "place": [2], "probability": 0.5, "rows": [0, 0]},
+#             {"where": [0], "place": [256], "numbers": [0, 99], "probability": 0.1, "columns": [2, 7]}
+#         ]
+#     }
+# Each rule goes over the squares of a hand drawn "shown" grid (within "rows" and "columns", both inclusive, if given)
+# and replaces those whose type is in "where" by one of "place", with the given probability. Placing NUMBER
+# writes a random number from the "numbers" range.
+
+DEFAULT_VARIANTS = 1000
+CHUNKS_PER_WORKER = 4
+
+def get_generator(level_data):
+    generator = level_data.get("generator")
+    if not generator or not generator.get("rules"):
+        raise Exception("The level has no generator rules")
+    return generator
+
+def load_reference(level_folder, level_data):
+    with open(os.path.join(level_folder, get_generator(level_data)["reference"])) as f:
+        return f.read()
+
+def apply_rules(grid, rules, rng):
+    height, width = len(grid), len(grid[0])
+    for rule in rules:
+        where = set(rule.get("where", [grid_info.EMPTY]))
+        first_row, last_row = rule.get("rows", [0, height-1])
+        first_column, last_column = rule.get("columns", [0, width-1])
+        probability = rule.get("probability", 0.5)
+        for y in range(max(first_row, 0), min(last_row, height-1) + 1):
+            line = grid[y]
+            for x in range(max(first_column, 0), min(last_column, width-1) + 1):
+                if line[x] in where and rng.random() < probability:
+                    square_type = rng.choice(rule["place"])
+                    if square_type == grid_info.NUMBER:
+                        square_type = grid_info.square_number_set(rng.randint(*rule.get("numbers", [0, 9])))
+                    line[x] = square_type
+    return grid
+
+def generate_variant(level_data, reference_source, seed, index, limits=None):
+    # Each variant only depends on the seed and its index, so chunks can be generated anywhere in any order
+    rng = random.Random("{}-{}".format(seed, index))
+    tests = level_data["tests"]
+    shown = [line[:] for line in tests[index % len(tests)]["shown"]]
+    apply_rules(shown, get_generator(level_data)["rules"], rng)
+
+    program_runners = []
+    reference_level = dict(level_data, tests=[{"shown": shown, "wanted": shown}])
+    result = runner.run_test(reference_level, 0, reference_source, limits, on_start=program_runners.append)
+    if result["outcome"] not in ("passed", "failed"):
+        return None  # The rules made a grid the reference can't solve, or can't solve within the limits
+    wanted = grid_info.array_to_grid(program_runners[0].grid, level_data["size"]["width"])
+    return {"shown": shown, "wanted": wanted}
+
+def generate_chunk(level_data, reference_source, seed, indices, limits=None):
+    return [generate_variant(level_data, reference_source, seed, index, limits) for index in indices]
+
+def get_variants_key(level_data, reference_source, count, seed, limits=None):
+    key = hashlib.sha256(dumps(level_data, sort_keys=True).encode())
+    key.update(reference_source.encode())
+    key.update("{}-{}".format(count, seed).encode())
+    key.update(dumps(runner.get_limits(level_data, limits), sort_keys=True).encode())
+    return key.hexdigest()
+
+def split_chunks(count, workers):
+    chunks = min(count, workers * CHUNKS_PER_WORKER) or 1
+    return [range(i, count, chunks) for i in range(chunks)]
+
+def generate_variants(level_data, reference_source, count=DEFAULT_VARIANTS, seed=0, max_workers=None, limits=None):
+    """Makes `count` random variants of the level's tests, dropping duplicates and grids the reference fails on."""
+    workers = max_workers or os.cpu_count()
+    variants = [None] * count
+    with ProcessPoolExecutor(workers) as executor:
+        futures = {executor.submit(generate_chunk, level_data, reference_source, seed, indices, limits): indices for indices in split_chunks(count, workers)}
+        for future, indices in futures.items():
+            for index, variant in zip(indices, future.result()):
+                variants[index] = variant
+
+    tests = []
+    seen = set()
+    for variant in variants:
+        if variant is None:
+            continue
+        key = tuple(tuple(line) for line in variant["shown"])
+        if key not in seen:
+            seen.add(key)
+            tests.append(variant)
+    return tests
+
+def load_or_generate_variants(level_data, reference_source, count, seed, max_workers=None, path=None, limits=None):
+    key = get_variants_key(level_data, reference_source, count, seed, limits)
+    if path:
+        try:
+            with open(path) as f:
+                saved = load(f)
+            if saved.get("key") == key:
+                return saved["tests"]
+        except (OSError, ValueError):
+            pass
+
+    tests = generate_variants(level_data, reference_source, count, seed, max_workers, limits)
+    if path:
+        with open(path, "w") as f:
+            dump({"key": key, "tests": tests}, f)
+    return tests
+
+def check_chunk(level_data, tests, indices, program_source, limits):
+    grade = runner.grade_program(dict(level_data, tests=tests), program_source, limits)
+    for index, result in zip(indices, grade["tests"]):
+        result["test"] = index
+    return grade
+
+def check_chunk_in_sandbox(sandbox_pool, level_data, tests, indices, program_source, limits):
+    grade = sandbox_pool.grade_program(dict(level_data, tests=tests), program_source, limits)
+    for index, result in zip(indices, grade["tests"]):
+        result["test"] = index
+    return grade
+
+def check_variants(level_data, tests, program_source, limits=None, max_workers=None, sandbox=None):
+    """Runs the program on every variant in parallel. Results keep only the variants that didn't pass."""
+    start = time.perf_counter()
+    if sandbox:
+        executor = ThreadPoolExecutor(sandbox.size)
+        workers = sandbox.size
+    else:
+        workers = max_workers or os.cpu_count()
+        executor = ProcessPoolExecutor(workers)
+
+    futures = []
+    with executor:
+        for indices in split_chunks(len(tests), workers):
+            chunk = [tests[i] for i in indices]
+            if sandbox:
+                futures.append(executor.submit(check_chunk_in_sandbox, sandbox, level_data, chunk, list(indices), program_source, limits))
+            else:
+                futures.append(executor.submit(check_chunk, level_data, chunk, list(indices), program_source, limits))
+        grades = [future.result() for future in futures]
+
+    failures = sorted((result for grade in grades for result in grade["tests"] if not result["passed"]), key=lambda result: result["test"])
+    return {
+        "passed": not failures,
+        "variants": len(tests),
+        "failed": len(failures),
+        "steps": sum(grade["steps"] for grade in grades),
+        "time": time.perf_counter() - start,
+        "failures": failures,
+    }
+
+def generate_command(args):
+    level_data = runner.load_level(args.level_folder)
+    reference_source = load_reference(args.level_folder, level_data)
+    start = time.perf_counter()
+    tests = load_or_generate_variants(level_data, reference_source, args.count, args.seed, args.workers, args.variants, runner.limits_from_args(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            dump(dict(level_data, tests=tests), f, indent=1)
+    print(dumps({"variants": len(tests), "dropped": args.count - len(tests), "time": time.perf_counter() - start}))
+    return 0
+
+def check_command(args):
+    level_data = runner.load_level(args.level_folder)
+    reference_source = load_reference(args.level_folder, level_data)
+    with open(args.program) as f:
+        program_source = f.read()
+
+    limits = runner.limits_from_args(args)
+    tests = load_or_generate_variants(level_data, reference_source, args.count, args.seed, args.workers, args.variants, limits)
+    sandbox_pool = runner.sandbox_from_args(args, args.workers)
+    if sandbox_pool:
+        with sandbox_pool:
+            report = check_variants(level_data, tests, program_source, limits, args.workers, sandbox_pool)
+    else:
+        report = check_variants(level_data, tests, program_source, limits, args.workers)
+    if args.show_failures is not None:
+        for result in report["failures"][:args.show_failures]:
+            result["shown"] = tests[result["test"]]["shown"]
+    dump(report, sys.stdout, indent=4)
+    print()
+    return 0 if report["passed"] else 1
+
+def add_generator_arguments(parser):
+    parser.add_argument("--count", type=int, default=DEFAULT_VARIANTS, help="number of variants to generate (duplicates are dropped)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generator, the same seed gives the same variants")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--variants", default=None, help="file keeping the generated variants between runs")
+
+def main():
+    parser = argparse.ArgumentParser(prog="AlgorNX_fuzzer", description="Check AlgorNX programs against random variants of a level's tests")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser("generate", help="generate the variants of a level")
+    generate_parser.add_argument("level_folder")
+    generate_parser.add_argument("--output", default=None, help="write a copy of level.json with the variants as its tests")
+    add_generator_arguments(generate_parser)
+    runner.add_limit_arguments(generate_parser, sandbox=False)
+    generate_parser.set_defaults(handler=generate_command)
+
+    check_parser = subparsers.add_parser("check", help="run a program on every variant and print the failures as JSON")
+    check_parser.add_argument("level_folder")
+    check_parser.add_argument("program")
+    check_parser.add_argument("--show-failures", type=int, default=None, help="include the shown grid of the first N failing variants")
+    add_generator_arguments(check_parser)
+    runner.add_limit_arguments(check_parser)
+    check_parser.set_defaults(handler=check_command)
+
+    args = parser.parse_args()
+    sys.exit(args.handler(args))
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,148 @@
 import os
+import hashlib
+from collections import OrderedDict
+from json import load, dump
 import pygame
 
 data_folder = "AlgorNX"
 images_folder = os.path.join(data_folder, "images")
+cache_folder = os.path.join(data_folder, "cache")
 clear_color = (80,80,80)
 font_folder = os.path.join(data_folder, "font")
 font = pygame.font.Font(os.path.join(font_folder, "font.ttf"), 14)
-images = {filename[:-4]: pygame.image.load(os.path.join(images_folder, filename)) for filename in os.listdir(images_folder) if not filename == "robot.gif"}
\ No newline at end of file
+
+# Rendered texts, the least recently used ones are dropped past TEXT_CACHE_SIZE
+TEXT_CACHE_SIZE = 1024
+text_cache = OrderedDict()
+text_cache_hits = 0
+text_cache_misses = 0
+
+def render_text(text, color, antialias=False):
+    """font.render, only rasterizing texts not rendered recently. The surface is shared, don't draw on it."""
+    global text_cache_hits, text_cache_misses
+    key = (text, tuple(color), antialias)
+    surface = text_cache.get(key)
+    if surface is not None:
+        text_cache_hits += 1
+        text_cache.move_to_end(key)
+        return surface
+
+    text_cache_misses += 1
+    surface = font.render(text, antialias, color)
+    text_cache[key] = surface
+    if len(text_cache) > TEXT_CACHE_SIZE:
+        text_cache.popitem(last=False)
+    return surface
+
+# The tiles and the robot are packed in one atlas, cached on disk and built again when one of them changes
+ATLAS_VERSION = 1
+ATLAS_COLUMNS = 8
+ATLAS_COLORKEY = (255, 0, 255)
+atlas_path = os.path.join(cache_folder, "atlas.png")
+atlas_info_path = os.path.join(cache_folder, "atlas.json")
+
+def is_atlas_image(filename):
+    return filename.endswith(".gif") and filename != "robot.gif"
+
+def get_sources_stats(filenames):
+    stats = {}
+    for filename in filenames:
+        stat = os.stat(os.path.join(images_folder, filename))
+        stats[filename] = [stat.st_mtime_ns, stat.st_size]
+    return stats
+
+def get_sources_hashes(filenames):
+    hashes = {}
+    for filename in filenames:
+        with open(os.path.join(images_folder, filename), "rb") as f:
+            hashes[filename] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+def build_atlas(filenames):
+    # The images only use a few colors, so the atlas keeps one shared palette: 8 bit surfaces blit to
+    # the 32 bit display faster than 32 bit ones, which SDL copies with streaming stores when aligned
+    sources = [pygame.image.load(os.path.join(images_folder, filename)) for filename in filenames]
+    # GIF transparency is a palette index, other entries can have the same color, so the transparent
+    # pixels of every image get a color of their own that no image uses
+    masks = [pygame.mask.from_surface(source) for source in sources]
+    colors = []
+    for source, mask in zip(sources, masks):
+        for x in range(source.get_width()):
+            for y in range(source.get_height()):
+                color = tuple(source.get_at((x, y)))[:3]
+                if mask.get_at((x, y)) and color not in colors:
+                    colors.append(color)
+    colorkey = ATLAS_COLORKEY
+    while colorkey in colors:
+        colorkey = (colorkey[0], colorkey[1] + 1, colorkey[2])
+    if len(colors) + 1 > 256:
+        raise Exception("The images use more than 255 colors, too many for the atlas")
+
+    cell_width = max(source.get_width() for source in sources)
+    cell_height = max(source.get_height() for source in sources)
+    atlas = pygame.Surface((cell_width * ATLAS_COLUMNS, cell_height * (-(-len(sources) // ATLAS_COLUMNS))), 0, 8)
+    atlas.set_palette([colorkey] + colors)
+    atlas.fill(colorkey)
+    rects = {}
+    for i, (filename, source, mask) in enumerate(zip(filenames, sources, masks)):
+        left, top = (i % ATLAS_COLUMNS) * cell_width, (i // ATLAS_COLUMNS) * cell_height
+        for x in range(source.get_width()):
+            for y in range(source.get_height()):
+                if mask.get_at((x, y)):
+                    atlas.set_at((left + x, top + y), source.get_at((x, y)))
+        rects[filename[:-4]] = [left, top, source.get_width(), source.get_height(), list(colorkey) if source.get_colorkey() is not None else None]
+    return atlas, rects
+
+def load_atlas():
+    """Returns the atlas surface and the rect and colorkey of each image in it."""
+    filenames = sorted(filename for filename in os.listdir(images_folder) if is_atlas_image(filename))
+    stats = get_sources_stats(filenames)
+    try:
+        with open(atlas_info_path) as f:
+            atlas_info = load(f)
+        if atlas_info["version"] == ATLAS_VERSION and sorted(atlas_info["sources"]) == filenames:
+            if atlas_info["stats"] != stats:
+                # Touched files only make the atlas rebuilt if their content changed
+                if atlas_info["sources"] != get_sources_hashes(filenames):
+                    raise ValueError("The images changed")
+                atlas_info["stats"] = stats
+                save_atlas_info(atlas_info)
+            return pygame.image.load(atlas_path), atlas_info["images"]
+    except (OSError, ValueError, KeyError, pygame.error):
+        pass
+
+    atlas, rects = build_atlas(filenames)
+    try:
+        os.makedirs(cache_folder, exist_ok=True)
+        pygame.image.save(atlas, atlas_path)
+        save_atlas_info({"version": ATLAS_VERSION, "sources": get_sources_hashes(filenames), "stats": stats, "images": rects})
+    except (OSError, pygame.error):
+        pass  # Read-only data folder, the atlas is built again on every start
+    return atlas, rects
+
+def save_atlas_info(atlas_info):
+    with open(atlas_info_path, "w") as f:
+        dump(atlas_info, f)
+
+def get_atlas_images(atlas, rects):
+    # Copies and not subsurfaces, blitting a subsurface locks the whole atlas every time
+    atlas_images = {}
+    for name, (x, y, width, height, colorkey) in rects.items():
+        image = atlas.subsurface((x, y, width, height)).copy()
+        if colorkey is not None:
+            image.set_colorkey(colorkey)
+        atlas_images[name] = image
+    return atlas_images
+
+def convert_images():
+    """Converts the images with per pixel alpha to the display format. Needs the display mode set.
+
+    The atlas keeps its palette, see build_atlas.
+    """
+    for name, image in images.items():
+        if image.get_flags() & pygame.SRCALPHA:
+            images[name] = image.convert_alpha()
+
+atlas, atlas_rects = load_atlas()
+images = get_atlas_images(atlas, atlas_rects)
+images.update({filename[:-4]: pygame.image.load(os.path.join(images_folder, filename)) for filename in os.listdir(images_folder) if not is_atlas_image(filename) and not filename == "robot.gif"})
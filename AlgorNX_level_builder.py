@@ -5,10 +5,14 @@ import tkinter as tk
 from tkinter import messagebox
 from tkinter import filedialog
 from tkinter import ttk
-from json import dump, load
+from json import dump, load, dumps, loads
 from copy import copy
+import threading
+import queue
+import hashlib
 
 import grid_info
+import AlgorNX_solver as solver
 
 default_level_size = {
     "width": 10,
@@ -68,6 +72,10 @@ default_allowed_keywords = {
 editor_version = 0
 max_tests = 8
 
+solvability_max_nodes = 100000  # Search budget per test, the checker has to keep up with edits
+solvability_weight = 4  # Weighted search, only telling solvable tests apart, see AlgorNX_solver.Solver
+solvability_poll_delay = 100  # ms between two looks at the checker results
+
 level_data = None
 
 level_size = None
@@ -175,26 +183,36 @@ def load_level():
         file_to_load = filedialog.askopenfilename(initialdir=os.getcwd(), title="Pick an AlgorNX level to load", filetypes=(("AlgorNX level file", "*.json"),))
         if file_to_load:
             with open(file_to_load) as f:
-                level_data = load(f)
+                loaded_level_data = load(f)
 
-                try:
-                    level_size = level_data["size"]
-                except KeyError:
-                    level_size = copy(default_level_size)
-                    level_data["size"] = level_size
+            size = loaded_level_data.get("size", default_level_size)
+            if size["width"] > grid_info.EDITOR_MAX_SIZE or size["height"] > grid_info.EDITOR_MAX_SIZE:
+                messagebox.showerror("Error", "This level is too big for the editor, at most {0}x{0} squares".format(grid_info.EDITOR_MAX_SIZE))
+                return False
 
-                try:
-                    spawn_coords = level_data["spawn"]
-                except KeyError:
-                    spawn_coords = copy(default_spawn_coords)
-                    level_data["spawn"] = spawn_coords
+            level_data = loaded_level_data
 
-                try:
-                    tests = level_data["tests"]
-                except KeyError:
-                    tests = copy(default_tests)
-                    level_data["tests"] = tests
-                    add_test()
+            try:
+                level_size = level_data["size"]
+            except KeyError:
+                level_size = copy(default_level_size)
+                level_data["size"] = level_size
+
+            try:
+                spawn_coords = level_data["spawn"]
+            except KeyError:
+                spawn_coords = copy(default_spawn_coords)
+                level_data["spawn"] = spawn_coords
+
+            try:
+                tests = level_data["tests"]
+            except KeyError:
+                tests = copy(default_tests)
+                level_data["tests"] = tests
+                add_test()
+            for test in tests:
+                test["shown"] = grid_info.decode_grid(test["shown"], level_size["width"])
+                test["wanted"] = grid_info.decode_grid(test["wanted"], level_size["width"])
 
             saved = True
             return True  # Loaded
@@ -243,6 +261,12 @@ class Application():
             for i in range(tests_in_listbox, tests_amount):
                 self.tests_listbox.insert(i, "Test {}".format(i+1))
 
+        for i in range(min(tests_in_listbox, tests_amount), max(tests_in_listbox, tests_amount)):
+            self.solvability_keys.pop(i, None)  # New or removed lines have no badge
+        if complete_load:
+            self.solvability_keys = {}
+        self.check_solvability()
+
         if tests_amount == max_tests:
             self.edit_menu.entryconfig("Add test", state="disabled")
         else:
@@ -266,6 +290,80 @@ class Application():
             self.editor_canvas_set_grid_contents("wanted")
             saved = True
 
+    def init_solvability_checker(self):
+        self.solvability_cache = {}  # Content hash: check result
+        self.solvability_keys = {}  # Test id: content hash of the test as last sent to the checker
+        self.solvability_requests = queue.Queue()
+        self.solvability_results = queue.Queue()
+        threading.Thread(target=self.solvability_worker, daemon=True).start()
+        self.root.after(solvability_poll_delay, self.poll_solvability)
+
+    def solvability_worker(self):
+        # Runs off the Tk thread and only talks to it through the two queues
+        while True:
+            test_id, key, test_level = self.solvability_requests.get()
+            requests = {test_id: (key, test_level)}
+            while True:
+                try:
+                    test_id, key, test_level = self.solvability_requests.get_nowait()
+                    requests[test_id] = (key, test_level)  # Only the last edit of each test matters
+                except queue.Empty:
+                    break
+
+            for test_id, (key, test_level) in requests.items():
+                result = self.solvability_cache.get(key)
+                if result is None:
+                    result = solver.check_test(test_level, 0, solvability_max_nodes, solvability_weight)
+                self.solvability_results.put((test_id, key, result))
+
+    def get_test_key(self, test_id):
+        test_json = dumps({
+            "size": level_size,
+            "spawn": spawn_coords,
+            "allowed_functions": level_data["allowed_functions"],
+            "tests": [tests[test_id]],
+        }, sort_keys=True)
+        return hashlib.sha256(test_json.encode()).hexdigest(), test_json
+
+    def check_solvability(self, test_ids=None):
+        for test_id in range(len(tests)) if test_ids is None else test_ids:
+            key, test_json = self.get_test_key(test_id)
+            if self.solvability_keys.get(test_id) == key:
+                continue
+            self.solvability_keys[test_id] = key
+            result = self.solvability_cache.get(key)
+            self.set_test_badge(test_id, result)
+            if result is None:
+                self.solvability_requests.put((test_id, key, loads(test_json)))  # A copy the editor can't change under the checker
+
+    def poll_solvability(self):
+        while True:
+            try:
+                test_id, key, result = self.solvability_results.get_nowait()
+            except queue.Empty:
+                break
+            self.solvability_cache[key] = result
+            if test_id < len(tests) and self.solvability_keys.get(test_id) == key:
+                self.set_test_badge(test_id, result)
+        self.root.after(solvability_poll_delay, self.poll_solvability)
+
+    def set_test_badge(self, test_id, result):
+        if result is None:
+            badge, color = "checking...", "gray"
+        elif result["solvable"]:
+            badge, color = "solvable in at most {} actions".format(result["actions"]), "dark green"
+        elif result["solvable"] is None:
+            badge, color = "too big to check", "dark orange"
+        else:
+            badge, color = result.get("problem", "unsolvable"), "red"
+
+        selected = test_id in self.tests_listbox.curselection()
+        self.tests_listbox.delete(test_id)
+        self.tests_listbox.insert(test_id, "Test {}: {}".format(test_id+1, badge))
+        self.tests_listbox.itemconfig(test_id, foreground=color)
+        if selected:
+            self.tests_listbox.select_set(test_id)
+
     def update_size_labels(self):
         self.width_label["text"] = str(level_size["width"])
         self.height_label["text"] = str(level_size["height"])
@@ -287,12 +385,12 @@ class Application():
 
         width_var = tk.StringVar()
         width_var.set(str(level_size["width"]))
-        width_spinbox = tk.Spinbox(win, from_=2, to=grid_info.LEVEL_MAX_SIZE, textvariable=width_var, justify=tk.RIGHT)
+        width_spinbox = tk.Spinbox(win, from_=2, to=grid_info.EDITOR_MAX_SIZE, textvariable=width_var, justify=tk.RIGHT)
         width_spinbox.grid(row=0, column=1, sticky="W")
 
         height_var = tk.StringVar()
         height_var.set(str(level_size["height"]))
-        height_spinbox = tk.Spinbox(win, from_=2, to=grid_info.LEVEL_MAX_SIZE, textvariable=height_var, justify=tk.RIGHT)
+        height_spinbox = tk.Spinbox(win, from_=2, to=grid_info.EDITOR_MAX_SIZE, textvariable=height_var, justify=tk.RIGHT)
         height_spinbox.grid(row=1, column=1, sticky="W")
 
         def edit_level_size_internal():
@@ -318,6 +416,7 @@ class Application():
             self.editor_canvas_set_grid_size("wanted")
             self.editor_canvas_set_grid_contents("shown")
             self.editor_canvas_set_grid_contents("wanted")
+            self.check_solvability()
 
             saved = False
             win.destroy()
@@ -359,6 +458,7 @@ class Application():
             spawn_coords["y"] = int(y_var.get())
 
             self.update_spawn_label()
+            self.check_solvability()
             saved = False
             win.destroy()
 
@@ -406,6 +506,7 @@ class Application():
     def allow_function(self, *args):
         global saved
         level_data["allowed_functions"][str(self.selected_function.get())] = bool(self.function_allow_var.get())
+        self.check_solvability()
         saved = False
 
     def allow_all_functions(self):
@@ -413,6 +514,7 @@ class Application():
         global level_data
         level_data["allowed_functions"] = {k: True for k in level_data["allowed_functions"]}
         self.function_allow_var.set(True)
+        self.check_solvability()
         saved = False
 
     def disable_all_functions(self):
@@ -420,6 +522,7 @@ class Application():
         global level_data
         level_data["allowed_functions"] = {k: False for k in level_data["allowed_functions"]}
         self.function_allow_var.set(False)
+        self.check_solvability()
         saved = False
 
     def select_keyword(self, *args):
@@ -586,7 +689,7 @@ class Application():
         self.tests_frame = tk.LabelFrame(self.editor_panel_frame, text="Tests")
         self.tests_frame.grid(row=1,column=0,sticky="NWSE")
 
-        self.tests_listbox = tk.Listbox(self.tests_frame, selectmode=tk.SINGLE, height=max_tests, exportselection=False)
+        self.tests_listbox = tk.Listbox(self.tests_frame, selectmode=tk.SINGLE, height=max_tests, width=40, exportselection=False)
         self.tests_scrollbar = tk.Scrollbar(self.tests_frame)
 
         self.tests_listbox.bind("<<ListboxSelect>>", self.level_editor_select)
@@ -676,8 +779,8 @@ class Application():
         else:
             raise Exception("Invalid grid type")
 
-        for y in range(grid_info.LEVEL_MAX_SIZE):
-            for x in range(grid_info.LEVEL_MAX_SIZE):
+        for y in range(grid_info.EDITOR_MAX_SIZE):
+            for x in range(grid_info.EDITOR_MAX_SIZE):
                 image_type = "grid_empty"
                 if y >= level_size["height"] or x >= level_size["width"]:
                     image_type = "grid_painted"
@@ -752,6 +855,7 @@ class Application():
             canvas.itemconfig(images[x][y], image=image)
             tests[self.selected_test][grid_type][y][x] = square_type
             canvas.itemconfig(text[x][y], text=number)
+            self.check_solvability([self.selected_test])
             
             saved = False
 
@@ -768,13 +872,13 @@ class Application():
         self.editor_shown_frame = tk.Frame(self.editor_notebook)
         self.editor_notebook.add(self.editor_shown_frame, text="Shown")
 
-        self.editor_shown_canvas = tk.Canvas(self.editor_shown_frame, width=grid_info.IMAGE_SIZE*(grid_info.LEVEL_MAX_SIZE+1), height=grid_info.IMAGE_SIZE*(grid_info.LEVEL_MAX_SIZE+1))
-        self.editor_shown_canvas_images = [[None]*grid_info.LEVEL_MAX_SIZE for i in range(grid_info.LEVEL_MAX_SIZE)]
-        self.editor_shown_canvas_text = [[None]*grid_info.LEVEL_MAX_SIZE for i in range(grid_info.LEVEL_MAX_SIZE)]
-        for y in range(grid_info.LEVEL_MAX_SIZE):
+        self.editor_shown_canvas = tk.Canvas(self.editor_shown_frame, width=grid_info.IMAGE_SIZE*(grid_info.EDITOR_MAX_SIZE+1), height=grid_info.IMAGE_SIZE*(grid_info.EDITOR_MAX_SIZE+1))
+        self.editor_shown_canvas_images = [[None]*grid_info.EDITOR_MAX_SIZE for i in range(grid_info.EDITOR_MAX_SIZE)]
+        self.editor_shown_canvas_text = [[None]*grid_info.EDITOR_MAX_SIZE for i in range(grid_info.EDITOR_MAX_SIZE)]
+        for y in range(grid_info.EDITOR_MAX_SIZE):
             self.editor_shown_canvas.create_text(grid_info.IMAGE_SIZE//2, (y+1)*grid_info.IMAGE_SIZE + grid_info.IMAGE_SIZE//2, font=("Helvetica ", 10), text=str(y+1), justify="center")
             self.editor_shown_canvas.create_text((y+1)*grid_info.IMAGE_SIZE + grid_info.IMAGE_SIZE//2, grid_info.IMAGE_SIZE//2, font=("Helvetica ", 10), text=str(y+1), justify="center")
-            for x in range(grid_info.LEVEL_MAX_SIZE):
+            for x in range(grid_info.EDITOR_MAX_SIZE):
                 image_type = grid_info.get_image_from_type(grid_info.EMPTY)
                 if y >= level_size["height"] or x >= level_size["width"]:
                     image_type = grid_info.get_image_from_type(grid_info.PAINTED)
@@ -787,13 +891,13 @@ class Application():
         self.editor_wanted_frame = tk.Frame(self.editor_notebook)
         self.editor_notebook.add(self.editor_wanted_frame, text="Wanted")
 
-        self.editor_wanted_canvas = tk.Canvas(self.editor_wanted_frame, width=grid_info.IMAGE_SIZE*(grid_info.LEVEL_MAX_SIZE+1), height=grid_info.IMAGE_SIZE*(grid_info.LEVEL_MAX_SIZE+1))
-        self.editor_wanted_canvas_images = [[None]*grid_info.LEVEL_MAX_SIZE for i in range(grid_info.LEVEL_MAX_SIZE)]
-        self.editor_wanted_canvas_text = [[None]*grid_info.LEVEL_MAX_SIZE for i in range(grid_info.LEVEL_MAX_SIZE)]
-        for y in range(grid_info.LEVEL_MAX_SIZE):
+        self.editor_wanted_canvas = tk.Canvas(self.editor_wanted_frame, width=grid_info.IMAGE_SIZE*(grid_info.EDITOR_MAX_SIZE+1), height=grid_info.IMAGE_SIZE*(grid_info.EDITOR_MAX_SIZE+1))
+        self.editor_wanted_canvas_images = [[None]*grid_info.EDITOR_MAX_SIZE for i in range(grid_info.EDITOR_MAX_SIZE)]
+        self.editor_wanted_canvas_text = [[None]*grid_info.EDITOR_MAX_SIZE for i in range(grid_info.EDITOR_MAX_SIZE)]
+        for y in range(grid_info.EDITOR_MAX_SIZE):
             self.editor_wanted_canvas.create_text(grid_info.IMAGE_SIZE//2, (y+1)*grid_info.IMAGE_SIZE + grid_info.IMAGE_SIZE//2, font=("Helvetica ", 10), text=str(y+1), justify="center")
             self.editor_wanted_canvas.create_text((y+1)*grid_info.IMAGE_SIZE + grid_info.IMAGE_SIZE//2, grid_info.IMAGE_SIZE//2, font=("Helvetica ", 10), text=str(y+1), justify="center")
-            for x in range(grid_info.LEVEL_MAX_SIZE):
+            for x in range(grid_info.EDITOR_MAX_SIZE):
                 image_type = "grid_empty"
                 if y >= level_size["height"] or x >= level_size["width"]:
                     image_type = "grid_painted"
@@ -825,6 +929,7 @@ class Application():
     def __init__(self, root):   
         self.root = root
 
+        self.init_solvability_checker()
         self.init_menus()
         self.init_frames()
 
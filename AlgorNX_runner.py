@@ -1,9 +1,25 @@
-import sys
+import os, sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from array import array
 from copy import deepcopy
+from json import load, dump, dumps
+import argparse
 import ast
-import bdb
+import bisect
+import functools
+import hashlib
+import inspect
+import marshal
+import signal
 import threading
+import zlib
+import time
 import grid_info
+try:
+    import ctypes
+except ImportError:  # Not on every Python, TimeWatchdog uses a trace function instead
+    ctypes = None
 
 class ProgramValidator(ast.NodeVisitor):
     def visit_Import(self, node):
@@ -15,62 +31,86 @@ class ProgramValidator(ast.NodeVisitor):
     def visit_Not(self, node):
         if not self.allowed_not:
             raise Exception("Disabled keywords: not")
+        self.generic_visit(node)
 
     def visit_Or(self, node):
         if not self.allowed_or:
             raise Exception("Disabled keywords: or")
+        self.generic_visit(node)
 
     def visit_And(self, node):
         if not self.allowed_and:
             raise Exception("Disabled keywords: and")
+        self.generic_visit(node)
 
     def visit_If(self, node):
         if not self.allowed_if:
             raise Exception("Disabled keywords: if")
+        self.generic_visit(node)
 
     def visit_For(self, node):
         if not self.allowed_for:
             raise Exception("Disabled keywords: for")
+        self.generic_visit(node)
 
     def visit_While(self, node):
         if not self.allowed_while:
             raise Exception("Disabled keywords: while")
+        self.generic_visit(node)
 
     def visit_Continue(self, node):
         if not self.allowed_continue:
             raise Exception("Disabled keywords: continue")
+        self.generic_visit(node)
 
     def visit_Break(self, node):
         if not self.allowed_break:
             raise Exception("Disabled keywords: break")
+        self.generic_visit(node)
 
     def visit_FunctionDef(self, node):
         if not self.allowed_def:
             raise Exception("Disabled keywords: def")
+        self.generic_visit(node)
+
+    def visit_AsyncFunctionDef(self, node):
+        raise Exception("Disabled keywords: async")
+
+    def visit_Yield(self, node):
+        raise Exception("Disabled keywords: yield")
+
+    def visit_YieldFrom(self, node):
+        raise Exception("Disabled keywords: yield")
 
     def visit_Subscript(self, node):
         if not self.allowed_bracket:
             raise Exception("Disabled keywords: brackets [ ]")
+        self.generic_visit(node)
 
     def visit_Index(self, node):
         if not self.allowed_bracket:
             raise Exception("Disabled keywords: brackets [ ]")
+        self.generic_visit(node)
 
     def visit_List(self, node):
         if not self.allowed_bracket:
             raise Exception("Disabled keywords: brackets [ ]")
+        self.generic_visit(node)
 
     def visit_Dict(self, node):
         if not self.allowed_brace:
             raise Exception("Disabled keywords: braces { }")
+        self.generic_visit(node)
 
     def visit_Set(self, node):
         if not self.allowed_brace:
             raise Exception("Disabled keywords: braces { }")
+        self.generic_visit(node)
 
     def visit_Name(self, node):
         if node.id in self.disabled_functions:
             raise Exception("Disabled function: " + node.id)
+        self.generic_visit(node)
 
     def generic_visit(self, node):
         ast.NodeVisitor.generic_visit(self, node)
@@ -102,82 +142,561 @@ class ProgramValidator(ast.NodeVisitor):
 
         self.visit(source)
 
-class ActualRunner(bdb.Bdb):
+STEPPED_MAIN = "__algornx_main__"
+STEPPED_CALL = "__algornx_call__"
+STEPPED_FUNCTION = "__algornx_stepped__"
+
+class ImmediateResult():
+    """Iterator that finishes right away, so that `yield from` evaluates to a plain function's result."""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        raise StopIteration(self.value)
+
+def run_to_end(generator):
+    try:
+        while True:
+            next(generator)
+    except StopIteration as e:
+        return e.value
+
+def stepped_function(generator_function):
+    """Makes a user function a plain callable that runs in one go, as needed when it is passed to
+    builtins (sorted's key, map, filter...) or called where a yield isn't possible (lambda, comprehension,
+    class body). Stepped calls find the generator version in `algornx_stepped`."""
+    @functools.wraps(generator_function)
+    def function(*args, **kwargs):
+        return run_to_end(generator_function(*args, **kwargs))
+    function.algornx_stepped = generator_function
+    return function
+
+def stepped_call(function, /, *args, **kwargs):
+    generator_function = getattr(function, "algornx_stepped", None)
+    if generator_function is not None:
+        return generator_function(*args, **kwargs)
+    return ImmediateResult(function(*args, **kwargs))
+
+stepping_globals = {
+    STEPPED_CALL: stepped_call,
+    STEPPED_FUNCTION: stepped_function,
+}
+
+def module_bound_names(tree):
+    names = set()
+    nodes = list(tree.body)
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            names.add(node.name)
+            continue
+        elif isinstance(node, (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+            continue
+        elif isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+        elif isinstance(node, ast.Global):
+            names.update(node.names)
+        nodes.extend(ast.iter_child_nodes(node))
+    return names
+
+class SteppingTransformer(ast.NodeTransformer):
+    """Turns a program into a generator function that yields the number of each line before running it.
+
+    User functions become generators as well and are called through `yield from`,
+    so stepping goes inside them like a debugger would.
+    """
     def __init__(self):
-        bdb.Bdb.__init__(self)
+        self.stepped = True  # Whether the current scope can yield
+        self.module_level = True
+
+    def visit_body(self, body):
+        new_body = []
+        for node in body:
+            if self.stepped:
+                new_body.append(ast.copy_location(ast.Expr(ast.Yield(ast.Constant(node.lineno))), node))
+            new_body.append(self.visit(node))
+        return new_body
+
+    def generic_visit(self, node):
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, list):
+                if value and isinstance(value[0], ast.stmt):
+                    setattr(node, field, self.visit_body(value))
+                else:
+                    setattr(node, field, [self.visit(item) if isinstance(item, ast.AST) else item for item in value])
+            elif isinstance(value, ast.AST):
+                setattr(node, field, self.visit(value))
+        return node
+
+    def visit_Module(self, node):
+        names = module_bound_names(node)
+        body = self.visit_body(node.body)
+        if names:
+            body.insert(0, ast.Global(sorted(names)))
+        if not body:
+            body.append(ast.If(ast.Constant(False), [ast.Expr(ast.Yield(None))], []))  # Still has to be a generator
+
+        main = ast.parse("def {}():\n    pass".format(STEPPED_MAIN)).body[0]
+        main.body = body
+        node.body = [main]
+        return node
+
+    def visit_FunctionDef(self, node):
+        # Decorators, defaults and annotations are evaluated in the enclosing scope
+        node.decorator_list = [self.visit(decorator) for decorator in node.decorator_list]
+        node.args = self.visit(node.args)
+        if node.returns:
+            node.returns = self.visit(node.returns)
+
+        module_level = self.module_level
+        self.module_level = False
+        node.body = self.visit_body(node.body)
+        self.module_level = module_level
+
+        if self.stepped:
+            node.decorator_list.append(ast.Name(STEPPED_FUNCTION, ast.Load()))
+        return node
+
+    def visit_ClassDef(self, node):
+        node.decorator_list = [self.visit(decorator) for decorator in node.decorator_list]
+        node.bases = [self.visit(base) for base in node.bases]
+        node.keywords = [self.visit(keyword) for keyword in node.keywords]
+
+        stepped, module_level = self.stepped, self.module_level
+        self.stepped = self.module_level = False
+        node.body = self.visit_body(node.body)
+        self.stepped, self.module_level = stepped, module_level
+        return node
+
+    def visit_unstepped(self, node):
+        stepped = self.stepped
+        self.stepped = False
+        self.generic_visit(node)
+        self.stepped = stepped
+        return node
+
+    visit_Lambda = visit_unstepped
+    visit_ListComp = visit_unstepped
+    visit_SetComp = visit_unstepped
+    visit_DictComp = visit_unstepped
+    visit_GeneratorExp = visit_unstepped
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if not self.stepped:
+            return node  # User functions called directly run in one go
+        call = ast.YieldFrom(ast.Call(ast.Name(STEPPED_CALL, ast.Load()), [node.func] + node.args, node.keywords))
+        return ast.copy_location(call, node)
+
+    def visit_Global(self, node):
+        if self.module_level:
+            return ast.copy_location(ast.Pass(), node)  # Module level names are made global already
+        return node
+
+    def visit_Return(self, node):
+        if self.module_level:
+            raise SyntaxError("'return' outside function")
+        return self.generic_visit(node)
+
+def compile_program(source):
+    tree = SteppingTransformer().visit(source)
+    ast.fix_missing_locations(tree)
+    return compile(tree, "program.py", "exec")
+
+class LimitExceeded(BaseException):
+    """Not an Exception, so that programs can't catch it with `except Exception`."""
+    def __init__(self, limit, value):
+        BaseException.__init__(self, "Limit exceeded: more than {} {}".format(value, limit_names[limit]))
+        self.limit = limit
+        self.value = value
+
+limit_names = {
+    "lines": "lines executed",
+    "actions": "robot actions",
+    "time": "seconds",
+}
+# Headless runs stop after these by default, a None limit (0 on the command line) opts out
+default_limits = {"lines": 10000000, "actions": None, "time": 10.0}
+TIME_CHECK_INTERVAL = 64  # Lines between two wall clock checks
+ALARM_REPEAT_INTERVAL = 0.1  # Seconds between two SIGALRMs of TimeWatchdog once the time is up
+TRACE_TIME_CHECK_INTERVAL = 1024  # Trace events between two wall clock checks of TimeWatchdog's fallback
+
+def get_limits(level_data, limits=None):
+    out = dict(default_limits)
+    out.update(level_data.get("limits", {}))
+    if limits:
+        out.update(limits)
+    return out
+
+class ActualRunner():
+    def __init__(self, program_code, program_globals, max_lines=None, max_time=None):
         self.line_no = -1
+        self.next_line_no = -1
+        self.program_done = False
 
-    # Override Bdb methods
-    def user_call(self, frame, argument_list):
-        """Called if we might stop in a function."""
-        if frame.f_code.co_filename == "<string>":
-            self.set_step()
-        else:
-            self.set_return(frame)
-
-    def user_line(self, frame):
-        """Called when we stop or break at a line."""
-        self.line_end_event.set()
-        self.run_line_event.wait()
-        self.run_line_event.clear()
-        if self.stop_thread:
-            raise bdb.BdbQuit
-        else:
-            self.set_step()
-            self.line_no = frame.f_lineno
+        self.lines_executed = 0
+        self.max_lines = max_lines if max_lines is not None else float("inf")
+        self.max_time = max_time
+        self.start_time = time.perf_counter()
+        self.limit_exceeded = None
 
-    def user_return(self, frame, return_value):
-        """Called when a return trap is set here."""
-        name = frame.f_code.co_name or "<unknown>"
-        if name == "<module>":
+        exec(program_code, program_globals)
+        self.program = program_globals[STEPPED_MAIN]()
+        self.run_until_next_line()
+
+    def run_until_next_line(self):
+        try:
+            self.next_line_no = next(self.program)
+        except StopIteration:
             self.program_done = True
-            raise bdb.BdbQuit
-        self.set_step() # continue
 
-    def user_exception(self, frame, exc_info):
-        """Called when we stop on an exception."""
-        raise exc_info[1]
+    def exceed_limit(self, limit, value):
+        # Kept, so that a program catching the exception with a bare except still stops at its next line
+        self.limit_exceeded = LimitExceeded(limit, value)
+        raise self.limit_exceeded
+
+    def update(self):
+        if self.limit_exceeded is not None:
+            raise self.limit_exceeded
+        if self.lines_executed >= self.max_lines:
+            raise LimitExceeded("lines", self.max_lines)
+        if self.max_time is not None and self.lines_executed % TIME_CHECK_INTERVAL == 0 and time.perf_counter() - self.start_time > self.max_time:
+            raise LimitExceeded("time", self.max_time)
+
+        self.lines_executed += 1
+        self.line_no = self.next_line_no
+        self.run_until_next_line()
+        if self.limit_exceeded is not None:
+            raise self.limit_exceeded
+
+    def stop(self):
+        try:
+            self.program.close()
+        except RuntimeError:
+            pass  # A finally block in the program tried to step again, nothing left to clean up
+
+class Timeline():
+    """Recording of a run that can be seeked without running the program again.
+
+    Full snapshots (keyframes) are kept every `keyframe_interval` steps and each step only stores the
+    squares it changed, packed in arrays. The robot state is only stored for the steps changing it.
+    Once there are more than `max_keyframes`, the interval doubles and every other keyframe is dropped,
+    so long runs use a bounded amount of snapshots. Big grids get fewer keyframes, so that all of them
+    together stay under KEYFRAMES_MAX_SQUARES. Recording stops after `max_steps` steps (`truncated`).
+    """
+    KEYFRAMES_MAX_SQUARES = 4 * 1024 * 1024
+    MAX_STEPS = 1000000
+    DIRECTIONS = ("up", "down", "left", "right")
+
+    def __init__(self, grid, width, robot, max_keyframes=64, max_steps=MAX_STEPS):
+        self.width = width
+        self.max_keyframes = max(2, min(max_keyframes, self.KEYFRAMES_MAX_SQUARES // len(grid)))
+        self.max_steps = max_steps
+        self.truncated = False
+        self.keyframe_interval = 1
+        self.keyframe_steps = [0]
+        self.keyframes = [array(grid.typecode, grid)]
+        # Squares changed by step i are changed_indexes/changed_types[step_ends[i-1]:step_ends[i]]
+        self.step_ends = array("I")
+        self.changed_indexes = array("I")
+        self.changed_types = array(grid.typecode)
+        # Robot state after each step in robot_steps, the initial state being the first one
+        self.robot_steps = array("I", [0])
+        self.robot_x = array("i", [robot.x])
+        self.robot_y = array("i", [robot.y])
+        self.robot_directions = array("B", [self.DIRECTIONS.index(robot.direction)])
+        self.robot_holding = array(grid.typecode, [robot.holding])
+
+    def __len__(self):
+        return len(self.step_ends)
+
+    def square_changed(self, index, new_type):
+        if len(self.step_ends) < self.max_steps:
+            self.changed_indexes.append(index)
+            self.changed_types.append(new_type)
+
+    def record_step(self, grid, robot):
+        step = len(self.step_ends)
+        if step >= self.max_steps:
+            self.truncated = True
+            return
+        step += 1
+        self.step_ends.append(len(self.changed_indexes))
+        if (robot.x != self.robot_x[-1] or robot.y != self.robot_y[-1] or robot.holding != self.robot_holding[-1]
+                or robot.direction != self.DIRECTIONS[self.robot_directions[-1]]):
+            self.robot_steps.append(step)
+            self.robot_x.append(robot.x)
+            self.robot_y.append(robot.y)
+            self.robot_directions.append(self.DIRECTIONS.index(robot.direction))
+            self.robot_holding.append(robot.holding)
+
+        if step % self.keyframe_interval == 0:
+            self.keyframe_steps.append(step)
+            self.keyframes.append(array(grid.typecode, grid))
+            if len(self.keyframes) > self.max_keyframes:
+                self.keyframe_interval *= 2
+                kept = [i for i, keyframe_step in enumerate(self.keyframe_steps) if keyframe_step % self.keyframe_interval == 0]
+                self.keyframe_steps = [self.keyframe_steps[i] for i in kept]
+                self.keyframes = [self.keyframes[i] for i in kept]
+
+    def state_at(self, step):
+        """Returns (squares, robot_position, robot_direction, robot_holding) after `step` steps, squares being a flat array."""
+        step = max(0, min(step, len(self.step_ends)))
+        keyframe = bisect.bisect_right(self.keyframe_steps, step) - 1
+        grid = array(self.keyframes[keyframe].typecode, self.keyframes[keyframe])
+        keyframe_step = self.keyframe_steps[keyframe]
+        start = self.step_ends[keyframe_step-1] if keyframe_step else 0
+        end = self.step_ends[step-1] if step else 0
+        for index, new_type in zip(self.changed_indexes[start:end], self.changed_types[start:end]):
+            grid[index] = new_type
+
+        robot = bisect.bisect_right(self.robot_steps, step) - 1
+        position = {"x": self.robot_x[robot], "y": self.robot_y[robot]}
+        return grid, position, self.DIRECTIONS[self.robot_directions[robot]], self.robot_holding[robot]
+
+class Profiler():
+    """Counts collected while a program runs: hits and time per line, calls per robot function and visits per square."""
+    def __init__(self, width, height, robot):
+        self.width = width
+        self.line_hits = {}
+        self.line_time = {}
+        self.function_calls = {}
+        self.square_visits = array("L", bytes(array("L").itemsize * width * height))
+        self.square_visits[(robot.y-1)*width + robot.x-1] += 1
+
+    def to_json(self):
+        return {
+            "lines": {str(line): {"hits": hits, "time": self.line_time[line]} for line, hits in sorted(self.line_hits.items())},
+            "functions": dict(sorted(self.function_calls.items())),
+            "square_visits": grid_info.array_to_grid(self.square_visits, self.width),
+        }
+
+TRACE_MAGIC = b"ANXT"
+TRACE_VERSION = 1
+TRACE_CHECKSUM_INTERVAL = 256  # Steps between two grid checksums
+
+# Record opcodes. A step is TRACE_STEP, its line number, then the opcodes of the actions that changed the grid or the robot
+TRACE_STEP = 0
+TRACE_REPEAT = 1  # Previous step done again n times
+TRACE_CHECKSUM = 2
+TRACE_END = 3
+trace_action_opcodes = {
+    "up": 4,
+    "down": 5,
+    "left": 6,
+    "right": 7,
+    "paint": 8,
+    "grab": 9,
+    "release": 10,
+    "write_number": 11,  # Followed by the number
+}
+trace_opcode_methods = {
+    4: "robot_go_up",
+    5: "robot_go_down",
+    6: "robot_go_left",
+    7: "robot_go_right",
+    8: "robot_paint",
+    9: "robot_grab",
+    10: "robot_release",
+    11: "robot_write_number",
+}
+
+def write_varint(data, number):
+    while number >= 0x80:
+        data.append(number & 0x7f | 0x80)
+        number >>= 7
+    data.append(number)
+
+def read_varint(data, position):
+    number = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        number |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return number, position
+
+def zigzag_encode(number):
+    return number << 1 if number >= 0 else (-number << 1) - 1
+
+def zigzag_decode(number):
+    return -((number + 1) >> 1) if number & 1 else number >> 1
+
+def grid_checksum(grid):
+    if sys.byteorder != "little":
+        grid = array(grid.typecode, grid)
+        grid.byteswap()
+    return zlib.crc32(grid.tobytes())
+
+def get_level_digest(level_data):
+    return hashlib.sha256(dumps(level_data, sort_keys=True).encode()).digest()
+
+def read_trace_header(data):
+    if data[:len(TRACE_MAGIC)] != TRACE_MAGIC or data[len(TRACE_MAGIC)] != TRACE_VERSION:
+        raise Exception("Not an AlgorNX trace, or from another version")
+    position = len(TRACE_MAGIC) + 1
+    level_digest = bytes(data[position:position+32])
+    test_id, position = read_varint(data, position+32)
+    return level_digest, test_id, position
+
+class TraceWriter():
+    """Compact binary record of a run, enough to replay it without the program.
+
+    Identical consecutive steps are run-length encoded and a checksum of the grid is written
+    every `checksum_interval` steps and at the end, so replays can be checked.
+    """
+    def __init__(self, level_data, test_id, checksum_interval=TRACE_CHECKSUM_INTERVAL):
+        self.data = bytearray(TRACE_MAGIC)
+        self.data.append(TRACE_VERSION)
+        self.data += get_level_digest(level_data)
+        write_varint(self.data, test_id)
+
+        self.checksum_interval = checksum_interval
+        self.steps = 0
+        self.actions = []  # Actions of the current step
+        self.previous_step = None
+        self.repeats = 0
+
+    def record_action(self, name, function):
+        opcode = trace_action_opcodes.get(name)
+        if opcode is None:
+            return function  # Doesn't change anything
+
+        actions = self.actions
+        signature = inspect.signature(function)
+        def action(*args, **kwargs):
+            out = function(*args, **kwargs)
+            if kwargs:
+                args = signature.bind(*args, **kwargs).args  # Recorded by position, like the replay calls them
+            actions.append((opcode,) + args)
+            return out
+        return action
+
+    def flush_repeats(self):
+        if self.repeats:
+            self.data.append(TRACE_REPEAT)
+            write_varint(self.data, self.repeats)
+            self.repeats = 0
+
+    def write_checksum(self, grid):
+        self.flush_repeats()
+        self.data.append(TRACE_CHECKSUM)
+        self.data += grid_checksum(grid).to_bytes(4, "little")
+
+    def end_step(self, line_no, grid):
+        step = (line_no, tuple(self.actions))
+        self.actions.clear()
+        self.steps += 1
+
+        if step == self.previous_step:
+            self.repeats += 1
+        else:
+            self.flush_repeats()
+            self.data.append(TRACE_STEP)
+            write_varint(self.data, line_no)
+            for action in step[1]:
+                self.data.append(action[0])
+                if len(action) > 1:
+                    write_varint(self.data, zigzag_encode(action[1]))
+            self.previous_step = step
+
+        if self.steps % self.checksum_interval == 0:
+            self.write_checksum(grid)
+
+    def finish(self, grid, outcome):
+        self.write_checksum(grid)
+        self.data.append(TRACE_END)
+        write_varint(self.data, self.steps)
+        outcome = outcome.encode()
+        write_varint(self.data, len(outcome))
+        self.data += outcome
+        return bytes(self.data)
+
+class RobotState():
+    __slots__ = ("x", "y", "direction", "holding")
+
+    def __init__(self, x, y, direction="right", holding=grid_info.EMPTY):
+        self.x = x
+        self.y = y
+        self.direction = direction
+        self.holding = holding  # Type of the square grabbed, EMPTY when not holding anything
+
+    def position(self):
+        return {"x": self.x, "y": self.y}
+
+class RobotWorld():
+    """Grid and robot of one test, with the semantics of every robot function."""
+    def __init__(self, level_data, test_id):
+        self.width = level_data["size"]["width"]
+        self.height = level_data["size"]["height"]
+        self.robot = RobotState(level_data["spawn"]["x"], level_data["spawn"]["y"])
+        self.grid = grid_info.grid_to_array(level_data["tests"][test_id]["shown"])
+        self.wanted_result = grid_info.grid_to_array(level_data["tests"][test_id]["wanted"])
+        self.mismatches = {i for i, (square_type, wanted_type) in enumerate(zip(self.grid, self.wanted_result)) if square_type != wanted_type}
+        self.initial_mismatches = len(self.mismatches)
+        self.timeline = None
+        self.changed_squares = None  # Only tracked once pop_changed_squares has been called
 
-class ProgramRunner(ActualRunner):
     def get_square_under_robot(self):
-        return self.grid[self.robot_position["y"]-1][self.robot_position["x"]-1]
+        return self.grid[(self.robot.y-1)*self.width + self.robot.x-1]
 
     def set_square_under_robot(self, new_type):
-        self.grid[self.robot_position["y"]-1][self.robot_position["x"]-1] = new_type
+        index = (self.robot.y-1)*self.width + self.robot.x-1
+        self.grid[index] = new_type
+        if new_type == self.wanted_result[index]:
+            self.mismatches.discard(index)
+        else:
+            self.mismatches.add(index)
+        if self.timeline is not None:
+            self.timeline.square_changed(index, new_type)
+        if self.changed_squares is not None:
+            self.changed_squares.add(index)
 
     def robot_go_up(self):
-        if self.robot_position["y"] > 1:
-            self.robot_position["y"] -= 1
-            self.robot_direction = "up"
+        robot = self.robot
+        if robot.y > 1:
+            robot.y -= 1
+            robot.direction = "up"
         else:
             raise Exception("Moving out of the grid!")
 
     def robot_go_down(self):
-        if self.robot_position["y"] < self.level_size["height"]:
-            self.robot_position["y"] += 1
-            self.robot_direction = "down"
+        robot = self.robot
+        if robot.y < self.height:
+            robot.y += 1
+            robot.direction = "down"
         else:
             raise Exception("Moving out of the grid!")
 
     def robot_go_left(self):
-        if self.robot_position["x"] > 1:
-            self.robot_position["x"] -= 1
-            self.robot_direction = "left"
+        robot = self.robot
+        if robot.x > 1:
+            robot.x -= 1
+            robot.direction = "left"
         else:
             raise Exception("Moving out of the grid!")
 
     def robot_go_right(self):
-        if self.robot_position["x"] < self.level_size["width"]:
-            self.robot_position["x"] += 1
-            self.robot_direction = "right"
+        robot = self.robot
+        if robot.x < self.width:
+            robot.x += 1
+            robot.direction = "right"
         else:
             raise Exception("Moving out of the grid!")
 
     def robot_column(self):
-        return self.robot_position["x"]
+        return self.robot.x
 
     def robot_line(self):
-        return self.robot_position["y"]
+        return self.robot.y
 
     def robot_on_painted(self):
         return self.get_square_under_robot() == grid_info.PAINTED
@@ -190,9 +709,9 @@ class ProgramRunner(ActualRunner):
             raise Exception("Attempt to paint an unmarked square")
 
     def robot_grab(self):
-        if self.robot_holding == "":
-            if self.on_item():
-                self.robot_holding = reversed_names[self.get_square_under_robot()]
+        if self.robot.holding == grid_info.EMPTY:
+            if self.robot_on_item():
+                self.robot.holding = self.get_square_under_robot()
                 self.set_square_under_robot(grid_info.EMPTY)
             else:
                 raise Exception("No item to grab!")
@@ -201,16 +720,18 @@ class ProgramRunner(ActualRunner):
 
     def robot_release(self):
         square = self.get_square_under_robot()
-        if square == grid_info.EMPTY:
-            self.set_square_under_robot(square | grid_info.FILLED)
-            self.robot_holding = ""
+        if self.robot.holding == grid_info.EMPTY:
+            raise Exception("Not holding an item!")
+        elif square == grid_info.EMPTY:
+            self.set_square_under_robot(self.robot.holding)
+            self.robot.holding = grid_info.EMPTY
         elif square & grid_info.HOLE:
             if square & grid_info.FILLED:
                 raise Exception("Hole is already filled!")
             else:
-                if (square & ~grid_info.HOLE) == (self.holding_to_type[self.robot_holding] & ~grid_info.FILLED):
+                if (square & ~grid_info.HOLE) == (self.robot.holding & ~grid_info.FILLED):
                     self.set_square_under_robot(square | grid_info.FILLED)
-                    self.robot_holding = ""
+                    self.robot.holding = grid_info.EMPTY
                 else:
                     raise Exception("The shape held doesn't match the shape of the hole!")
         else:
@@ -224,6 +745,8 @@ class ProgramRunner(ActualRunner):
             raise Exception("No number to read!")
 
     def robot_write_number(self, number):
+        if not grid_info.NUMBER_MIN <= number <= grid_info.NUMBER_MAX:
+            raise Exception("Can't write {}, numbers go from {} to {}!".format(number, grid_info.NUMBER_MIN, grid_info.NUMBER_MAX))
         square = self.get_square_under_robot()
         if square & grid_info.NUMBER or square == grid_info.EMPTY:
             self.set_square_under_robot(grid_info.square_number_set(number))
@@ -231,19 +754,19 @@ class ProgramRunner(ActualRunner):
             raise Exception("Can't write a number here!")
 
     def robot_on_item(self):
-        return bool(self.get_square_under_robot() & grid_info.CIRCLE)  # Circle contains both bits about shapes
+        return bool(self.get_square_under_robot() & grid_info.SHAPE_CIRCLE)  # Circle contains both bits about shapes
 
     def robot_on_hole(self):
         return bool(self.get_square_under_robot() & grid_info.HOLE)
 
     def robot_on_triangle(self):
-        return self.get_square_under_robot() & grid_info.CIRCLE == grid_info.TRIANGLE
+        return self.get_square_under_robot() & grid_info.SHAPE_CIRCLE == grid_info.SHAPE_TRIANGLE
 
     def robot_on_square(self):
-        return self.get_square_under_robot() & grid_info.CIRCLE == grid_info.SQUARE
+        return self.get_square_under_robot() & grid_info.SHAPE_CIRCLE == grid_info.SHAPE_SQUARE
 
     def robot_on_circle(self):
-        return self.get_square_under_robot() & grid_info.CIRCLE == grid_info.CIRCLE
+        return self.get_square_under_robot() & grid_info.SHAPE_CIRCLE == grid_info.SHAPE_CIRCLE
 
     def robot_on_filled_shape(self):
         return self.robot_on_item() and self.get_square_under_robot() & grid_info.FILLED
@@ -251,27 +774,54 @@ class ProgramRunner(ActualRunner):
     def robot_on_dotted_shape(self):
         return self.robot_on_item() and not self.get_square_under_robot() & grid_info.FILLED
 
-    def __init__(self, level_data, test_id, source):
-        self.level_size = level_data["size"]
-        self.robot_position = deepcopy(level_data["spawn"])
-        self.grid = deepcopy(level_data["tests"][test_id]["shown"])
-        self.wanted_result = deepcopy(level_data["tests"][test_id]["wanted"])
-        self.robot_direction = "right"
-        self.robot_holding = ""
-        self.source = source
-        self.program_done = False
-        self.exc_info = None
+    def get_grid(self):
+        return grid_info.array_to_grid(self.grid, self.width)
 
-        self.holding_to_type = {
-            "grid_triangle_dotted": grid_info.SHAPE_TRIANGLE,
-            "grid_triangle_filled": grid_info.SHAPE_TRIANGLE | grid_info.FILLED,
+    def draw(self, function, surface):
+        function(surface, self.grid, self.robot.position(), self.robot.direction)
 
-            "grid_square_dotted": grid_info.SHAPE_SQUARE,
-            "grid_square_filled": grid_info.SHAPE_SQUARE | grid_info.FILLED,
+    def pop_changed_squares(self):
+        """Indices of the squares changed since the last call, None on the first call."""
+        changed_squares = self.changed_squares
+        self.changed_squares = set()
+        return changed_squares
 
-            "grid_circle_dotted": grid_info.SHAPE_CIRCLE,
-            "grid_circle_filled": grid_info.SHAPE_CIRCLE | grid_info.FILLED,
-        }
+    def draw_changes(self, function, surface):
+        return function(surface, self.grid, self.robot.position(), self.robot.direction, self.pop_changed_squares())
+
+    def is_success(self):
+        return not self.mismatches or self.get_square_under_robot() == grid_info.WINNING_SQUARE
+
+    def get_mismatches(self):
+        """Positions (x, y) of the squares that still differ from the wanted grid."""
+        return sorted((index % self.width + 1, index // self.width + 1) for index in self.mismatches)
+
+class ProgramRunner(ActualRunner, RobotWorld):
+    def count_action(self, name, function):
+        if self.profiler is None:
+            def action(*args, **kwargs):
+                if self.actions_done >= self.max_actions:
+                    self.exceed_limit("actions", self.max_actions)
+                self.actions_done += 1
+                return function(*args, **kwargs)
+        else:
+            function_calls = self.profiler.function_calls
+            square_visits = self.profiler.square_visits if name in ("up", "down", "left", "right") else None
+            def action(*args, **kwargs):
+                if self.actions_done >= self.max_actions:
+                    self.exceed_limit("actions", self.max_actions)
+                self.actions_done += 1
+                function_calls[name] = function_calls.get(name, 0) + 1
+                out = function(*args, **kwargs)
+                if square_visits is not None:
+                    square_visits[(self.robot.y-1)*self.width + self.robot.x-1] += 1
+                return out
+        return action
+
+    def __init__(self, level_data, test_id, program_code, record_timeline=False, limits=None, profile=False, trace=False):
+        RobotWorld.__init__(self, level_data, test_id)
+        if record_timeline:
+            self.timeline = Timeline(self.grid, self.width, self.robot)
         robot_functions = {
             "up": self.robot_go_up,
             "down": self.robot_go_down,
@@ -301,49 +851,649 @@ class ProgramRunner(ActualRunner):
             "on_dotted_shape": self.robot_on_dotted_shape,
         }
         self.actual_functions = {k: v for k, v in robot_functions.items() if level_data["allowed_functions"][k]}
-        
-        ActualRunner.__init__(self)
 
-        self.stop_thread = False
-        self.run_line_event = threading.Event()
-        self.line_end_event = threading.Event()
-        self.run_thread = threading.Thread(target=self.thread_target)
-        self.run_thread.start()
+        self.trace = None
+        functions = self.actual_functions
+        if trace:
+            self.trace = TraceWriter(level_data, test_id)
+            functions = {k: self.trace.record_action(k, v) for k, v in functions.items()}
 
-    def draw(self, function, surface):
-        function(surface, self.grid, self.robot_position, self.robot_direction)
+        limits = get_limits(level_data, limits)
+        self.actions_done = 0
+        self.max_actions = limits["actions"] if limits["actions"] is not None else float("inf")
 
-    def is_success(self):
-        out = False
-        if self.get_square_under_robot() == grid_info.WINNING_SQUARE:
-            out = True
-        elif self.grid == self.wanted_result:
-            out = True
+        self.profiler = None
+        if profile:
+            self.profiler = Profiler(self.width, self.height, self.robot)
 
-        return out
+        program_globals = {k: self.count_action(k, v) for k, v in functions.items()}
+        program_globals.update(stepping_globals)
+        ActualRunner.__init__(self, program_code, program_globals, limits["lines"], limits["time"])
 
-    def thread_target(self):
+    def update(self):
+        lines_executed = self.lines_executed
+        if self.profiler is not None:
+            start = time.perf_counter()
         try:
-            self.run(self.source, self.actual_functions)
-        except Exception as e:
-            self.exc_info = sys.exc_info()
+            ActualRunner.update(self)
         finally:
-            self.line_end_event.set()
+            if self.lines_executed != lines_executed:
+                if self.profiler is not None:
+                    line_hits, line_time = self.profiler.line_hits, self.profiler.line_time
+                    line_hits[self.line_no] = line_hits.get(self.line_no, 0) + 1
+                    line_time[self.line_no] = line_time.get(self.line_no, 0.0) + time.perf_counter() - start
+                if self.trace is not None:
+                    self.trace.end_step(self.line_no, self.grid)
+                if self.timeline is not None:
+                    self.timeline.record_step(self.grid, self.robot)
+
+class TraceReplayer(RobotWorld):
+    """Plays a trace back on its level, with the same update()/stop()/line_no/program_done interface as ProgramRunner."""
+    def __init__(self, level_data, trace_data, record_timeline=False):
+        level_digest, test_id, self.position = read_trace_header(trace_data)
+        if level_digest != get_level_digest(level_data):
+            raise Exception("The trace was recorded on another level")
+        RobotWorld.__init__(self, level_data, test_id)
+        if record_timeline:
+            self.timeline = Timeline(self.grid, self.width, self.robot)
+
+        self.test_id = test_id
+        self.data = trace_data
+        self.profiler = None
+        self.line_no = -1
+        self.program_done = False
+        self.lines_executed = 0
+        self.outcome = None
+        self.step = None
+        self.repeats = 0
+        self.read_checksums()
+
+    def read_checksums(self):
+        data = self.data
+        while data[self.position] == TRACE_CHECKSUM:
+            checksum = int.from_bytes(data[self.position+1:self.position+5], "little")
+            self.position += 5
+            if checksum != grid_checksum(self.grid):
+                raise Exception("Trace checksum mismatch after step {}".format(self.lines_executed))
+
+        if data[self.position] == TRACE_END:
+            steps, position = read_varint(data, self.position+1)
+            if steps != self.lines_executed:
+                raise Exception("Trace step count mismatch: {} steps recorded, {} played".format(steps, self.lines_executed))
+            length, position = read_varint(data, position)
+            self.outcome = bytes(data[position:position+length]).decode()
+            self.program_done = True
+
+    def read_step(self):
+        data = self.data
+        opcode = data[self.position]
+        if opcode == TRACE_REPEAT:
+            self.repeats, self.position = read_varint(data, self.position+1)
+            return
+
+        line_no, self.position = read_varint(data, self.position+1)
+        actions = []
+        while data[self.position] > TRACE_END:
+            opcode = data[self.position]
+            self.position += 1
+            if opcode == trace_action_opcodes["write_number"]:
+                number, self.position = read_varint(data, self.position)
+                actions.append((trace_opcode_methods[opcode], zigzag_decode(number)))
+            else:
+                actions.append((trace_opcode_methods[opcode],))
+        self.step = (line_no, actions)
 
     def update(self):
-        self.line_end_event.clear()
-        self.run_line_event.set()
-        self.line_end_event.wait()
-        self.line_end_event.clear()
-        if self.exc_info:
-            raise self.exc_info[1].with_traceback(self.exc_info[2])
+        if self.program_done:
+            return
+        try:
+            if not self.repeats:
+                self.read_step()
+            if self.repeats:
+                self.repeats -= 1
+            line_no, actions = self.step
+        except (IndexError, KeyError, TypeError):
+            raise Exception("Corrupted trace at byte {}".format(self.position))
+
+        for action in actions:
+            getattr(self, action[0])(*action[1:])
+        self.line_no = line_no
+        self.lines_executed += 1
+        if self.timeline is not None:
+            self.timeline.record_step(self.grid, self.robot)
+
+        if not self.repeats:
+            try:
+                self.read_checksums()
+            except (IndexError, UnicodeDecodeError):
+                raise Exception("Corrupted trace at byte {}".format(self.position))
 
     def stop(self):
-        self.stop_thread = True
-        self.run_line_event.set()
-        self.run_thread.join()
-
-def validate_and_start_program(program_source, level_data, selected_test):
-    source = ast.parse(program_source, filename='program.py', mode='exec')
-    ProgramValidator().validate(source, level_data["allowed_keywords"])
-    return ProgramRunner(level_data, selected_test, program_source)
+        pass
+
+STEPPING_VERSION = 2  # Part of the program keys, so that caches saved by older versions aren't used
+
+def get_program_key(program_source, level_data):
+    key = hashlib.sha256(program_source.encode())
+    key.update(str(STEPPING_VERSION).encode())
+    key.update(dumps(level_data["allowed_keywords"], sort_keys=True).encode())
+    key.update(dumps(level_data["allowed_functions"], sort_keys=True).encode())
+    return key.hexdigest()
+
+class CachedProgram():
+    __slots__ = ("tree", "error", "code")
+
+    def __init__(self, tree, error, code):
+        self.tree = tree
+        self.error = error  # Validation error message, None if the program is valid
+        self.code = code
+
+class ProgramCache():
+    """LRU cache of parsed, validated and compiled programs, keyed by source and level restrictions.
+
+    Once load() has been given a path, the validation results and code objects can be written
+    back with save(). Code objects are stored with marshal, so the file is only reused by the
+    same Python version.
+    """
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.path = None
+        self.unsaved = set()
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        if self.path:
+            self.unsaved.add(key)
+
+    def get(self, program_source, level_data):
+        key = get_program_key(program_source, level_data)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            try:
+                tree = ast.parse(program_source, filename='program.py', mode='exec')
+                ProgramValidator().validate(tree, level_data["allowed_keywords"])
+                entry = CachedProgram(tree, None, compile_program(deepcopy(tree)))
+            except Exception as e:
+                entry = CachedProgram(None, str(e), None)
+            self.add(key, entry)
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+
+        if entry.error is not None:
+            raise Exception(entry.error)
+        return entry.code
+
+    def pop_unsaved(self):
+        unsaved = {key: marshal.dumps((self.entries[key].error, self.entries[key].code)) for key in self.unsaved if key in self.entries}
+        self.unsaved = set()
+        return unsaved
+
+    def merge(self, serialized_entries):
+        for key, data in serialized_entries.items():
+            error, code = marshal.loads(data)
+            self.add(key, CachedProgram(None, error, code))
+
+    def load(self, path):
+        self.path = path
+        try:
+            with open(path, "rb") as f:
+                data = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return
+        if data.get("tag") == sys.implementation.cache_tag:
+            for key, error, code in data["entries"]:
+                self.entries[key] = CachedProgram(None, error, code)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def save(self):
+        data = {
+            "tag": sys.implementation.cache_tag,
+            "entries": [(key, entry.error, entry.code) for key, entry in self.entries.items()],
+        }
+        with open(self.path, "wb") as f:
+            marshal.dump(data, f)
+        self.unsaved = set()
+
+program_cache = ProgramCache()
+
+def validate_and_start_program(program_source, level_data, selected_test, record_timeline=False, limits=None, profile=False, trace=False):
+    return ProgramRunner(level_data, selected_test, program_cache.get(program_source, level_data), record_timeline, limits, profile, trace)
+
+def load_level(level_folder):
+    with open(os.path.join(level_folder, "level.json")) as f:
+        level_data = load(f)
+
+    width, height = level_data["size"]["width"], level_data["size"]["height"]
+    if width > grid_info.LEVEL_MAX_SIZE or height > grid_info.LEVEL_MAX_SIZE:
+        raise Exception("Level too big, at most {0}x{0} squares".format(grid_info.LEVEL_MAX_SIZE))
+    for test in level_data["tests"]:
+        test["shown"] = grid_info.decode_grid(test["shown"], width)
+        test["wanted"] = grid_info.decode_grid(test["wanted"], width)
+        grid_info.check_numbers(test["shown"])
+        grid_info.check_numbers(test["wanted"])
+    return level_data
+
+def load_program(level_folder):
+    try:
+        with open(os.path.join(level_folder, "program.py")) as f:
+            program_data = f.read()
+        return program_data
+    except OSError:
+        return None
+
+STOP_CHECK_INTERVAL = 1024  # Lines between two checks of run_test's stop_event
+
+class WatchdogInterrupt(LimitExceeded):
+    """Time limit raised by TimeWatchdog in another thread, which can only be given an exception class."""
+    max_time = None
+
+    def __init__(self):
+        LimitExceeded.__init__(self, "time", self.max_time)
+
+class TimeWatchdog():
+    """Enforces a runner's time limit, also in code that doesn't step (comprehensions, lambdas, builtin callbacks).
+
+    Uses SIGALRM when running on the main thread, where it also interrupts long builtin calls. Other threads
+    get a timer thread, raising the limit in the program's thread when it hasn't stepped for a while.
+    Without ctypes, a trace function is used instead, which slows the program down.
+    """
+    def __init__(self, program_runner):
+        self.program_runner = program_runner
+        self.active = False
+        self.old_handler = None
+        self.old_trace = None
+        if hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread():
+            self.mode = "signal"
+        elif ctypes is not None and hasattr(ctypes, "pythonapi"):
+            self.mode = "timer"
+        else:
+            self.mode = "trace"
+        self.events = 0
+        self.lock = threading.Lock()
+        self.exited = threading.Event()
+
+    def __enter__(self):
+        max_time = self.program_runner.max_time
+        if max_time is None:
+            return self
+        self.active = True
+        remaining = max(0.001, max_time - (time.perf_counter() - self.program_runner.start_time))
+        if self.mode == "signal":
+            self.old_handler = signal.signal(signal.SIGALRM, self.on_alarm)
+            # Fires again until the watchdog exits, in case the program catches the limit with a bare except
+            signal.setitimer(signal.ITIMER_REAL, remaining, ALARM_REPEAT_INTERVAL)
+        elif self.mode == "timer":
+            self.thread_id = threading.get_ident()
+            self.interrupt = type("WatchdogInterrupt", (WatchdogInterrupt,), {"max_time": max_time})
+            threading.Thread(target=self.watch, args=(remaining,), daemon=True).start()
+        else:
+            self.old_trace = sys.gettrace()
+            sys.settrace(self.trace)
+        return self
+
+    def __exit__(self, *args):
+        if not self.active:
+            return
+        with self.lock:
+            self.active = False
+        if self.mode == "signal":
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self.old_handler)
+        elif self.mode == "timer":
+            self.exited.set()
+        else:
+            sys.settrace(self.old_trace)
+
+    def time_out(self):
+        self.program_runner.exceed_limit("time", self.program_runner.max_time)
+
+    def defer_time_out(self):
+        # Raised by update() at the next line, so that the runner's own bookkeeping (trace, timeline...) isn't interrupted
+        if self.program_runner.limit_exceeded is None:
+            self.program_runner.limit_exceeded = LimitExceeded("time", self.program_runner.max_time)
+
+    def on_alarm(self, signal_number, frame):
+        if not self.active:
+            return
+        if frame is not None and frame.f_code.co_filename == "program.py":
+            self.time_out()
+        else:
+            self.defer_time_out()
+
+    def watch(self, remaining):
+        if self.exited.wait(remaining):
+            return
+        self.defer_time_out()
+        while True:
+            lines_executed = self.program_runner.lines_executed
+            if self.exited.wait(ALARM_REPEAT_INTERVAL):
+                return
+            with self.lock:
+                # Still on the same line: in code that doesn't step, which only an exception can stop.
+                # Like on_alarm, only raised while the program's own code runs
+                frame = sys._current_frames().get(self.thread_id)
+                if self.active and self.program_runner.lines_executed == lines_executed and frame is not None and frame.f_code.co_filename == "program.py":
+                    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(self.thread_id), ctypes.py_object(self.interrupt))
+
+    def trace(self, frame, event, arg):
+        code = frame.f_code
+        if code.co_filename != "program.py":
+            return None
+        self.events += 1
+        if self.events % TRACE_TIME_CHECK_INTERVAL == 0 and self.active and time.perf_counter() - self.program_runner.start_time > self.program_runner.max_time:
+            self.time_out()
+        # Stepped functions are resumed, so seen here, on every line. Only the code that doesn't step needs its lines traced
+        if code.co_flags & inspect.CO_GENERATOR and code.co_name != "<genexpr>":
+            return None
+        return self.trace
+
+def run_test(level_data, test_id, program_source, limits=None, on_start=None, stop_event=None, profile=False, trace_path=None):
+    result = {
+        "test": test_id,
+        "passed": False,
+        "outcome": "error",
+        "steps": 0,
+        "actions": 0,
+        "time": 0.0,
+        "error": None,
+    }
+
+    start = time.perf_counter()
+    program_runner = None
+    try:
+        program_runner = validate_and_start_program(program_source, level_data, test_id, limits=limits, profile=profile, trace=bool(trace_path))
+        if on_start:
+            on_start(program_runner)
+        with TimeWatchdog(program_runner):
+            while not program_runner.program_done:
+                program_runner.update()
+                if stop_event is not None and program_runner.lines_executed % STOP_CHECK_INTERVAL == 0 and stop_event.is_set():
+                    break
+        if program_runner.program_done:
+            result["passed"] = program_runner.is_success()
+            result["outcome"] = "passed" if result["passed"] else "failed"
+        if not program_runner.program_done:
+            result["outcome"] = "stopped"
+    except LimitExceeded as e:
+        result["outcome"] = "limit_exceeded"
+        result["limit"] = e.limit
+        result["error"] = str(e)
+    except MemoryError:
+        result["outcome"] = "limit_exceeded"
+        result["limit"] = "memory"
+        result["error"] = "Limit exceeded: out of memory"
+    except Exception as e:
+        result["error"] = str(e)
+    finally:
+        if program_runner:
+            program_runner.stop()
+            result["steps"] = program_runner.lines_executed
+            result["actions"] = program_runner.actions_done
+            if program_runner.profiler is not None:
+                result["profile"] = program_runner.profiler.to_json()
+            if program_runner.trace is not None:
+                outcome = result["outcome"] if result["error"] is None else "{}: {}".format(result["outcome"], result["error"])
+                with open(trace_path, "wb") as f:
+                    f.write(program_runner.trace.finish(program_runner.grid, outcome))
+            result["remaining_squares"] = len(program_runner.mismatches)
+            result["progress"] = 1.0 - len(program_runner.mismatches) / program_runner.initial_mismatches if program_runner.initial_mismatches else 1.0
+    result["time"] = time.perf_counter() - start
+
+    return result
+
+def get_trace_path(trace_prefix, test_id):
+    return "{}_test{}.trace".format(trace_prefix, test_id + 1) if trace_prefix else None
+
+def grade_program(level_data, program_source, limits=None, profile=False, trace_prefix=None):
+    return summarize_results([run_test(level_data, i, program_source, limits, profile=profile, trace_path=get_trace_path(trace_prefix, i)) for i in range(len(level_data["tests"]))])
+
+def summarize_results(results):
+    return {
+        "passed": all(result["passed"] for result in results),
+        "steps": sum(result["steps"] for result in results),
+        "actions": sum(result["actions"] for result in results),
+        "time": sum(result["time"] for result in results),
+        "tests": results,
+    }
+
+worker_levels = {}  # Levels already loaded by this process, by folder
+
+def grade_submission(level_folder, program_source, limits=None, profile=False, trace_prefix=None):
+    start = time.perf_counter()
+    level_data = worker_levels.get(level_folder)
+    if level_data is None:
+        level_data = load_level(level_folder)
+        worker_levels[level_folder] = level_data
+
+    grade = grade_program(level_data, program_source, limits, profile, trace_prefix)
+    grade["level"] = level_folder
+    grade["worker"] = os.getpid()
+    grade["busy_time"] = time.perf_counter() - start
+    grade["cache_entries"] = program_cache.pop_unsaved()
+    return grade
+
+def init_worker(cache_path):
+    if cache_path:
+        program_cache.load(cache_path)
+
+class BatchGrader():
+    """Grades (level_folder, program_source) pairs on a pool of processes.
+
+    results() yields each grade as soon as it is done, in completion order, with a "submission"
+    key giving its index in the input. summary() is available once results() is exhausted.
+    When given an AlgorNX_sandbox.SandboxPool, programs run in its workers instead.
+    """
+    def __init__(self, submissions, max_workers=None, limits=None, cache_path=None, sandbox=None, profile=False, trace_dir=None):
+        self.submissions = list(submissions)
+        self.profile = profile
+        self.trace_dir = trace_dir
+        self.max_workers = max_workers
+        self.limits = limits
+        self.cache_path = cache_path
+        self.sandbox = sandbox
+        self.worker_busy_time = {}
+        self.wall_time = None
+
+    def results(self):
+        start = time.perf_counter()
+        if self.sandbox:
+            executor = ThreadPoolExecutor(self.sandbox.size)  # The sandbox workers are processes already
+            grade_function = self.sandbox.grade_submission
+        else:
+            executor = ProcessPoolExecutor(self.max_workers, initializer=init_worker, initargs=(self.cache_path,))
+            grade_function = grade_submission
+
+        with executor:
+            futures = {executor.submit(grade_function, level_folder, program_source, self.limits, self.profile, self.get_trace_prefix(i)): i for i, (level_folder, program_source) in enumerate(self.submissions)}
+            for future in as_completed(futures):
+                try:
+                    grade = future.result()
+                    self.worker_busy_time[grade["worker"]] = self.worker_busy_time.get(grade["worker"], 0.0) + grade["busy_time"]
+                    program_cache.merge(grade.pop("cache_entries", {}))  # Workers compile, this process saves
+                except Exception as e:
+                    grade = {
+                        "level": self.submissions[futures[future]][0],
+                        "passed": False,
+                        "error": str(e),
+                    }
+                grade["submission"] = futures[future]
+                yield grade
+        self.wall_time = time.perf_counter() - start
+        if self.cache_path:
+            program_cache.save()
+
+    def get_trace_prefix(self, submission):
+        return os.path.join(self.trace_dir, str(submission)) if self.trace_dir else None
+
+    def summary(self):
+        return {
+            "submissions": len(self.submissions),
+            "wall_time": self.wall_time,
+            "throughput": len(self.submissions) / self.wall_time if self.wall_time else 0.0,
+            "worker_utilisation": {str(worker): busy_time / self.wall_time for worker, busy_time in self.worker_busy_time.items()},
+        }
+
+def limits_from_args(args):
+    limits = {
+        "lines": args.max_lines,
+        "actions": args.max_actions,
+        "time": args.max_time,
+    }
+    # Unset options keep the level's limits, 0 removes the limit
+    return {k: v or None for k, v in limits.items() if v is not None}
+
+def add_limit_arguments(parser, sandbox=True):
+    parser.add_argument("--max-lines", type=int, default=None, help="maximum number of lines executed per test ({} by default, 0 for no limit)".format(default_limits["lines"]))
+    parser.add_argument("--max-actions", type=int, default=None, help="maximum number of robot actions per test (0 for no limit)")
+    parser.add_argument("--max-time", type=float, default=None, help="maximum wall time per test, in seconds ({} by default, 0 for no limit)".format(default_limits["time"]))
+    if not sandbox:
+        return
+    parser.add_argument("--sandbox", action="store_true", help="run programs in worker processes with memory and CPU limits")
+    parser.add_argument("--memory-limit", type=int, default=None, help="sandbox address space limit per worker, in megabytes")
+    parser.add_argument("--cpu-limit", type=float, default=None, help="sandbox CPU time limit per test, in seconds (counted in whole seconds by the system, see --max-time)")
+
+def add_run_arguments(parser):
+    add_limit_arguments(parser)
+    parser.add_argument("--cache", default=None, help="file keeping validated and compiled programs between runs")
+    parser.add_argument("--profile", action="store_true", help="add per line, per robot function and per square counts to the results")
+    parser.add_argument("--trace-dir", default=None, help="folder where a replayable trace of every test is written")
+
+def sandbox_from_args(args, workers):
+    if not args.sandbox:
+        return None
+    import AlgorNX_sandbox as sandbox  # Imports this module, so it can't be imported at the top
+    options = {}
+    if args.memory_limit is not None:
+        options["memory_limit"] = args.memory_limit * 1024 * 1024
+    if args.cpu_limit is not None:
+        options["cpu_limit"] = args.cpu_limit
+    return sandbox.SandboxPool(workers, **options)
+
+def grade_command(args):
+    if args.cache:
+        program_cache.load(args.cache)
+    level_data = load_level(args.level_folder)
+    with open(args.program) as f:
+        program_source = f.read()
+
+    trace_prefix = os.path.join(args.trace_dir, "trace") if args.trace_dir else None
+    sandbox_pool = sandbox_from_args(args, 1)
+    if sandbox_pool:
+        with sandbox_pool:
+            grade = sandbox_pool.grade_program(level_data, program_source, limits_from_args(args), args.profile, trace_prefix)
+    else:
+        grade = grade_program(level_data, program_source, limits_from_args(args), args.profile, trace_prefix)
+    dump(grade, sys.stdout, indent=4)
+    print()
+    if args.cache:
+        program_cache.save()
+    return 0 if grade["passed"] else 1
+
+def batch_command(args):
+    with open(args.submissions) as f:
+        submissions = load(f)
+
+    programs = []
+    for level_folder, program_path in submissions:
+        with open(program_path) as f:
+            programs.append((level_folder, f.read()))
+
+    all_passed = True
+    if args.cache:
+        program_cache.load(args.cache)
+    sandbox_pool = sandbox_from_args(args, args.workers)
+    batch = BatchGrader(programs, args.workers, limits_from_args(args), args.cache, sandbox_pool, args.profile, args.trace_dir)
+    for grade in batch.results():
+        grade["program"] = submissions[grade["submission"]][1]
+        all_passed = all_passed and grade["passed"]
+        print(dumps(grade), flush=True)
+    if sandbox_pool:
+        sandbox_pool.close()
+    print(dumps({"summary": batch.summary()}))
+    return 0 if all_passed else 1
+
+def get_test_stats(test):
+    shown = grid_info.grid_to_bitboards(test["shown"])
+    wanted = grid_info.grid_to_bitboards(test["wanted"])
+    return {
+        "squares_to_change": grid_info.popcount(shown.diff(wanted)),
+        "markers": grid_info.popcount(shown.with_type(grid_info.MARKER)),
+        "markers_to_paint": grid_info.popcount(shown.with_type(grid_info.MARKER) & wanted.with_type(grid_info.PAINTED)),
+        "items": grid_info.popcount((shown.layers[2] | shown.layers[3]) & ~shown.layers[5]),
+        "holes": grid_info.popcount(shown.layers[5]),
+        "holes_to_fill": grid_info.popcount(shown.unfilled_holes() & wanted.with_flags(grid_info.HOLE | grid_info.FILLED)),
+        "numbers": len(shown.numbers),
+        "numbers_to_write": grid_info.popcount(shown.diff(wanted) & wanted.layers[8]),
+        "walls": grid_info.popcount(shown.with_type(grid_info.WALL)),
+        "winning_squares": grid_info.popcount(shown.with_type(grid_info.WINNING_SQUARE)),
+    }
+
+def info_command(args):
+    level_data = load_level(args.level_folder)
+    info = {
+        "size": level_data["size"],
+        "tests": [get_test_stats(test) for test in level_data["tests"]],
+    }
+    dump(info, sys.stdout, indent=4)
+    print()
+    return 0
+
+def replay_command(args):
+    level_data = load_level(args.level_folder)
+    with open(args.trace, "rb") as f:
+        trace_data = f.read()
+
+    start = time.perf_counter()
+    replayer = TraceReplayer(level_data, trace_data)
+    while not replayer.program_done:
+        replayer.update()
+    result = {
+        "test": replayer.test_id,
+        "passed": replayer.is_success(),
+        "outcome": replayer.outcome,
+        "steps": replayer.lines_executed,
+        "time": time.perf_counter() - start,
+    }
+    dump(result, sys.stdout, indent=4)
+    print()
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(prog="AlgorNX_runner", description="Run AlgorNX programs without a display")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    grade_parser = subparsers.add_parser("grade", help="run a program against every test of a level and print the results as JSON")
+    grade_parser.add_argument("level_folder")
+    grade_parser.add_argument("program")
+    add_run_arguments(grade_parser)
+    grade_parser.set_defaults(handler=grade_command)
+
+    batch_parser = subparsers.add_parser("batch", help="grade many submissions in parallel and print one JSON result per line as they complete")
+    batch_parser.add_argument("submissions", help="JSON file containing a list of [level_folder, program] pairs")
+    batch_parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: one per CPU)")
+    add_run_arguments(batch_parser)
+    batch_parser.set_defaults(handler=batch_command)
+
+    replay_parser = subparsers.add_parser("replay", help="replay a trace written by --trace-dir and check it against the level")
+    replay_parser.add_argument("level_folder")
+    replay_parser.add_argument("trace")
+    replay_parser.set_defaults(handler=replay_command)
+
+    info_parser = subparsers.add_parser("info", help="print what each test of a level asks for, as JSON")
+    info_parser.add_argument("level_folder")
+    info_parser.set_defaults(handler=info_command)
+
+    args = parser.parse_args()
+    sys.exit(args.handler(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import os
+from collections import OrderedDict
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+import hashlib
+from json import dumps
+try:
+    import resource
+except ImportError:  # Not available outside of Unix, the workers run without limits there
+    resource = None
+
+import grid_info
+import AlgorNX_runner as runner
+
+DEFAULT_MEMORY_LIMIT = 512 * 1024 * 1024
+DEFAULT_CPU_LIMIT = 10.0
+LEVEL_KEYS_KEPT = 64  # Levels whose key SandboxPool remembers
+
+def set_cpu_limit(cpu_limit):
+    # RLIMIT_CPU counts the whole life of the process, so move it forward before each run. It is in
+    # whole seconds, so a run can use up to a second more than cpu_limit, --max-time is the precise limit
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime + cpu_limit) + 1
+    hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+def run_in_worker(level_data, test_id, program_source, options):
+    program_runners = []
+    result = runner.run_test(level_data, test_id, program_source, on_start=program_runners.append, **options)
+    if program_runners:
+        program_runner = program_runners[0]
+        result["grid"] = program_runner.grid
+        result["robot"] = {
+            "x": program_runner.robot.x,
+            "y": program_runner.robot.y,
+            "direction": program_runner.robot.direction,
+            "holding": program_runner.robot.holding,
+        }
+    result["worker"] = os.getpid()
+    return result
+
+def worker_main(connection, memory_limit, cpu_limit):
+    if resource and memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    # Messages are ("level", key, level_data) the first time a level is used, then ("run", key, test_id, source, run_test options)
+    levels = {}
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+
+        if message[0] == "level":
+            levels[message[1]] = message[2]
+        elif message[0] == "run":
+            _, level_key, test_id, program_source, options = message
+            if resource and cpu_limit:
+                set_cpu_limit(cpu_limit)
+            connection.send(run_in_worker(levels[level_key], test_id, program_source, options))
+        else:
+            break
+
+class SandboxWorker():
+    def __init__(self, context, memory_limit, cpu_limit):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_connection, memory_limit, cpu_limit), daemon=True)
+        self.process.start()
+        child_connection.close()
+
+        self.levels = set()
+        # Wall clock safety net, for programs that stop using CPU without finishing
+        self.timeout = cpu_limit * 2 + 5 if cpu_limit else None
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def failed_result(self, test_id):
+        result = {
+            "test": test_id,
+            "passed": False,
+            "outcome": "error",
+            "steps": 0,
+            "actions": 0,
+            "time": 0.0,
+            "error": "Sandbox worker died (exit code {})".format(self.process.exitcode),
+            "worker": self.process.pid,
+        }
+        if self.process.exitcode == -signal.SIGXCPU:
+            result["outcome"] = "limit_exceeded"
+            result["limit"] = "cpu"
+            result["error"] = "Limit exceeded: out of CPU time"
+        elif self.process.exitcode == -signal.SIGKILL:
+            result["outcome"] = "limit_exceeded"
+            result["limit"] = "time"
+            result["error"] = "Limit exceeded: the sandbox stopped answering"
+        return result
+
+    def run(self, level_key, level_data, test_id, program_source, options):
+        start = time.perf_counter()
+        try:
+            if level_key not in self.levels:
+                self.connection.send(("level", level_key, level_data))
+                self.levels.add(level_key)
+            self.connection.send(("run", level_key, test_id, program_source, options))
+            if self.connection.poll(self.timeout):
+                result = self.connection.recv()
+                result["grid"] = grid_info.array_to_grid(result["grid"], level_data["size"]["width"]) if "grid" in result else None
+                return result
+        except (EOFError, OSError):
+            pass
+
+        self.process.kill()
+        self.process.join()
+        result = self.failed_result(test_id)
+        result["time"] = time.perf_counter() - start
+        return result
+
+    def close(self):
+        try:
+            self.connection.send(("stop",))
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+class SandboxPool():
+    """Pre-started worker processes running untrusted programs under memory and CPU limits.
+
+    Workers are reused from one run to the next and only receive each level once. A worker
+    killed by a limit is replaced by a fresh one. Safe to use from several threads at once.
+    """
+    def __init__(self, workers=None, memory_limit=DEFAULT_MEMORY_LIMIT, cpu_limit=DEFAULT_CPU_LIMIT):
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            # Replacements are started from the grading threads, and forking a process with several
+            # threads copies the locks other threads hold. The fork server has a single thread
+            self.context = multiprocessing.get_context("forkserver")
+            self.context.set_forkserver_preload(["AlgorNX_sandbox"])  # Workers start with the runner already imported
+        else:
+            self.context = multiprocessing.get_context()
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self.size = workers or os.cpu_count()
+        self.idle_workers = queue.Queue()
+        for i in range(self.size):
+            self.idle_workers.put(SandboxWorker(self.context, memory_limit, cpu_limit))
+
+        # id(level_data): (level_data, key) of the last levels used, keeping level_data alive so ids aren't reused
+        self.level_keys = OrderedDict()
+        self.level_keys_lock = threading.Lock()
+        self.levels = {}  # Levels loaded by grade_submission, by folder
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_level_key(self, level_data):
+        with self.level_keys_lock:
+            entry = self.level_keys.get(id(level_data))
+            if entry is not None:
+                self.level_keys.move_to_end(id(level_data))
+                return entry[1]
+        key = hashlib.sha256(dumps(level_data, sort_keys=True).encode()).hexdigest()
+        with self.level_keys_lock:
+            self.level_keys[id(level_data)] = (level_data, key)
+            if len(self.level_keys) > LEVEL_KEYS_KEPT:
+                self.level_keys.popitem(last=False)
+        return key
+
+    def get_worker(self):
+        worker = self.idle_workers.get()
+        if not worker.is_alive():
+            worker = SandboxWorker(self.context, self.memory_limit, self.cpu_limit)
+        return worker
+
+    def run_test(self, level_data, test_id, program_source, limits=None, profile=False, trace_path=None):
+        worker = self.get_worker()
+        try:
+            return worker.run(self.get_level_key(level_data), level_data, test_id, program_source, {"limits": limits, "profile": profile, "trace_path": trace_path})
+        finally:
+            self.idle_workers.put(worker)
+
+    def grade_program(self, level_data, program_source, limits=None, profile=False, trace_prefix=None, keep_grids=False):
+        # All the tests go to one worker, which keeps the level and the compiled program cached
+        level_key = self.get_level_key(level_data)
+        worker = self.get_worker()
+        results = []
+        try:
+            for i in range(len(level_data["tests"])):
+                if not worker.is_alive():
+                    worker = SandboxWorker(self.context, self.memory_limit, self.cpu_limit)
+                options = {"limits": limits, "profile": profile, "trace_path": runner.get_trace_path(trace_prefix, i)}
+                results.append(worker.run(level_key, level_data, i, program_source, options))
+        finally:
+            self.idle_workers.put(worker)
+
+        if not keep_grids:
+            for result in results:
+                result.pop("grid", None)
+                result.pop("robot", None)
+        grade = runner.summarize_results(results)
+        grade["worker"] = results[-1]["worker"] if results else None
+        return grade
+
+    def grade_submission(self, level_folder, program_source, limits=None, profile=False, trace_prefix=None):
+        start = time.perf_counter()
+        level_data = self.levels.get(level_folder)
+        if level_data is None:
+            level_data = runner.load_level(level_folder)
+            self.levels[level_folder] = level_data
+
+        grade = self.grade_program(level_data, program_source, limits, profile, trace_prefix)
+        grade["level"] = level_folder
+        grade["busy_time"] = time.perf_counter() - start
+        return grade
+
+    def close(self):
+        while True:
+            try:
+                self.idle_workers.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,344 @@
+import sys
+from array import array
+from json import dump, dumps
+import argparse
+import heapq
+import time
+import grid_info
+import AlgorNX_runner as runner
+
+DEFAULT_MAX_NODES = 200000  # States kept in memory per test
+
+# Robot functions that change the robot or the grid, the others can't bring a test closer to success
+solver_actions = [
+    ("up", "robot_go_up"),
+    ("down", "robot_go_down"),
+    ("left", "robot_go_left"),
+    ("right", "robot_go_right"),
+    ("paint", "robot_paint"),
+    ("grab", "robot_grab"),
+    ("release", "robot_release"),
+    ("write_number", "robot_write_number"),
+]
+
+class SearchWorld(runner.RobotWorld):
+    """RobotWorld without mismatch tracking, loaded with one search state after another."""
+    def __init__(self, level_data, test_id):
+        runner.RobotWorld.__init__(self, level_data, test_id)
+        self.grids = {}  # States share their grid bytes, most actions only move the robot
+
+    def set_square_under_robot(self, new_type):
+        self.grid[(self.robot.y-1)*self.width + self.robot.x-1] = new_type
+
+    def load_state(self, state):
+        self.robot.x, self.robot.y, self.robot.holding, squares = state
+        self.grid = array("i")
+        self.grid.frombytes(squares)
+
+    def get_state(self):
+        squares = self.grid.tobytes()
+        return (self.robot.x, self.robot.y, self.robot.holding, self.grids.setdefault(squares, squares))
+
+class Solver():
+    """A* search for the fewest robot actions solving one test of a level.
+
+    Every action changes at most one square, the one under the robot, so the remaining actions are at
+    least the number of squares still differing from the wanted grid, plus the moves needed to visit
+    all of them: reaching both ends of their bounding box, horizontally and vertically. Reaching a
+    winning square also solves a test, so the distance to the nearest one is used when it is lower.
+
+    A `weight` above 1 multiplies the heuristic (weighted A*): the search gets much faster and still
+    tells solvable tests from unsolvable ones, but a solution may take up to `weight` times the fewest actions.
+    """
+    def __init__(self, level_data, test_id, max_nodes=DEFAULT_MAX_NODES, weight=1):
+        self.world = SearchWorld(level_data, test_id)
+        self.test_id = test_id
+        self.max_nodes = max_nodes
+        self.weight = weight
+        allowed_functions = level_data.get("allowed_functions", {})
+        self.actions = [(name, getattr(self.world, method)) for name, method in solver_actions if allowed_functions.get(name, True)]
+        self.wanted = self.world.wanted_result
+        self.winning_squares = [(index % self.world.width + 1, index // self.world.width + 1) for index, square_type in enumerate(self.world.grid) if square_type == grid_info.WINNING_SQUARE]
+        self.mismatch_bounds = {}  # Per grid bytes, shared between states like SearchWorld.grids
+        self.nodes = 0
+
+    def get_mismatch_bounds(self, squares):
+        """(left, right, top, bottom) of the squares differing from the wanted grid, () when there are none."""
+        bounds = self.mismatch_bounds.get(squares)
+        if bounds is None:
+            grid = array("i")
+            grid.frombytes(squares)
+            width = self.world.width
+            indices = [index for index, (square_type, wanted_type) in enumerate(zip(grid, self.wanted)) if square_type != wanted_type]
+            bounds = ()
+            if indices:
+                xs = [index % width + 1 for index in indices]
+                bounds = (min(xs), max(xs), indices[0] // width + 1, indices[-1] // width + 1)
+            self.mismatch_bounds[squares] = bounds
+        return bounds
+
+    def get_heuristic(self, state, mismatches):
+        x, y = state[0], state[1]
+        estimate = mismatches
+        if mismatches:
+            left, right, top, bottom = self.get_mismatch_bounds(state[3])
+            estimate += right - left + min(abs(x - left), abs(x - right)) + bottom - top + min(abs(y - top), abs(y - bottom))
+        for win_x, win_y in self.winning_squares:
+            estimate = min(estimate, abs(win_x - x) + abs(win_y - y))
+        return estimate
+
+    def expand(self, state, mismatches):
+        """Yields (action, argument, new state, new mismatches) for every action allowed from `state`."""
+        world = self.world
+        index = (state[1]-1)*world.width + state[0]-1
+        for name, method in self.actions:
+            world.load_state(state)
+            argument = None
+            if name == "write_number":
+                if not self.wanted[index] & grid_info.NUMBER or world.grid[index] == self.wanted[index]:
+                    continue  # Writing anything else than the wanted number never helps
+                argument = grid_info.square_number_get(self.wanted[index])
+            try:
+                if argument is None:
+                    method()
+                else:
+                    method(argument)
+            except Exception:
+                continue
+            new_mismatches = mismatches - (state_square(state, index) != self.wanted[index]) + (world.grid[index] != self.wanted[index])
+            yield name, argument, world.get_state(), new_mismatches
+
+    def is_solved(self, state, mismatches):
+        return not mismatches or state_square(state, (state[1]-1)*self.world.width + state[0]-1) == grid_info.WINNING_SQUARE
+
+    def solve(self):
+        world = self.world
+        start = world.get_state()
+        mismatches = len(world.mismatches)
+        best_cost = {start: 0}
+        parents = {start: None}
+        counter = 0  # Tie breaker, so states never get compared
+        queue = [(self.weight * self.get_heuristic(start, mismatches), 0, counter, start, mismatches)]
+        while queue:
+            _, cost, _, state, mismatches = heapq.heappop(queue)
+            if cost > best_cost[state]:
+                continue  # Already reached by a shorter path
+            if self.is_solved(state, mismatches):
+                return self.get_path(parents, state)
+
+            self.nodes += 1
+            if len(best_cost) > self.max_nodes:
+                raise SearchBudgetExceeded(self.max_nodes)
+            for name, argument, new_state, new_mismatches in self.expand(state, mismatches):
+                if cost + 1 < best_cost.get(new_state, cost + 2):
+                    best_cost[new_state] = cost + 1
+                    parents[new_state] = (state, name, argument)
+                    counter += 1
+                    heapq.heappush(queue, (cost + 1 + self.weight * self.get_heuristic(new_state, new_mismatches), cost + 1, counter, new_state, new_mismatches))
+        return None
+
+    def get_path(self, parents, state):
+        path = []
+        while parents[state] is not None:
+            state, name, argument = parents[state]
+            path.append(name if argument is None else "{}({})".format(name, argument))
+        path.reverse()
+        return path
+
+class SearchBudgetExceeded(Exception):
+    def __init__(self, max_nodes):
+        Exception.__init__(self, "Search stopped after {} states".format(max_nodes))
+
+def state_square(state, index):
+    return int.from_bytes(state[3][index*4:index*4+4], sys.byteorder, signed=True)
+
+def solve_test(level_data, test_id, max_nodes=DEFAULT_MAX_NODES, weight=1):
+    result = {
+        "test": test_id,
+        "solvable": None,  # Unknown when the budget ran out
+        "actions": None,
+        "solution": None,
+        "nodes": 0,
+        "time": 0.0,
+    }
+    start = time.perf_counter()
+    solver = Solver(level_data, test_id, max_nodes, weight)
+    try:
+        solution = solver.solve()
+        result["solvable"] = solution is not None
+        if solution is not None:
+            result["actions"] = len(solution)
+            result["solution"] = solution
+    except SearchBudgetExceeded as e:
+        result["error"] = str(e)
+    result["nodes"] = solver.nodes
+    result["time"] = time.perf_counter() - start
+    return result
+
+shape_names = {
+    grid_info.SHAPE_TRIANGLE: "triangle",
+    grid_info.SHAPE_SQUARE: "square",
+    grid_info.SHAPE_CIRCLE: "circle",
+}
+move_offsets = {"up": (0, -1), "down": (0, 1), "left": (-1, 0), "right": (1, 0)}
+unchangeable_types = (grid_info.WALL, grid_info.WINNING_SQUARE, grid_info.PAINTED)  # No robot function changes them
+
+def get_reachable(level_data):
+    """Squares (x, y) the robot can get to with the allowed moves. Moves ignore the grid contents."""
+    width, height = level_data["size"]["width"], level_data["size"]["height"]
+    allowed_functions = level_data.get("allowed_functions", {})
+    offsets = [offset for name, offset in move_offsets.items() if allowed_functions.get(name, True)]
+    start = (level_data["spawn"]["x"], level_data["spawn"]["y"])
+    reachable = {start}
+    to_visit = [start]
+    while to_visit:
+        x, y = to_visit.pop()
+        for dx, dy in offsets:
+            position = (x + dx, y + dy)
+            if 1 <= position[0] <= width and 1 <= position[1] <= height and position not in reachable:
+                reachable.add(position)
+                to_visit.append(position)
+    return reachable
+
+def is_item(square_type):
+    return bool(square_type & grid_info.SHAPE_CIRCLE) and not square_type & (grid_info.HOLE | grid_info.NUMBER)
+
+def find_test_problem(level_data, test_id):
+    """Quick checks for tests that obviously can't be solved. Returns a short description of the first problem found, or None."""
+    test = level_data["tests"][test_id]
+    width, height = level_data["size"]["width"], level_data["size"]["height"]
+    spawn = level_data["spawn"]
+    if not (1 <= spawn["x"] <= width and 1 <= spawn["y"] <= height):
+        return "Spawn outside of the grid"
+
+    reachable = get_reachable(level_data)
+    if any(test["shown"][y-1][x-1] == grid_info.WINNING_SQUARE for x, y in reachable):
+        return None
+
+    allowed_functions = level_data.get("allowed_functions", {})
+    needed_functions = set()
+    supply = dict.fromkeys(shape_names, 0)
+    demand = dict.fromkeys(shape_names, 0)
+    for y in range(height):
+        for x in range(width):
+            shown_type, wanted_type = test["shown"][y][x], test["wanted"][y][x]
+            if shown_type == wanted_type:
+                continue
+            if (x+1, y+1) not in reachable:
+                return "Square ({}, {}) can't be reached".format(x+1, y+1)
+
+            if shown_type in unchangeable_types or wanted_type in (grid_info.WALL, grid_info.WINNING_SQUARE, grid_info.MARKER):
+                return "Square ({}, {}) can't change".format(x+1, y+1)
+            elif wanted_type == grid_info.PAINTED:
+                if shown_type != grid_info.MARKER:
+                    return "Square ({}, {}) has no marker to paint".format(x+1, y+1)
+                needed_functions.add("paint")
+            elif shown_type == grid_info.MARKER or shown_type & grid_info.NUMBER and not wanted_type & grid_info.NUMBER:
+                return "Square ({}, {}) can't change".format(x+1, y+1)
+            elif wanted_type & grid_info.NUMBER:
+                needed_functions.add("write_number")
+                if shown_type != grid_info.EMPTY and not shown_type & grid_info.NUMBER:
+                    needed_functions.update(("grab", "release"))  # The item has to go first
+                    if is_item(shown_type):
+                        supply[shown_type & grid_info.SHAPE_CIRCLE] += 1
+            else:
+                needed_functions.update(("grab", "release"))
+                if is_item(shown_type):
+                    supply[shown_type & grid_info.SHAPE_CIRCLE] += 1
+                if is_item(wanted_type) or wanted_type == shown_type | grid_info.FILLED:
+                    demand[wanted_type & grid_info.SHAPE_CIRCLE] += 1
+
+    for name in sorted(needed_functions):
+        if not allowed_functions.get(name, True):
+            return "{}() is needed but not allowed".format(name)
+    for shape, name in shape_names.items():
+        if demand[shape] > supply[shape]:
+            return "Not enough {}s, {} needed and {} available".format(name, demand[shape], supply[shape])
+    return None
+
+def check_test(level_data, test_id, max_nodes=DEFAULT_MAX_NODES, weight=1):
+    """Quick checks, then a bounded search. Returns a result like solve_test's, with a "problem" when the quick checks found one."""
+    problem = find_test_problem(level_data, test_id)
+    if problem is not None:
+        return {"test": test_id, "solvable": False, "actions": None, "problem": problem}
+    return solve_test(level_data, test_id, max_nodes, weight)
+
+def solve_level(level_data, max_nodes=DEFAULT_MAX_NODES):
+    results = [solve_test(level_data, i, max_nodes) for i in range(len(level_data["tests"]))]
+    solvable = [result["solvable"] for result in results]
+    return {
+        "solvable": False if False in solvable else None if None in solvable else True,
+        "actions": sum(result["actions"] or 0 for result in results),
+        "tests": results,
+    }
+
+def count_state_actions(result):
+    functions = result.get("profile", {}).get("functions", {})
+    return sum(functions.get(name, 0) for name, _ in solver_actions)
+
+def rank_programs(level_data, programs, max_nodes=DEFAULT_MAX_NODES, limits=None):
+    """Grades every program and sorts them by how close their actions come to the optimum, passing programs first."""
+    solutions = solve_level(level_data, max_nodes)
+    ranking = []
+    for name, program_source in programs:
+        grade = runner.grade_program(level_data, program_source, limits, profile=True)
+        efficiencies = []
+        for result, solution in zip(grade["tests"], solutions["tests"]):
+            result["state_actions"] = count_state_actions(result)
+            result["optimal_actions"] = solution["actions"]
+            if result["passed"] and solution["actions"] is not None:
+                efficiencies.append(solution["actions"] / result["state_actions"] if result["state_actions"] else 1.0)
+            result.pop("profile")
+        ranking.append({
+            "program": name,
+            "passed": grade["passed"],
+            "efficiency": sum(efficiencies) / len(efficiencies) if efficiencies else 0.0,
+            "tests": grade["tests"],
+        })
+    ranking.sort(key=lambda entry: (not entry["passed"], -entry["efficiency"]))
+    return ranking
+
+def solve_command(args):
+    all_solvable = True
+    for level_folder in args.level_folders:
+        solutions = solve_level(runner.load_level(level_folder), args.max_nodes)
+        solutions["level"] = level_folder
+        if not args.solutions:
+            for result in solutions["tests"]:
+                result.pop("solution")
+        all_solvable = all_solvable and solutions["solvable"] is True
+        print(dumps(solutions), flush=True)
+    return 0 if all_solvable else 1
+
+def rank_command(args):
+    level_data = runner.load_level(args.level_folder)
+    programs = []
+    for program_path in args.programs:
+        with open(program_path) as f:
+            programs.append((program_path, f.read()))
+    dump(rank_programs(level_data, programs, args.max_nodes, runner.limits_from_args(args)), sys.stdout, indent=4)
+    print()
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(prog="AlgorNX_solver", description="Find the fewest robot actions solving the tests of AlgorNX levels")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    solve_parser = subparsers.add_parser("solve", help="solve every test of the levels, printing one JSON line per level; fails unless all are proven solvable")
+    solve_parser.add_argument("level_folders", nargs="+")
+    solve_parser.add_argument("--max-nodes", type=int, default=DEFAULT_MAX_NODES, help="states kept per test before giving up")
+    solve_parser.add_argument("--solutions", action="store_true", help="include the action sequences")
+    solve_parser.set_defaults(handler=solve_command)
+
+    rank_parser = subparsers.add_parser("rank", help="grade programs and rank them against the optimal number of actions")
+    rank_parser.add_argument("level_folder")
+    rank_parser.add_argument("programs", nargs="+")
+    rank_parser.add_argument("--max-nodes", type=int, default=DEFAULT_MAX_NODES, help="states kept per test before giving up")
+    runner.add_limit_arguments(rank_parser, sandbox=False)
+    rank_parser.set_defaults(handler=rank_command)
+
+    args = parser.parse_args()
+    sys.exit(args.handler(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Benchmarks of the runner, the renderer and level loading.
+
+Run from anywhere with `python benchmarks/run.py`. Results are printed as JSON and can be written
+with --output, then compared to a stored run with --baseline: the exit code is 1 when a result got
+worse than the baseline by more than --tolerance.
+"""
+import os, sys
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # Headless, also on CI
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+root_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_folder)
+os.chdir(root_folder)  # The game finds its images and font relative to the working directory
+
+from copy import deepcopy
+from json import load, dump
+import argparse
+import ast
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+
+import grid_info
+import AlgorNX_runner as runner
+from benchmarks import synthetic
+
+benchmarks = []
+
+def benchmark(function):
+    benchmarks.append(function)
+    return function
+
+def measure(function, repeat):
+    """Median wall time of `repeat` calls, in seconds."""
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def higher(value, unit):
+    return {"value": value, "unit": unit, "better": "higher"}
+
+def lower(value, unit):
+    return {"value": value, "unit": unit, "better": "lower"}
+
+@benchmark
+def runner_steps(repeat):
+    level_data = synthetic.make_level()
+    results = {}
+    for name in synthetic.programs:
+        program_source = synthetic.make_program(name)
+        steps = runner.grade_program(level_data, program_source)["steps"]  # Also compiles it outside of the measure
+        duration = measure(lambda: runner.grade_program(level_data, program_source), repeat)
+        results[name] = higher(steps / duration, "steps/s")
+    return results
+
+@benchmark
+def render_fps(repeat):
+    try:
+        import pygame
+        import AlgorNX
+    except ImportError as e:
+        return {"skipped": str(e)}
+
+    grid_size = (synthetic.SIZE + 1) * grid_info.IMAGE_SIZE
+    pygame.display.set_mode((grid_size, grid_size))
+    AlgorNX.images.convert_images()
+    frames = 100
+    results = {}
+    for name, size in (("draw_test_on_surface", synthetic.SIZE), ("draw_test_on_surface_large", synthetic.LARGE_SIZE)):
+        viewport = AlgorNX.Viewport(pygame.Surface((grid_size, grid_size)), size, size)
+        squares = grid_info.grid_to_array(synthetic.make_render_grid(size, size))
+        def draw_frames():
+            for i in range(frames):
+                viewport.follow(1 + i % size, 1 + i % size)  # Scrolls through large grids
+                AlgorNX.draw_test_on_surface(viewport, squares, {"x": 1 + i % size, "y": 1 + i % size}, "right")
+        results[name] = higher(frames / measure(draw_frames, repeat), "frames/s")
+
+    # A robot walking along the first line, painting one square per frame
+    viewport = AlgorNX.Viewport(pygame.Surface((grid_size, grid_size)), synthetic.SIZE, synthetic.SIZE)
+    squares = grid_info.grid_to_array(synthetic.make_render_grid(synthetic.SIZE, synthetic.SIZE))
+    def update_frames():
+        AlgorNX.draw_test_on_surface(viewport, squares, {"x": 1, "y": 1}, "right")
+        for i in range(frames):
+            x = 1 + i % synthetic.SIZE
+            squares[x-1] = grid_info.PAINTED
+            AlgorNX.draw_test_changes_on_surface(viewport, squares, {"x": x, "y": 1}, "right", {x-1})
+    results["draw_test_changes_on_surface"] = higher(frames / measure(update_frames, repeat), "frames/s")
+    return results
+
+@benchmark
+def game_idle(repeat):
+    """Frames the game draws and skips while nobody touches it."""
+    try:
+        import pygame
+        import AlgorNX
+    except ImportError as e:
+        return {"skipped": str(e)}
+
+    level_folder = tempfile.mkdtemp(prefix="algornx_benchmark_")
+    try:
+        with open(os.path.join(level_folder, "level.json"), "w") as f:
+            dump(synthetic.make_level(), f)
+        with open(os.path.join(level_folder, "program.py"), "w") as f:
+            f.write(synthetic.make_program("calls"))
+        hits, misses = AlgorNX.images.text_cache_hits, AlgorNX.images.text_cache_misses
+        game = AlgorNX.AlgorNX(level_folder)
+        pygame.time.set_timer(pygame.QUIT, 1000, 1)
+        game.mainloop()
+        return {
+            "frames_drawn": lower(game.frames_drawn, "frames"),
+            "frames_skipped": higher(game.frames_skipped, "frames"),
+            "text_cache_hits": higher(AlgorNX.images.text_cache_hits - hits, "texts"),
+            "text_cache_misses": lower(AlgorNX.images.text_cache_misses - misses, "texts"),
+        }
+    finally:
+        shutil.rmtree(level_folder)
+
+@benchmark
+def level_loading(repeat):
+    level_folder = tempfile.mkdtemp(prefix="algornx_benchmark_")
+    try:
+        with open(os.path.join(level_folder, "level.json"), "w") as f:
+            dump(synthetic.make_level(), f, sort_keys=True, indent=4)
+        with open(os.path.join(level_folder, "program.py"), "w") as f:
+            f.write(synthetic.make_large_program())
+        return {
+            "load_level": lower(measure(lambda: runner.load_level(level_folder), repeat * 10), "s"),
+            "load_program": lower(measure(lambda: runner.load_program(level_folder), repeat * 10), "s"),
+        }
+    finally:
+        shutil.rmtree(level_folder)
+
+@benchmark
+def validation(repeat):
+    level_data = synthetic.make_level(tests=1)
+    program_source = synthetic.make_large_program()
+    tree = ast.parse(program_source, filename="program.py", mode="exec")
+    def cached_get():
+        runner.program_cache.get(program_source, level_data)
+    runner.program_cache.get(program_source, level_data)
+    return {
+        "source_lines": {"value": program_source.count("\n"), "unit": "lines"},
+        "parse": lower(measure(lambda: ast.parse(program_source, filename="program.py", mode="exec"), repeat), "s"),
+        "validate": lower(measure(lambda: runner.ProgramValidator().validate(tree, level_data["allowed_keywords"]), repeat), "s"),
+        "compile": lower(measure(lambda: runner.compile_program(deepcopy(tree)), repeat), "s"),
+        "cache_hit": lower(measure(cached_get, repeat * 10), "s"),
+    }
+
+def compare(results, baseline, tolerance):
+    """Names of the results worse than the baseline by more than `tolerance` (a fraction)."""
+    regressions = []
+    for group, measures in results.items():
+        for name, result in measures.items():
+            old = baseline.get(group, {}).get(name)
+            if not isinstance(result, dict) or "better" not in result or not isinstance(old, dict) or not old.get("value"):
+                continue
+            change = result["value"] / old["value"] - 1
+            result["change"] = change
+            if (result["better"] == "higher" and change < -tolerance) or (result["better"] == "lower" and change > tolerance):
+                regressions.append("{}.{}".format(group, name))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the AlgorNX benchmarks")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each measure, the median is kept")
+    parser.add_argument("--only", action="append", default=None, choices=[function.__name__ for function in benchmarks], help="run only this benchmark, can be repeated")
+    parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="JSON file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline, as a fraction")
+    args = parser.parse_args()
+
+    results = {}
+    for function in benchmarks:
+        if args.only is None or function.__name__ in args.only:
+            results[function.__name__] = function(args.repeat)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, load(f)["results"], args.tolerance)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": args.repeat,
+        "results": results,
+        "regressions": regressions,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            dump(report, f, sort_keys=True, indent=4)
+    dump(report, sys.stdout, sort_keys=True, indent=4)
+    print()
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
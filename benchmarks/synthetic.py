@@ -0,0 +1,105 @@
+"""Synthetic levels and programs for the benchmarks, always the same for the same arguments."""
+import random
+import grid_info
+
+SIZE = 21  # Fixed rather than LEVEL_MAX_SIZE, so results stay comparable
+LARGE_SIZE = 500
+
+# Everything allowed, as in a new level of the level builder (not imported from there, it needs Tk)
+allowed_functions = dict.fromkeys([
+    "up", "down", "left", "right", "column", "line", "on_painted", "paint", "grab", "release", "read_number",
+    "write_number", "on_item", "on_hole", "on_triangle", "on_square", "on_circle", "on_filled_shape", "on_dotted_shape",
+], True)
+allowed_keywords = dict.fromkeys(["for", "def", "set", "list", "dict", "if", "else", "while", "not", "and", "or", "break", "continue", "[", "{"], True)
+
+def make_grid(width, height, rng, square_types):
+    return [[rng.choice(square_types) for x in range(width)] for y in range(height)]
+
+def make_level(width=SIZE, height=SIZE, tests=8, seed=0):
+    """Level whose tests have a marker on every square not painted yet, all to be painted."""
+    rng = random.Random(seed)
+    level_tests = []
+    for i in range(tests):
+        shown = [[grid_info.MARKER] * width for y in range(height)]
+        wanted = [[grid_info.PAINTED] * width for y in range(height)]
+        # Some squares already painted, so grids aren't all the same
+        for j in range(width * height // 10):
+            x, y = rng.randrange(width), rng.randrange(height)
+            shown[y][x] = grid_info.PAINTED
+        level_tests.append({"shown": shown, "wanted": wanted})
+    return {
+        "size": {"width": width, "height": height},
+        "spawn": {"x": 1, "y": 1},
+        "tests": level_tests,
+        "allowed_functions": dict(allowed_functions),
+        "allowed_keywords": dict(allowed_keywords),
+        "description": "Synthetic benchmark level",
+        "version": "0",
+    }
+
+def make_render_grid(width=SIZE, height=SIZE, seed=0):
+    """Grid using every square type that has an image."""
+    return make_grid(width, height, random.Random(seed), [square_type for square_type in grid_info.grid_types if square_type in grid_info.reversed_names])
+
+# Programs for make_level's levels, each exercising a different part of the stepping engine
+programs = {
+    # Plain loops and robot calls
+    "snake": """
+def paint_line():
+    for x in range(column(), {width}):
+        if not on_painted():
+            paint()
+        right()
+    if not on_painted():
+        paint()
+
+for y in range(1, {height} + 1):
+    paint_line()
+    while column() > 1:
+        left()
+    if y < {height}:
+        down()
+""",
+    # Many small user function calls
+    "calls": """
+def add(a, b):
+    return a + b
+
+def fib(n):
+    if n < 2:
+        return n
+    return add(fib(n - 1), fib(n - 2))
+
+for i in range({height}):
+    fib(12)
+""",
+    # Containers and comprehensions
+    "lists": """
+values = []
+for y in range({height}):
+    for x in range({width}):
+        values.append(x * y)
+squares = [value * value for value in values]
+totals = {{}}
+for value in squares:
+    totals[value % 7] = totals.get(value % 7, 0) + value
+""",
+}
+
+def make_program(name, width=SIZE, height=SIZE):
+    return programs[name].format(width=width, height=height)
+
+def make_large_program(functions=500, lines_per_function=10):
+    """Long but valid source, for validation and compile times."""
+    lines = []
+    for i in range(functions):
+        lines.append("def function_{}(a, b):".format(i))
+        for j in range(lines_per_function):
+            lines.append("    if a > {}:".format(j))
+            lines.append("        b = b + a * {}".format(j))
+        lines.append("    return b")
+        lines.append("")
+    lines.append("total = 0")
+    lines.append("for i in range({}):".format(functions))
+    lines.append("    total = total + function_{}(i, total)".format(functions - 1))
+    return "\n".join(lines) + "\n"
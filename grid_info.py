@@ -1,3 +1,5 @@
+from array import array
+
 images_names = [
     "grid_empty",
 
@@ -24,7 +26,8 @@ images_names = [
 ]
 
 
-LEVEL_MAX_SIZE = 21
+LEVEL_MAX_SIZE = 1024
+EDITOR_MAX_SIZE = 21  # The level builder shows every square at once
 IMAGE_SIZE = 20
 
 EMPTY = 0
@@ -72,11 +75,152 @@ grid_types = [
 
 reversed_names = {type: name for type, name in zip(grid_types, images_names)}
 
+# Squares are signed 32 bit integers, the number goes above the 9 flag bits
+NUMBER_MIN = -(1 << 22)
+NUMBER_MAX = (1 << 22) - 1
+
 def square_number_set(number):
     return NUMBER | (number << 9)
 
 def square_number_get(square_type):
     return (square_type & ~NUMBER) >> 9
 
+def check_numbers(grid):
+    """Raises if a square of the grid (list of lines) has a number out of NUMBER_MIN..NUMBER_MAX."""
+    for line in grid:
+        for square_type in line:
+            if square_type & NUMBER and not NUMBER_MIN <= square_number_get(square_type) <= NUMBER_MAX:
+                raise Exception("Number {} out of range, numbers go from {} to {}".format(square_number_get(square_type), NUMBER_MIN, NUMBER_MAX))
+
 def get_image_from_type(square_type):
     return reversed_names[square_type]
+
+
+def grid_to_array(grid):
+    # Signed, since negative numbers are stored in the high bits
+    return array("i", (square_type for line in grid for square_type in line))
+
+def array_to_grid(squares, width):
+    return [squares[i:i+width].tolist() for i in range(0, len(squares), width)]
+
+def encode_grid(grid):
+    """Run-length form of a grid, {"runs": [[square_type, count], ...]} read line by line, for big levels."""
+    runs = []
+    for line in grid:
+        for square_type in line:
+            if runs and runs[-1][0] == square_type:
+                runs[-1][1] += 1
+            else:
+                runs.append([square_type, 1])
+    return {"runs": runs}
+
+def decode_grid(data, width):
+    """Grid as a list of lines, from either that or the run-length form of encode_grid."""
+    if not isinstance(data, dict):
+        return data
+    squares = array("i")
+    for square_type, count in data["runs"]:
+        squares.extend(array("i", [square_type]) * count)
+    return array_to_grid(squares, width)
+
+
+# Bitboards: one int per flag bit, with bit y*width + x set when that square has the flag, and the
+# numbers on their own plane. Whole-grid questions become a few big int operations.
+
+FLAG_BITS = 9  # Bits below the number data
+SHAPE_BITS = SHAPE_CIRCLE
+
+if hasattr(int, "bit_count"):
+    def popcount(mask):
+        return mask.bit_count()
+else:
+    def popcount(mask):
+        return bin(mask).count("1")
+
+def mask_indices(mask):
+    """Indices of the squares set in a mask, in increasing order."""
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+class Bitboards():
+    __slots__ = ("width", "height", "layers", "numbers")
+
+    def __init__(self, width, height, layers, numbers):
+        self.width = width
+        self.height = height
+        self.layers = layers  # layers[bit] is the mask of the squares with flag 1 << bit
+        self.numbers = numbers  # {index: number} for the squares with NUMBER
+
+    def full(self):
+        return (1 << self.width * self.height) - 1
+
+    def with_flags(self, flags):
+        """Mask of the squares having every bit of `flags`."""
+        mask = self.full()
+        for bit in range(FLAG_BITS):
+            if flags >> bit & 1:
+                mask &= self.layers[bit]
+        return mask
+
+    def with_type(self, square_type):
+        """Mask of the squares of exactly this type."""
+        mask = self.full()
+        for bit in range(FLAG_BITS):
+            if square_type >> bit & 1:
+                mask &= self.layers[bit]
+            else:
+                mask &= ~self.layers[bit]
+        if square_type & NUMBER:
+            number = square_number_get(square_type)
+            mask &= sum(1 << index for index in mask_indices(mask) if self.numbers[index] == number)
+        return mask
+
+    def with_shape(self, shape):
+        """Mask of the squares holding `shape` (SHAPE_TRIANGLE, SHAPE_SQUARE or SHAPE_CIRCLE), filled, dotted or hole."""
+        low, high = self.layers[2], self.layers[3]
+        if shape == SHAPE_TRIANGLE:
+            return low & ~high
+        elif shape == SHAPE_SQUARE:
+            return high & ~low
+        return low & high
+
+    def unfilled_holes(self):
+        return self.layers[5] & ~self.layers[4]
+
+    def diff(self, other):
+        """Mask of the squares that differ between two bitboards of the same size."""
+        mask = 0
+        for layer, other_layer in zip(self.layers, other.layers):
+            mask |= layer ^ other_layer
+        both_numbers = self.layers[8] & other.layers[8]
+        for index in mask_indices(both_numbers):
+            if self.numbers[index] != other.numbers[index]:
+                mask |= 1 << index
+        return mask
+
+    def key(self):
+        """Hashable value, equal for equal grids."""
+        return tuple(self.layers) + tuple(sorted(self.numbers.items()))
+
+    def to_array(self):
+        squares = array("i", bytes(4 * self.width * self.height))
+        for bit, layer in enumerate(self.layers):
+            for index in mask_indices(layer):
+                squares[index] |= 1 << bit
+        for index, number in self.numbers.items():
+            squares[index] = square_number_set(number)
+        return squares
+
+def array_to_bitboards(squares, width):
+    reversed_squares = squares[::-1]  # The last square goes to the highest bit
+    layers = []
+    for bit in range(FLAG_BITS):
+        flag = 1 << bit
+        layers.append(int("0" + "".join(["1" if square_type & flag else "0" for square_type in reversed_squares]), 2))
+    numbers = {index: square_number_get(square_type) for index, square_type in enumerate(squares) if square_type & NUMBER}
+    return Bitboards(width, len(squares) // width, layers, numbers)
+
+def grid_to_bitboards(grid):
+    return array_to_bitboards(grid_to_array(grid), len(grid[0]))
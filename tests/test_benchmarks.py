@@ -0,0 +1,55 @@
+import os, sys
+import json
+import subprocess
+import tempfile
+import unittest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import AlgorNX_runner as runner
+from benchmarks import synthetic
+from benchmarks import run
+
+class SyntheticTest(unittest.TestCase):
+    def test_deterministic(self):
+        self.assertEqual(synthetic.make_level(5, 4, tests=2), synthetic.make_level(5, 4, tests=2))
+        self.assertNotEqual(synthetic.make_level(5, 4, tests=2), synthetic.make_level(5, 4, tests=2, seed=1))
+
+    def test_programs_run(self):
+        level_data = synthetic.make_level(5, 4, tests=1)
+        for name in synthetic.programs:
+            result = runner.run_test(level_data, 0, synthetic.make_program(name, 5, 4))
+            self.assertIsNone(result["error"], name)
+        self.assertIsNone(runner.run_test(level_data, 0, synthetic.make_large_program(10, 3))["error"])
+
+class CompareTest(unittest.TestCase):
+    def test_regressions(self):
+        baseline = {"group": {"speed": run.higher(100.0, "steps/s"), "time": run.lower(1.0, "s"), "count": {"value": 3, "unit": "lines"}}}
+        results = {"group": {"speed": run.higher(85.0, "steps/s"), "time": run.lower(1.3, "s"), "count": {"value": 5, "unit": "lines"}, "new": run.lower(1.0, "s")}}
+        self.assertEqual(run.compare(results, baseline, 0.2), ["group.time"])
+        self.assertAlmostEqual(results["group"]["speed"]["change"], -0.15)
+        self.assertEqual(run.compare(results, baseline, 0.1), ["group.speed", "group.time"])
+        self.assertEqual(run.compare(results, {}, 0.1), [])
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as folder:
+            output = os.path.join(folder, "results.json")
+            command = [sys.executable, os.path.join("benchmarks", "run.py"), "--only", "level_loading", "--repeat", "1", "--output", output]
+            process = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+            self.assertEqual(process.returncode, 0, process.stderr)
+            with open(output) as f:
+                report = json.load(f)
+            self.assertEqual(list(report["results"]), ["level_loading"])
+            self.assertEqual(report["results"]["level_loading"]["load_level"]["better"], "lower")
+
+            # Against a baseline that was much faster
+            for result in report["results"]["level_loading"].values():
+                result["value"] /= 100
+            with open(output, "w") as f:
+                json.dump(report, f)
+            process = subprocess.run(command[:-2] + ["--baseline", output], cwd=ROOT, capture_output=True, text=True)
+            self.assertEqual(process.returncode, 1)
+            self.assertEqual(sorted(json.loads(process.stdout)["regressions"]), ["level_loading.load_level", "level_loading.load_program"])
+
+if __name__ == "__main__":
+    unittest.main()
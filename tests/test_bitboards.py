@@ -0,0 +1,68 @@
+import os, sys
+import random
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import grid_info
+import AlgorNX_runner as runner
+
+def make_grid(rng, width, height):
+    square_types = grid_info.grid_types[:-1] + [grid_info.square_number_set(number) for number in (-3, 0, 5, grid_info.NUMBER_MAX)]
+    return [[rng.choice(square_types) for x in range(width)] for y in range(height)]
+
+def count_squares(test, predicate):
+    return sum(bool(predicate(shown, wanted)) for shown_line, wanted_line in zip(test["shown"], test["wanted"]) for shown, wanted in zip(shown_line, wanted_line))
+
+def get_test_stats(test):
+    """What runner.get_test_stats computes, one square at a time."""
+    return {
+        "squares_to_change": count_squares(test, lambda shown, wanted: shown != wanted),
+        "markers": count_squares(test, lambda shown, wanted: shown == grid_info.MARKER),
+        "markers_to_paint": count_squares(test, lambda shown, wanted: shown == grid_info.MARKER and wanted == grid_info.PAINTED),
+        "items": count_squares(test, lambda shown, wanted: not shown & grid_info.NUMBER and shown & grid_info.SHAPE_BITS and not shown & grid_info.HOLE),
+        "holes": count_squares(test, lambda shown, wanted: not shown & grid_info.NUMBER and shown & grid_info.HOLE),
+        "holes_to_fill": count_squares(test, lambda shown, wanted: not shown & grid_info.NUMBER and shown & (grid_info.HOLE | grid_info.FILLED) == grid_info.HOLE
+                                       and not wanted & grid_info.NUMBER and wanted & (grid_info.HOLE | grid_info.FILLED) == grid_info.HOLE | grid_info.FILLED),
+        "numbers": count_squares(test, lambda shown, wanted: shown & grid_info.NUMBER),
+        "numbers_to_write": count_squares(test, lambda shown, wanted: shown != wanted and wanted & grid_info.NUMBER),
+        "walls": count_squares(test, lambda shown, wanted: shown == grid_info.WALL),
+        "winning_squares": count_squares(test, lambda shown, wanted: shown == grid_info.WINNING_SQUARE),
+    }
+
+class BitboardsTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(0)
+
+    def test_test_stats(self):
+        for width, height in ((1, 1), (7, 3), (40, 25)):
+            test = {"shown": make_grid(self.rng, width, height), "wanted": make_grid(self.rng, width, height)}
+            self.assertEqual(runner.get_test_stats(test), get_test_stats(test))
+            test["wanted"] = [list(line) for line in test["shown"]]
+            self.assertEqual(runner.get_test_stats(test)["squares_to_change"], 0)
+
+    def test_masks(self):
+        grid = make_grid(self.rng, 9, 7)
+        squares = grid_info.grid_to_array(grid)
+        bitboards = grid_info.grid_to_bitboards(grid)
+        for square_type in set(squares):
+            self.assertEqual(list(grid_info.mask_indices(bitboards.with_type(square_type))), [i for i, other in enumerate(squares) if other == square_type])
+        for shape in (grid_info.SHAPE_TRIANGLE, grid_info.SHAPE_SQUARE, grid_info.SHAPE_CIRCLE):
+            expected = [i for i, square_type in enumerate(squares) if not square_type & grid_info.NUMBER and square_type & grid_info.SHAPE_BITS == shape]
+            self.assertEqual(list(grid_info.mask_indices(bitboards.with_shape(shape))), expected)
+        self.assertEqual(grid_info.popcount(bitboards.full()), len(squares))
+
+    def test_diff_and_key(self):
+        grid = make_grid(self.rng, 6, 6)
+        other = [list(line) for line in grid]
+        other[2][3] = grid_info.square_number_set(grid_info.square_number_get(grid[2][3]) - 1) if grid[2][3] & grid_info.NUMBER else grid_info.square_number_set(1)
+        bitboards, other_bitboards = grid_info.grid_to_bitboards(grid), grid_info.grid_to_bitboards(other)
+        self.assertEqual(list(grid_info.mask_indices(bitboards.diff(other_bitboards))), [2 * 6 + 3])
+        self.assertNotEqual(bitboards.key(), other_bitboards.key())
+        self.assertEqual(bitboards.key(), grid_info.grid_to_bitboards([list(line) for line in grid]).key())
+
+    def test_to_array(self):
+        grid = make_grid(self.rng, 11, 4)
+        self.assertEqual(grid_info.grid_to_bitboards(grid).to_array(), grid_info.grid_to_array(grid))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os, sys
+import marshal
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import AlgorNX_runner as runner
+from test_stepping import make_level
+
+class ProgramCacheTest(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = runner.ProgramCache()
+        level_data = make_level()
+        code = cache.get("right()", level_data)
+        self.assertIs(cache.get("right()", level_data), code)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_key_includes_restrictions(self):
+        cache = runner.ProgramCache()
+        level_data = make_level()
+        cache.get("for i in range(2):\n    right()", level_data)
+        level_data["allowed_keywords"]["for"] = False
+        with self.assertRaises(Exception):
+            cache.get("for i in range(2):\n    right()", level_data)
+        self.assertEqual(cache.misses, 2)
+
+    def test_errors_cached(self):
+        cache = runner.ProgramCache()
+        for i in range(2):
+            with self.assertRaisesRegex(Exception, "import"):
+                cache.get("import os", make_level())
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_lru_eviction(self):
+        cache = runner.ProgramCache(max_entries=2)
+        level_data = make_level()
+        cache.get("x = 1", level_data)
+        cache.get("x = 2", level_data)
+        cache.get("x = 1", level_data)  # Now the most recent
+        cache.get("x = 3", level_data)
+        self.assertEqual(list(cache.entries), [runner.get_program_key(source, level_data) for source in ("x = 1", "x = 3")])
+
+    def test_save_and_load(self):
+        level_data = make_level(2)
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "cache")
+            cache = runner.ProgramCache()
+            cache.load(path)  # Missing file, nothing loaded
+            cache.get("right()", level_data)
+            with self.assertRaises(Exception):
+                cache.get("import os", level_data)
+            self.assertEqual(len(cache.unsaved), 2)
+            cache.save()
+            self.assertEqual(cache.unsaved, set())
+
+            loaded = runner.ProgramCache()
+            loaded.load(path)
+            self.assertEqual(list(loaded.entries), list(cache.entries))
+            program_runner = runner.ProgramRunner(level_data, 0, loaded.get("right()", level_data))
+            while not program_runner.program_done:
+                program_runner.update()
+            self.assertEqual(program_runner.robot.x, 2)
+            self.assertEqual(loaded.misses, 0)
+            with self.assertRaisesRegex(Exception, "import"):
+                loaded.get("import os", level_data)
+
+            # Files written by another Python version are ignored
+            with open(path, "wb") as f:
+                marshal.dump({"tag": "other", "entries": [(key, None, None) for key in cache.entries]}, f)
+            other = runner.ProgramCache()
+            other.load(path)
+            self.assertEqual(len(other.entries), 0)
+
+    def test_merge(self):
+        level_data = make_level()
+        worker_cache = runner.ProgramCache()
+        worker_cache.path = "unused"  # Only tracks the unsaved entries
+        worker_cache.get("right()", level_data)
+        cache = runner.ProgramCache()
+        cache.merge(worker_cache.pop_unsaved())
+        self.assertEqual(worker_cache.pop_unsaved(), {})
+        cache.get("right()", level_data)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+if __name__ == "__main__":
+    unittest.main()
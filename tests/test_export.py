@@ -0,0 +1,76 @@
+import os, sys
+import random
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # The images are found relative to the game folder
+
+import pygame
+import AlgorNX_export as export
+
+def lzw_decode(data, min_code_size):
+    """Reference GIF LZW decoder, the one of the GIF specification."""
+    clear_code = 1 << min_code_size
+    end_code = clear_code + 1
+    bits = int.from_bytes(data, "little")
+    position = 0
+    out = []
+    table = None
+    previous = None
+    code_size = min_code_size + 1
+    while True:
+        code = bits >> position & ((1 << code_size) - 1)
+        position += code_size
+        if code == clear_code:
+            table = [[i] for i in range(clear_code)] + [None, None]
+            code_size = min_code_size + 1
+            previous = None
+            continue
+        if code == end_code:
+            return out
+        if previous is None:
+            entry = table[code]
+        else:
+            entry = table[code] if code < len(table) else previous + previous[:1]
+            table.append(previous + entry[:1])
+            if len(table) == 1 << code_size and code_size < 12:
+                code_size += 1
+        out.extend(entry)
+        previous = entry
+
+class ExportTest(unittest.TestCase):
+    def test_lzw_round_trip(self):
+        rng = random.Random(0)
+        for min_code_size in (2, 5, 8):
+            for indices in (
+                [rng.randrange(1 << min_code_size) for i in range(20000)],  # Past 4096 codes, with clear codes
+                [1] * 5000,
+                [0, 1] * 3000 + [3] * 10,
+                [2],
+            ):
+                self.assertEqual(lzw_decode(export.lzw_encode(indices, min_code_size), min_code_size), indices)
+
+    def test_gif_writer(self):
+        palette = [(0, 0, 0), (255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 255)]
+        surface = pygame.Surface((40, 30), 0, 8)
+        surface.set_palette(palette)
+        rng = random.Random(1)
+        for x in range(40):
+            for y in range(30):
+                surface.set_at((x, y), palette[rng.randrange(len(palette))])
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "test.gif")
+            writer = export.GifWriter(path, surface.get_size(), palette)
+            writer.add_frame(surface, surface.get_rect(), 5)
+            writer.add_frame(surface, None, 5)  # Only makes the first frame longer
+            writer.add_frame(surface, pygame.Rect(10, 5, 8, 4), 5)
+            writer.close(100)
+            self.assertEqual(writer.frames, 2)
+            loaded = pygame.image.load(path)  # First frame
+            self.assertEqual(loaded.get_size(), surface.get_size())
+            for x in range(40):
+                for y in range(30):
+                    self.assertEqual(tuple(loaded.get_at((x, y)))[:3], tuple(surface.get_at((x, y)))[:3])
+
+if __name__ == "__main__":
+    unittest.main()
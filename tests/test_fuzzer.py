@@ -0,0 +1,34 @@
+import os, sys
+import time
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import grid_info
+import AlgorNX_fuzzer as fuzzer
+from test_stepping import make_level
+
+def make_generator_level():
+    level_data = make_level(3)
+    level_data["generator"] = {"reference": "reference.py", "rules": [{"where": [grid_info.EMPTY], "place": [grid_info.PAINTED], "probability": 0.5}]}
+    return level_data
+
+class FuzzerTest(unittest.TestCase):
+    def test_runaway_reference_is_dropped(self):
+        start = time.perf_counter()
+        variants = [fuzzer.generate_variant(make_generator_level(), "while True:\n    pass", 0, index, {"time": 0.2}) for index in range(3)]
+        self.assertEqual(variants, [None] * 3)
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_variants(self):
+        tests = fuzzer.generate_chunk(make_generator_level(), "right()", 0, range(8), {"time": 1})
+        self.assertEqual(len(tests), 8)
+        for test in tests:
+            self.assertEqual(test["shown"], test["wanted"])
+        self.assertEqual(tests, fuzzer.generate_chunk(make_generator_level(), "right()", 0, range(8), {"time": 1}))
+
+    def test_limits_change_the_variants_key(self):
+        level_data = make_generator_level()
+        self.assertNotEqual(fuzzer.get_variants_key(level_data, "", 10, 0), fuzzer.get_variants_key(level_data, "", 10, 0, {"time": 1}))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import os, sys
+import json
+import shutil
+import tempfile
+import time
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # The images are found relative to the game folder
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import AlgorNX
+from benchmarks import synthetic
+
+WIDTH, HEIGHT = 5, 4
+
+def make_game(test_case, program_source, level_data=None):
+    level_folder = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, level_folder)
+    with open(os.path.join(level_folder, "level.json"), "w") as f:
+        json.dump(level_data or synthetic.make_level(WIDTH, HEIGHT, tests=3), f)
+    AlgorNX.save_program(level_folder, program_source)
+    return AlgorNX.AlgorNX(level_folder)
+
+class ValidationTest(unittest.TestCase):
+    def setUp(self):
+        self.messages = []
+
+    def validate(self, game):
+        game.set_message_on_surface = self.messages.append
+        game.validate_program_button_action()
+        game.validation_thread.join(10)
+        self.assertFalse(game.validation_thread.is_alive())
+        game.draw()  # Notices the end of the validation
+        self.assertFalse(game.validating)
+
+    def test_validate(self):
+        game = make_game(self, synthetic.make_program("snake", WIDTH, HEIGHT))
+        self.validate(game)
+        self.assertEqual([result["outcome"] for result in game.validation_results], ["passed"] * 3)
+        self.assertEqual(self.messages, [game.validate_success_text])
+
+    def test_validate_failure(self):
+        game = make_game(self, "right()")
+        self.validate(game)
+        self.assertEqual([result["outcome"] for result in game.validation_results], ["failed"] * 3)
+        self.assertEqual(game.get_validation_status(0)[0], "failed (1 steps)")
+        self.assertEqual(self.messages, [game.validate_failure_text])
+
+    def test_stop_validation(self):
+        game = make_game(self, "while True:\n    pass")
+        game.set_message_on_surface = self.messages.append
+        game.validate_program_button_action()
+        self.assertTrue(game.validating)
+        game.draw()  # Drawing goes on during the validation
+        self.assertTrue(game.validating)
+        game.validate_program_button_action()  # Stop
+        game.validation_thread.join(10)
+        game.draw()
+        self.assertFalse(game.validating)
+        self.assertEqual(game.validation_results[0]["outcome"], "stopped")
+        self.assertEqual(game.validation_results[1:], [None, None])
+        self.assertEqual(self.messages, [game.validate_stopped_text])
+class LayersTest(unittest.TestCase):
+    def count_renders(self, layer):
+        renders = []
+        render = layer.render
+        def counted_render(surface):
+            renders.append(surface)
+            render(surface)
+        layer.render = counted_render
+        return renders
+
+    def test_layer_state(self):
+        layer = AlgorNX.Layer((10, 20, 30, 40), lambda surface: surface.fill((255, 0, 0)))
+        renders = self.count_renders(layer)
+        screen = pygame.Surface((100, 100))
+        self.assertTrue(layer.draw(screen, 1))
+        self.assertEqual(screen.get_at((10, 20))[:3], (255, 0, 0))
+        self.assertEqual(screen.get_at((9, 20))[:3], (0, 0, 0))
+        screen.fill((0, 0, 0))
+        self.assertFalse(layer.draw(screen, 1))
+        self.assertEqual(screen.get_at((10, 20))[:3], (255, 0, 0))  # Blitted again, from the kept surface
+        self.assertTrue(layer.draw(screen, 2))
+        self.assertEqual(len(renders), 2)
+
+    def test_game_layers(self):
+        game = make_game(self, "for i in range(3):\n    right()")
+        buttons_renders = self.count_renders(game.control_buttons_layer)
+        headers_renders = self.count_renders(game.tests_headers_layer)
+        game.draw()
+        game.draw()
+        self.assertEqual((len(buttons_renders), len(headers_renders)), (1, 1))
+
+        game.run_program_button_action()  # The buttons change, not the headers
+        game.draw()
+        self.assertEqual((len(buttons_renders), len(headers_renders)), (2, 1))
+        game.select_speed_mode(AlgorNX.INSTANT_SPEED)
+        game.draw()
+        self.assertEqual((len(buttons_renders), len(headers_renders)), (3, 1))
+
+        game.select_test(1)
+        game.draw()
+        self.assertEqual(len(headers_renders), 2)
+class StepBudgetTest(unittest.TestCase):
+    def start(self, program_source, speed, step_time_budget):
+        game = make_game(self, program_source)
+        game.step_time_budget = step_time_budget
+        game.run_program_button_action()
+        game.select_speed_mode(speed)
+        return game
+
+    def test_instant_speed_within_budget(self):
+        game = self.start("while True:\n    pass", AlgorNX.INSTANT_SPEED, 0.02)
+        start = time.perf_counter()
+        self.assertTrue(game.step_program())
+        self.assertLess(time.perf_counter() - start, 0.5)
+        steps = game.program_runner.lines_executed
+        self.assertGreater(steps, AlgorNX.STEPS_BETWEEN_TIME_CHECKS)
+        self.assertEqual(steps % AlgorNX.STEPS_BETWEEN_TIME_CHECKS, 0)
+        game.run_program_button_action()
+
+    def test_instant_speed_stops_at_the_end(self):
+        game = self.start(synthetic.make_program("snake", WIDTH, HEIGHT), AlgorNX.INSTANT_SPEED, 10.0)
+        self.assertTrue(game.step_program())
+        self.assertTrue(game.program_runner.program_done)
+        self.assertTrue(game.program_runner.is_success())
+
+    def test_completion_speed_draws_at_the_end(self):
+        game = self.start("for i in range(1000):\n    pass\nright()", AlgorNX.COMPLETION_SPEED, 0.0001)
+        drawn = []
+        while not game.program_runner.program_done:
+            drawn.append(game.step_program())
+        self.assertEqual(drawn[-1], True)
+        self.assertNotIn(True, drawn[:-1])
+        self.assertGreater(len(drawn), 1)
+
+    def test_slow_speed_one_step_per_frames(self):
+        game = self.start("for i in range(1000):\n    pass", 0, 1.0)
+        for frame in range(AlgorNX.SLOW_SPEEDS_FRAMES[0] * 2):
+            self.assertTrue(game.step_program())
+            game.framecnt += 1
+        self.assertEqual(game.program_runner.lines_executed, 2)
+class IdleTest(unittest.TestCase):
+    def test_sleeps_when_idle(self):
+        game = make_game(self, "right()")
+        self.assertFalse(game.is_idle())  # The first frame is still to draw
+        pygame.event.clear()
+        pygame.time.set_timer(pygame.QUIT, 600, 1)
+        game.mainloop()
+        self.assertLessEqual(game.frames_drawn, 2)
+        self.assertGreater(game.idle_time, 0.3)
+        self.assertEqual(game.frames_skipped, int(game.idle_time * AlgorNX.FRAME_RATE))
+
+    def test_draws_while_running(self):
+        game = make_game(self, "right()")
+        game.draw()
+        self.assertTrue(game.is_idle())
+        game.run_program_button_action()
+        self.assertFalse(game.is_idle())
+        game.run_program_button_action()
+        game.draw()
+        self.assertTrue(game.is_idle())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import os, sys
+import json
+import shutil
+import subprocess
+import tempfile
+import unittest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import AlgorNX_runner as runner
+from benchmarks import synthetic
+
+WIDTH, HEIGHT = 4, 3
+
+def write_level(folder, level_data):
+    with open(os.path.join(folder, "level.json"), "w") as f:
+        json.dump(level_data, f)
+
+def write_program(folder, name, source):
+    path = os.path.join(folder, name)
+    with open(path, "w") as f:
+        f.write(source)
+    return path
+
+def run_command(*args):
+    process = subprocess.run([sys.executable, "-m", "AlgorNX_runner"] + list(args), cwd=ROOT, capture_output=True, text=True)
+    return process.returncode, process.stdout
+
+class GradeTest(unittest.TestCase):
+    def setUp(self):
+        self.level_data = synthetic.make_level(WIDTH, HEIGHT, tests=2)
+
+    def test_grade_program(self):
+        grade = runner.grade_program(self.level_data, synthetic.make_program("snake", WIDTH, HEIGHT))
+        self.assertTrue(grade["passed"])
+        self.assertEqual([result["outcome"] for result in grade["tests"]], ["passed", "passed"])
+        self.assertEqual(grade["steps"], sum(result["steps"] for result in grade["tests"]))
+
+    def test_failed_and_error_outcomes(self):
+        self.assertEqual(runner.run_test(self.level_data, 0, "right()")["outcome"], "failed")
+        result = runner.run_test(self.level_data, 0, "left()")
+        self.assertEqual(result["outcome"], "error")
+        self.assertEqual(result["error"], "Moving out of the grid!")
+        result = runner.run_test(self.level_data, 0, "import os")
+        self.assertEqual(result["outcome"], "error")
+        self.assertEqual(result["steps"], 0)
+
+    def test_grade_command(self):
+        with tempfile.TemporaryDirectory() as folder:
+            write_level(folder, self.level_data)
+            code, output = run_command("grade", folder, write_program(folder, "good.py", synthetic.make_program("snake", WIDTH, HEIGHT)))
+            self.assertEqual(code, 0)
+            self.assertEqual(len(json.loads(output)["tests"]), 2)
+
+            code, output = run_command("grade", folder, write_program(folder, "bad.py", "right()"))
+            self.assertEqual(code, 1)
+            self.assertFalse(json.loads(output)["passed"])
+
+class BatchGraderTest(unittest.TestCase):
+    def setUp(self):
+        self.folders = [tempfile.mkdtemp() for i in range(2)]
+        for folder in self.folders:
+            write_level(folder, synthetic.make_level(WIDTH, HEIGHT, tests=2))
+
+    def tearDown(self):
+        runner.program_cache.path = None
+        runner.program_cache.unsaved = set()
+        for folder in self.folders:
+            shutil.rmtree(folder)
+
+    def test_results(self):
+        good = synthetic.make_program("snake", WIDTH, HEIGHT)
+        submissions = [(self.folders[0], good), (self.folders[1], "right()"), (self.folders[1], good), (self.folders[0], "import os")]
+        cache_path = os.path.join(self.folders[0], "cache")
+        runner.program_cache.load(cache_path)
+        batch = runner.BatchGrader(submissions, max_workers=2, cache_path=cache_path)
+        grades = {grade["submission"]: grade for grade in batch.results()}
+
+        self.assertEqual(sorted(grades), [0, 1, 2, 3])
+        self.assertEqual([grades[i]["passed"] for i in range(4)], [True, False, True, False])
+        self.assertEqual([grades[i]["level"] for i in range(4)], [folder for folder, program_source in submissions])
+        self.assertEqual(grades[3]["tests"][0]["outcome"], "error")
+        summary = batch.summary()
+        self.assertEqual(summary["submissions"], 4)
+        self.assertGreater(summary["throughput"], 0)
+
+        # The programs the workers compiled are saved by this process
+        cache = runner.ProgramCache()
+        cache.load(cache_path)
+        self.assertIn(runner.get_program_key(good, synthetic.make_level(WIDTH, HEIGHT)), cache.entries)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import os, sys
+import json
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # The images are found relative to the game folder
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+pygame.init()
+import AlgorNX_images as images
+
+class RenderTextTest(unittest.TestCase):
+    def setUp(self):
+        images.text_cache.clear()
+        images.text_cache_hits = 0
+        images.text_cache_misses = 0
+
+    def test_hits_and_misses(self):
+        surface = images.render_text("Step 1/2", (0, 0, 0))
+        self.assertIs(images.render_text("Step 1/2", (0, 0, 0)), surface)
+        self.assertIs(images.render_text("Step 1/2", [0, 0, 0]), surface)  # Colors given as lists too
+        self.assertEqual((images.text_cache_hits, images.text_cache_misses), (2, 1))
+
+    def test_key_has_color_and_antialias(self):
+        surface = images.render_text("Step", (0, 0, 0))
+        self.assertIsNot(images.render_text("Step", (255, 0, 0)), surface)
+        self.assertIsNot(images.render_text("Step", (0, 0, 0), antialias=True), surface)
+        self.assertEqual((images.text_cache_hits, images.text_cache_misses), (0, 3))
+        self.assertEqual(images.render_text("Step", (255, 0, 0)).get_at((0, 0)), images.font.render("Step", False, (255, 0, 0)).get_at((0, 0)))
+
+    def test_least_recently_used_dropped(self):
+        for i in range(images.TEXT_CACHE_SIZE):
+            images.render_text(str(i), (0, 0, 0))
+        images.render_text("0", (0, 0, 0))  # Now the most recently used
+        images.render_text("new", (0, 0, 0))
+        self.assertEqual(len(images.text_cache), images.TEXT_CACHE_SIZE)
+        self.assertIn(("0", (0, 0, 0), False), images.text_cache)
+        self.assertNotIn(("1", (0, 0, 0), False), images.text_cache)
+        misses = images.text_cache_misses
+        images.render_text("1", (0, 0, 0))
+        self.assertEqual(images.text_cache_misses, misses + 1)
+class AtlasTest(unittest.TestCase):
+    def setUp(self):
+        # A copy of the images, and a cache of their own
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        images_folder = os.path.join(folder, "images")
+        shutil.copytree(images.images_folder, images_folder)
+        for name in ("images_folder", "cache_folder", "atlas_path", "atlas_info_path"):
+            self.addCleanup(setattr, images, name, getattr(images, name))
+        images.images_folder = images_folder
+        images.cache_folder = os.path.join(folder, "cache")
+        images.atlas_path = os.path.join(images.cache_folder, "atlas.png")
+        images.atlas_info_path = os.path.join(images.cache_folder, "atlas.json")
+
+        self.builds = 0
+        build_atlas = images.build_atlas
+        def counted_build_atlas(filenames):
+            self.builds += 1
+            return build_atlas(filenames)
+        self.addCleanup(setattr, images, "build_atlas", build_atlas)
+        images.build_atlas = counted_build_atlas
+
+    def image_path(self, name):
+        return os.path.join(images.images_folder, name + ".gif")
+
+    def assertBuilds(self, builds):
+        atlas, rects = images.load_atlas()
+        self.assertEqual(self.builds, builds)
+        return images.get_atlas_images(atlas, rects)
+
+    def test_cached(self):
+        self.assertBuilds(1)
+        self.assertTrue(os.path.exists(images.atlas_path))
+        self.assertBuilds(1)
+
+    def test_touched_image(self):
+        self.assertBuilds(1)
+        stat = os.stat(self.image_path("grid_wall"))
+        os.utime(self.image_path("grid_wall"), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertBuilds(1)
+        with open(images.atlas_info_path) as f:
+            self.assertEqual(json.load(f)["stats"]["grid_wall.gif"][0], stat.st_mtime_ns + 10**9)  # So the file isn't hashed again
+
+    def test_changed_image(self):
+        self.assertBuilds(1)
+        shutil.copyfile(self.image_path("grid_painted"), self.image_path("grid_wall"))
+        atlas_images = self.assertBuilds(2)
+        self.assertEqual(pygame.image.tobytes(atlas_images["grid_wall"], "RGB"), pygame.image.tobytes(atlas_images["grid_painted"], "RGB"))
+
+    def test_added_and_removed_images(self):
+        self.assertBuilds(1)
+        shutil.copyfile(self.image_path("grid_wall"), self.image_path("grid_new"))
+        self.assertIn("grid_new", self.assertBuilds(2))
+        os.remove(self.image_path("grid_new"))
+        self.assertNotIn("grid_new", self.assertBuilds(3))
+
+    def test_other_version(self):
+        self.assertBuilds(1)
+        version = images.ATLAS_VERSION
+        images.ATLAS_VERSION = version + 1
+        try:
+            self.assertBuilds(2)
+        finally:
+            images.ATLAS_VERSION = version
+
+    def test_same_pixels(self):
+        for name, image in self.assertBuilds(1).items():
+            source = pygame.image.load(self.image_path(name))
+            self.assertEqual(image.get_size(), source.get_size())
+            mask = pygame.mask.from_surface(source)
+            for x in range(source.get_width()):
+                for y in range(source.get_height()):
+                    if mask.get_at((x, y)):
+                        self.assertEqual(image.get_at((x, y))[:3], source.get_at((x, y))[:3], name)
+            self.assertEqual(pygame.mask.from_surface(image).count(), mask.count(), name)
+
+if __name__ == "__main__":
+    unittest.main()
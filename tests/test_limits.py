@@ -0,0 +1,77 @@
+import os, sys
+import argparse
+import threading
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import AlgorNX_runner as runner
+from test_stepping import make_level
+
+ENDLESS_COMPREHENSION = "x = [0 for _ in iter(int, 1)]"
+
+class LimitsTest(unittest.TestCase):
+    def run_limited(self, source, limits):
+        return runner.run_test(make_level(3), 0, source, limits=limits)
+
+    def assertLimitExceeded(self, result, limit):
+        self.assertEqual(result["outcome"], "limit_exceeded")
+        self.assertEqual(result["limit"], limit)
+
+    def test_actions_limit_not_caught_by_except_exception(self):
+        result = self.run_limited("while True:\n    try:\n        up()\n    except Exception:\n        pass", {"actions": 100})
+        self.assertLimitExceeded(result, "actions")
+
+    def test_actions_limit_not_caught_by_bare_except(self):
+        result = self.run_limited("while True:\n    try:\n        up()\n    except:\n        pass", {"actions": 100})
+        self.assertLimitExceeded(result, "actions")
+
+    def test_time_limit_in_comprehension(self):
+        self.assertLimitExceeded(self.run_limited(ENDLESS_COMPREHENSION, {"time": 0.2}), "time")
+
+    def test_time_limit_in_comprehension_off_main_thread(self):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(self.run_limited(ENDLESS_COMPREHENSION, {"time": 0.2})))
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertLimitExceeded(results[0], "time")
+
+    def test_time_limit_caught_by_bare_except(self):
+        result = self.run_limited("while True:\n    try:\n        " + ENDLESS_COMPREHENSION + "\n    except:\n        pass", {"time": 0.2})
+        self.assertLimitExceeded(result, "time")
+
+    def test_default_limits_are_finite(self):
+        limits = runner.get_limits(make_level())
+        self.assertIsNotNone(limits["lines"])
+        self.assertIsNotNone(limits["time"])
+        self.assertIsNone(runner.get_limits(make_level(), {"lines": None})["lines"])
+
+    def test_zero_limit_argument_removes_the_limit(self):
+        parser = argparse.ArgumentParser()
+        runner.add_limit_arguments(parser)
+        args = parser.parse_args(["--max-lines", "0", "--max-time", "2"])
+        self.assertEqual(runner.limits_from_args(args), {"lines": None, "time": 2})
+
+    def test_previous_trace_function_kept(self):
+        def tracer(frame, event, arg):
+            return None
+        def target():
+            sys.settrace(tracer)
+            results.append(self.run_limited(ENDLESS_COMPREHENSION, {"time": 0.2}))
+            results.append(sys.gettrace())
+            sys.settrace(None)
+        ctypes = runner.ctypes
+        for watchdog_ctypes in (ctypes, None):  # Timer thread, then trace function
+            runner.ctypes = watchdog_ctypes
+            try:
+                results = []
+                thread = threading.Thread(target=target)
+                thread.start()
+                thread.join(10)
+            finally:
+                runner.ctypes = ctypes
+            self.assertLimitExceeded(results[0], "time")
+            self.assertIs(results[1], tracer)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import os, sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import grid_info
+import AlgorNX_runner as runner
+from benchmarks import synthetic
+
+def make_level(shown, wanted):
+    return {
+        "size": {"width": len(shown[0]), "height": len(shown)},
+        "spawn": {"x": 1, "y": 1},
+        "tests": [{"shown": shown, "wanted": wanted}],
+        "allowed_functions": dict(synthetic.allowed_functions),
+        "allowed_keywords": dict(synthetic.allowed_keywords),
+    }
+
+class MismatchesTest(unittest.TestCase):
+    def assertMismatchesTracked(self, level_data, source):
+        """Runs the program, checking the tracked mismatches against a full comparison after every step."""
+        program_runner = runner.validate_and_start_program(source, level_data, 0)
+        while not program_runner.program_done:
+            program_runner.update()
+            wanted = program_runner.wanted_result
+            self.assertEqual(program_runner.mismatches, {i for i, square_type in enumerate(program_runner.grid) if square_type != wanted[i]})
+        return program_runner
+
+    def test_paint(self):
+        level_data = synthetic.make_level(5, 4, tests=1)
+        program_runner = self.assertMismatchesTracked(level_data, synthetic.make_program("snake", 5, 4))
+        self.assertTrue(program_runner.is_success())
+        self.assertEqual(program_runner.get_mismatches(), [])
+
+    def test_grab_release_and_numbers(self):
+        E = grid_info.EMPTY
+        shape = grid_info.SHAPE_CIRCLE | grid_info.FILLED
+        hole = grid_info.SHAPE_CIRCLE | grid_info.HOLE
+        shown = [[shape, E, hole, E]]
+        wanted = [[E, E, hole | grid_info.FILLED, grid_info.square_number_set(4)]]
+        # Sets the shape down on the way to the hole, then writes a wrong number and fixes it
+        source = "grab()\nright()\nrelease()\ngrab()\nright()\nrelease()\nright()\nwrite_number(3)\nwrite_number(4)"
+        program_runner = self.assertMismatchesTracked(make_level(shown, wanted), source)
+        self.assertTrue(program_runner.is_success())
+
+    def test_remaining_mismatches(self):
+        shown = [[grid_info.MARKER] * 3, [grid_info.MARKER] * 3]
+        wanted = [[grid_info.PAINTED] * 3, [grid_info.PAINTED] * 3]
+        program_runner = self.assertMismatchesTracked(make_level(shown, wanted), "paint()\nright()\npaint()")
+        self.assertFalse(program_runner.is_success())
+        self.assertEqual(program_runner.get_mismatches(), [(1, 2), (2, 2), (3, 1), (3, 2)])
+        result = runner.run_test(make_level(shown, wanted), 0, "paint()\nright()\npaint()")
+        self.assertEqual(result["remaining_squares"], 4)
+        self.assertAlmostEqual(result["progress"], 2 / 6)
+
+    def test_winning_square(self):
+        shown = [[grid_info.EMPTY, grid_info.WINNING_SQUARE, grid_info.MARKER]]
+        wanted = [[grid_info.EMPTY, grid_info.WINNING_SQUARE, grid_info.PAINTED]]
+        self.assertTrue(self.assertMismatchesTracked(make_level(shown, wanted), "right()").is_success())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import os, sys
+import json
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import grid_info
+import AlgorNX_runner as runner
+from test_stepping import make_level, run_program, written_numbers
+
+class NumbersTest(unittest.TestCase):
+    def test_write_number_limits(self):
+        program_runner, lines = run_program("write_number({})\nright()\nwrite_number({})".format(grid_info.NUMBER_MIN, grid_info.NUMBER_MAX), 2)
+        self.assertEqual(written_numbers(program_runner), [grid_info.NUMBER_MIN, grid_info.NUMBER_MAX])
+
+    def test_write_number_out_of_range(self):
+        for number in (10**8, grid_info.NUMBER_MAX + 1, grid_info.NUMBER_MIN - 1):
+            result = runner.run_test(make_level(), 0, "write_number({})".format(number))
+            self.assertEqual(result["outcome"], "error")
+            self.assertIn("numbers go from", result["error"])
+
+    def test_load_level_number_out_of_range(self):
+        level_data = make_level()
+        level_data["tests"][0]["wanted"] = [[grid_info.square_number_set(10**8)]]
+        with tempfile.TemporaryDirectory() as level_folder:
+            with open(os.path.join(level_folder, "level.json"), "w") as f:
+                json.dump(level_data, f)
+            with self.assertRaisesRegex(Exception, "out of range"):
+                runner.load_level(level_folder)
+
+if __name__ == "__main__":
+    unittest.main()
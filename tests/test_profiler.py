@@ -0,0 +1,31 @@
+import os, sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import AlgorNX_runner as runner
+from test_stepping import make_level
+
+PROGRAM = "for i in range(3):\n    right()\nwrite_number(column())\nleft()"
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.result = runner.run_test(make_level(4), 0, PROGRAM, profile=True)
+        self.profile = self.result["profile"]
+
+    def test_lines(self):
+        self.assertEqual({line: counts["hits"] for line, counts in self.profile["lines"].items()}, {"1": 1, "2": 3, "3": 1, "4": 1})
+        self.assertEqual(sum(counts["hits"] for counts in self.profile["lines"].values()), self.result["steps"])
+        self.assertTrue(all(counts["time"] >= 0 for counts in self.profile["lines"].values()))
+
+    def test_functions(self):
+        self.assertEqual(self.profile["functions"], {"column": 1, "left": 1, "right": 3, "write_number": 1})
+
+    def test_square_visits(self):
+        # The spawn square, then one visit per move
+        self.assertEqual(self.profile["square_visits"], [[1, 1, 2, 1]])
+
+    def test_off_by_default(self):
+        self.assertNotIn("profile", runner.run_test(make_level(4), 0, PROGRAM))
+
+if __name__ == "__main__":
+    unittest.main()
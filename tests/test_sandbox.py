@@ -0,0 +1,47 @@
+import os, sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import AlgorNX_sandbox as sandbox
+from test_stepping import make_level
+import grid_info
+
+@unittest.skipUnless(sandbox.resource, "the sandbox limits need the resource module")
+class SandboxPoolTest(unittest.TestCase):
+    def test_result_and_grid(self):
+        with sandbox.SandboxPool(workers=1) as pool:
+            result = pool.run_test(make_level(1), 0, "write_number(7)")
+        self.assertNotEqual(result["outcome"], "error")
+        self.assertEqual(grid_info.square_number_get(result["grid"][0][0]), 7)
+        self.assertNotEqual(result["worker"], os.getpid())
+
+    def test_cpu_limit(self):
+        with sandbox.SandboxPool(workers=1, cpu_limit=0.5) as pool:
+            result = pool.run_test(make_level(1), 0, "while True:\n    pass", limits={"lines": None, "time": None})
+        self.assertEqual(result["outcome"], "limit_exceeded")
+        self.assertEqual(result["limit"], "cpu")
+
+    def test_memory_limit(self):
+        with sandbox.SandboxPool(workers=1, memory_limit=512 * 1024 * 1024) as pool:
+            result = pool.run_test(make_level(1), 0, "x = [0] * (1 << 30)")
+        self.assertEqual(result["outcome"], "limit_exceeded")
+        self.assertEqual(result["limit"], "memory")
+
+    def test_worker_replaced_after_limit(self):
+        level_data = make_level(1)
+        with sandbox.SandboxPool(workers=1, cpu_limit=0.5) as pool:
+            killed = pool.run_test(level_data, 0, "while True:\n    pass", limits={"lines": None, "time": None})
+            result = pool.run_test(level_data, 0, "write_number(1)")
+        self.assertNotEqual(result["worker"], killed["worker"])
+        self.assertNotEqual(result["outcome"], "error")
+
+    def test_level_keys_bounded(self):
+        levels = [make_level(width) for width in range(1, sandbox.LEVEL_KEYS_KEPT + 10)]
+        with sandbox.SandboxPool(workers=1) as pool:
+            keys = [pool.get_level_key(level_data) for level_data in levels]
+        self.assertEqual(len(pool.level_keys), sandbox.LEVEL_KEYS_KEPT)
+        self.assertEqual(len(set(keys)), len(levels))
+        self.assertEqual(pool.get_level_key(make_level(1)), keys[0])
+
+if __name__ == "__main__":
+    unittest.main()
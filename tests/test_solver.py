@@ -0,0 +1,54 @@
+import os, sys
+import random
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import grid_info
+import AlgorNX_solver as solver
+from benchmarks import synthetic
+
+def make_level(shown, wanted, spawn=(1, 1)):
+    return {
+        "size": {"width": len(shown[0]), "height": len(shown)},
+        "spawn": {"x": spawn[0], "y": spawn[1]},
+        "tests": [{"shown": shown, "wanted": wanted}],
+        "allowed_functions": dict(synthetic.allowed_functions),
+    }
+
+class SolverTest(unittest.TestCase):
+    def test_paint_row(self):
+        result = solver.solve_test(make_level([[grid_info.MARKER] * 4], [[grid_info.PAINTED] * 4]), 0)
+        self.assertEqual(result["actions"], 7)
+
+    def test_carry_while_painting(self):
+        # A row of markers and a shape to carry 10 squares away, into a hole
+        shown = [[grid_info.EMPTY] * 8 for y in range(8)]
+        wanted = [[grid_info.EMPTY] * 8 for y in range(8)]
+        shown[0] = [grid_info.MARKER] * 8
+        wanted[0] = [grid_info.PAINTED] * 8
+        shown[3][0] = grid_info.SHAPE_SQUARE | grid_info.FILLED
+        shown[6][7] = grid_info.SHAPE_SQUARE | grid_info.HOLE
+        wanted[6][7] = grid_info.SHAPE_SQUARE | grid_info.HOLE | grid_info.FILLED
+        result = solver.solve_test(make_level(shown, wanted), 0, max_nodes=10000)
+        self.assertTrue(result["solvable"])
+        self.assertEqual(result["actions"], 29)
+
+    def test_weighted_search_scattered_markers(self):
+        # Too many states for the exact search, the weighted one still tells it is solvable
+        shown = [[grid_info.EMPTY] * 10 for y in range(10)]
+        wanted = [[grid_info.EMPTY] * 10 for y in range(10)]
+        for x, y in random.Random(0).sample([(x, y) for x in range(10) for y in range(10)], 20):
+            shown[y][x], wanted[y][x] = grid_info.MARKER, grid_info.PAINTED
+        level_data = make_level(shown, wanted)
+        self.assertIsNone(solver.check_test(level_data, 0, max_nodes=2000)["solvable"])
+        result = solver.check_test(level_data, 0, max_nodes=2000, weight=4)
+        self.assertTrue(result["solvable"])
+        self.assertGreaterEqual(result["actions"], 40)
+
+    def test_weighted_search_unsolvable(self):
+        shown = [[grid_info.MARKER, grid_info.WALL, grid_info.MARKER]]
+        wanted = [[grid_info.PAINTED, grid_info.WALL, grid_info.MARKER | grid_info.PAINTED]]
+        self.assertIs(solver.solve_test(make_level(shown, wanted), 0, weight=4)["solvable"], False)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import os, sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import grid_info
+import AlgorNX_runner as runner
+from benchmarks import synthetic
+
+def make_level(width=1):
+    return {
+        "size": {"width": width, "height": 1},
+        "spawn": {"x": 1, "y": 1},
+        "tests": [{"shown": [[grid_info.EMPTY] * width], "wanted": [[grid_info.EMPTY] * width]}],
+        "allowed_functions": dict(synthetic.allowed_functions),
+        "allowed_keywords": dict(synthetic.allowed_keywords),
+    }
+
+def run_program(source, width=1):
+    """Runs a program to the end, returns the runner and the line numbers it stepped on."""
+    program_runner = runner.validate_and_start_program(source, make_level(width), 0)
+    lines = []
+    while not program_runner.program_done:
+        program_runner.update()
+        lines.append(program_runner.line_no)
+    return program_runner, lines
+
+def written_numbers(program_runner):
+    return [grid_info.square_number_get(square) if square & grid_info.NUMBER else None for square in program_runner.grid]
+
+class SteppingTest(unittest.TestCase):
+    def assertWrites(self, source, numbers):
+        program_runner, lines = run_program(source, len(numbers))
+        self.assertEqual(written_numbers(program_runner), numbers)
+
+    def test_callbacks(self):
+        self.assertWrites("def f(x):\n    return -x\nwrite_number(sorted([3, 1, 2], key=f)[0])", [3])
+        self.assertWrites("def f(x):\n    return x > 0\nwrite_number(len(list(filter(f, [0, 1, 2]))))", [2])
+        self.assertWrites("def f(x):\n    return x * 2\nwrite_number(sum(map(f, [1, 2, 3])))", [12])
+        self.assertWrites("def f(x):\n    return -x\nwrite_number(max([3, 1, 2], key=f))", [1])
+
+    def test_calls_from_unstepped_scopes(self):
+        self.assertWrites("def f(x):\n    return x + 1\nwrite_number(sum([f(x) for x in range(3)]))", [6])
+        self.assertWrites("def f(x):\n    return x + 1\ng = lambda x: f(x) * 2\nwrite_number(g(4))", [10])
+
+    def test_keyword_calls(self):
+        self.assertWrites("def g(function):\n    return function + 1\nwrite_number(g(function=1))", [2])
+        self.assertWrites("def g(a, b=2):\n    return a * b\nwrite_number(g(b=5, a=3))", [15])
+
+    def test_recursion(self):
+        self.assertWrites("def fact(n):\n    if n <= 1:\n        return 1\n    return n * fact(n - 1)\nwrite_number(fact(5))", [120])
+
+    def test_decorators(self):
+        source = "\n".join([
+            "def twice(function):",
+            "    def wrapper(x):",
+            "        return function(function(x))",
+            "    return wrapper",
+            "@twice",
+            "def inc(x):",
+            "    return x + 1",
+            "write_number(inc(1))",
+        ])
+        self.assertWrites(source, [3])
+
+    def test_closures(self):
+        source = "\n".join([
+            "def counter():",
+            "    count = 0",
+            "    def step():",
+            "        nonlocal count",
+            "        count += 1",
+            "        return count",
+            "    return step",
+            "c = counter()",
+            "c()",
+            "write_number(c())",
+        ])
+        self.assertWrites(source, [2])
+
+    def test_line_numbers(self):
+        source = "\n".join([
+            "def f(x):",  # 1
+            "    y = x + 1",  # 2
+            "    return y",  # 3
+            "a = f(1)",  # 4
+            "b = sorted([2, 1], key=f)",  # 5, f runs in one go
+            "write_number(a)",  # 6
+        ])
+        program_runner, lines = run_program(source)
+        self.assertEqual(lines, [1, 4, 2, 3, 5, 6])
+        self.assertEqual(written_numbers(program_runner), [2])
+
+    def test_robot_actions_inside_functions_are_stepped(self):
+        program_runner, lines = run_program("def go():\n    right()\n    right()\ngo()", 3)
+        self.assertEqual(lines, [1, 4, 2, 3])
+        self.assertEqual(program_runner.robot.x, 3)
+    def test_keyword_arguments(self):
+        self.assertWrites("write_number(number=5)", [5])
+
+if __name__ == "__main__":
+    unittest.main()
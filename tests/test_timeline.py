@@ -0,0 +1,49 @@
+import os, sys
+import unittest
+from array import array
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import AlgorNX_runner as runner
+from benchmarks import synthetic
+
+PROGRAM = """for i in range(3):
+    for j in range(5):
+        if not on_painted():
+            paint()
+        right()
+    down()
+    for j in range(5):
+        left()
+"""
+
+def record_run(max_steps=runner.Timeline.MAX_STEPS):
+    program_runner = runner.validate_and_start_program(PROGRAM, synthetic.make_level(6, 6, tests=1), 0, record_timeline=True)
+    program_runner.timeline.max_steps = max_steps
+    robot = program_runner.robot
+    states = [(array(program_runner.grid.typecode, program_runner.grid), robot.position(), robot.direction, robot.holding)]
+    while not program_runner.program_done:
+        program_runner.update()
+        states.append((array(program_runner.grid.typecode, program_runner.grid), robot.position(), robot.direction, robot.holding))
+    return program_runner.timeline, states
+
+class TimelineTest(unittest.TestCase):
+    def test_state_at_every_step(self):
+        timeline, states = record_run()
+        self.assertEqual(len(timeline), len(states) - 1)
+        self.assertFalse(timeline.truncated)
+        self.assertLess(len(timeline.keyframes), len(states))
+        self.assertLess(len(timeline.robot_steps), len(states))
+        for step, state in enumerate(states):
+            self.assertEqual(timeline.state_at(step), state)
+
+    def test_recording_stops_at_max_steps(self):
+        timeline, states = record_run(max_steps=20)
+        self.assertEqual(len(timeline), 20)
+        self.assertTrue(timeline.truncated)
+        self.assertEqual(len(timeline.changed_indexes), timeline.step_ends[-1])
+        for step in range(21):
+            self.assertEqual(timeline.state_at(step), states[step])
+        self.assertEqual(timeline.state_at(len(states)), states[20])
+
+if __name__ == "__main__":
+    unittest.main()
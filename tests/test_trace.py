@@ -0,0 +1,59 @@
+import os, sys
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import AlgorNX_runner as runner
+from benchmarks import synthetic
+from test_stepping import make_level
+
+PROGRAM = "for i in range(5):\n    if not on_painted():\n        paint()\n    right()"
+
+def record_trace(level_data, program=PROGRAM):
+    with tempfile.TemporaryDirectory() as folder:
+        trace_path = os.path.join(folder, "test1.anxt")
+        result = runner.run_test(level_data, 0, program, trace_path=trace_path)
+        with open(trace_path, "rb") as f:
+            return result, f.read()
+
+def replay(level_data, trace_data):
+    replayer = runner.TraceReplayer(level_data, trace_data)
+    while not replayer.program_done:
+        replayer.update()
+    return replayer
+
+class TraceTest(unittest.TestCase):
+    def setUp(self):
+        self.level_data = synthetic.make_level(6, 1, tests=1)
+        self.result, self.trace_data = record_trace(self.level_data)
+
+    def test_replay(self):
+        replayer = replay(self.level_data, self.trace_data)
+        self.assertEqual(replayer.lines_executed, self.result["steps"])
+        self.assertEqual(replayer.outcome, self.result["outcome"])
+
+    def test_step_count_mismatch(self):
+        # Same trace, ending with another step count
+        outcome = self.result["outcome"].encode()
+        end = bytearray()
+        write_varint = runner.write_varint
+        write_varint(end, self.result["steps"])
+        write_varint(end, len(outcome))
+        end += outcome
+        self.assertTrue(self.trace_data.endswith(bytes(end)))
+        tampered = bytearray(self.trace_data[:-len(end)])
+        write_varint(tampered, self.result["steps"] + 1)
+        write_varint(tampered, len(outcome))
+        tampered += outcome
+        with self.assertRaisesRegex(Exception, "Trace step count mismatch"):
+            replay(self.level_data, bytes(tampered))
+    def test_keyword_arguments(self):
+        level_data = make_level(2)
+        result, trace_data = record_trace(level_data, "write_number(number=-5)\nright()\nwrite_number(7)")
+        self.assertNotEqual(result["outcome"], "error")
+        replayer = replay(level_data, trace_data)
+        self.assertEqual(replayer.outcome, result["outcome"])
+        self.assertEqual([runner.grid_info.square_number_get(square) for square in replayer.grid[:2]], [-5, 7])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import os, sys
+import json
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # The images are found relative to the game folder
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import grid_info
+import AlgorNX
+import AlgorNX_runner as runner
+from benchmarks import synthetic
+
+SURFACE_SIZE = 200  # 9 squares of IMAGE_SIZE after the coordinates margin
+
+def make_viewport(width, height):
+    return AlgorNX.Viewport(pygame.Surface((SURFACE_SIZE, SURFACE_SIZE)), width, height)
+
+class ViewportTest(unittest.TestCase):
+    def test_only_visible_squares_drawn(self):
+        viewport = make_viewport(1000, 1000)
+        drawn = []
+        add_square_blits = viewport.add_square_blits
+        viewport.add_square_blits = lambda blits, scaled_images, square_type, position: drawn.append(position) or add_square_blits(blits, scaled_images, square_type, position)
+        viewport.draw(grid_info.grid_to_array(synthetic.make_render_grid(1000, 1000)), {"x": 1, "y": 1}, "right")
+        self.assertEqual(viewport.get_visible_size(), (9, 9))
+        self.assertEqual(len(drawn), 81)
+        self.assertEqual(max(drawn), (viewport.margin + 8 * grid_info.IMAGE_SIZE,) * 2)
+
+    def test_small_grid(self):
+        viewport = make_viewport(3, 2)
+        self.assertEqual(viewport.get_visible_size(), (3, 2))
+        viewport.scroll(5, 5)
+        self.assertEqual((viewport.scroll_x, viewport.scroll_y), (0, 0))
+
+    def test_scroll(self):
+        viewport = make_viewport(50, 20)
+        viewport.scroll(100, 4)
+        self.assertEqual((viewport.scroll_x, viewport.scroll_y), (41, 4))  # The last 9 columns stay visible
+        self.assertEqual(viewport.get_position(42, 5), (viewport.margin, viewport.margin))
+        self.assertIsNone(viewport.get_position(41, 5))
+        viewport.scroll(-100, -100)
+        self.assertEqual((viewport.scroll_x, viewport.scroll_y), (0, 0))
+
+    def test_follow(self):
+        viewport = make_viewport(50, 50)
+        viewport.follow(9, 9)
+        self.assertEqual((viewport.scroll_x, viewport.scroll_y), (0, 0))
+        viewport.follow(10, 30)
+        self.assertEqual((viewport.scroll_x, viewport.scroll_y), (1, 21))
+        viewport.follow(1, 22)
+        self.assertEqual((viewport.scroll_x, viewport.scroll_y), (0, 21))
+
+    def test_zoom(self):
+        viewport = make_viewport(50, 50)
+        viewport.scroll(100, 100)
+        viewport.zoom(100)
+        self.assertEqual(viewport.cell_size, viewport.MAX_CELL_SIZE)
+        self.assertEqual(viewport.get_visible_size(), (5, 5))
+        self.assertEqual(viewport.scroll_x, 41)  # Bigger squares, same first column
+        viewport.zoom(-100)
+        self.assertEqual(viewport.cell_size, viewport.MIN_CELL_SIZE)
+        self.assertEqual(viewport.scroll_x, 5)  # Moved back, there is room for 45 columns
+        viewport.draw(grid_info.grid_to_array(synthetic.make_render_grid(50, 50)), {"x": 1, "y": 1}, "right")
+        self.assertEqual(viewport.get_images()[grid_info.get_image_from_type(grid_info.MARKER)].get_size(), (viewport.MIN_CELL_SIZE,) * 2)
+class DirtyRectsTest(unittest.TestCase):
+    def setUp(self):
+        self.squares = grid_info.grid_to_array(synthetic.make_render_grid(20, 20))
+        self.viewport = make_viewport(20, 20)
+        self.viewport.draw(self.squares, {"x": 2, "y": 2}, "right")
+
+    def assertSameAsFullDraw(self, robot_position, robot_direction):
+        viewport = make_viewport(20, 20)
+        viewport.scroll(self.viewport.scroll_x, self.viewport.scroll_y)
+        viewport.draw(self.squares, robot_position, robot_direction)
+        self.assertEqual(pygame.image.tobytes(self.viewport.surface, "RGB"), pygame.image.tobytes(viewport.surface, "RGB"))
+
+    def test_changed_squares_and_robot(self):
+        self.squares[2*20 + 4] = grid_info.PAINTED
+        rects = self.viewport.update(self.squares, {"x": 3, "y": 2}, "right", {2*20 + 4})
+        positions = sorted(rect.topleft for rect in rects)
+        self.assertEqual(positions, sorted(self.viewport.get_position(x, y) for x, y in ((5, 3), (2, 2), (3, 2))))
+        self.assertTrue(all(rect.size == (grid_info.IMAGE_SIZE,) * 2 for rect in rects))
+        self.assertSameAsFullDraw({"x": 3, "y": 2}, "right")
+
+    def test_turning_robot(self):
+        rects = self.viewport.update(self.squares, {"x": 2, "y": 2}, "down", set())
+        self.assertEqual([rect.topleft for rect in rects], [self.viewport.get_position(2, 2)])
+        self.assertSameAsFullDraw({"x": 2, "y": 2}, "down")
+
+    def test_hidden_changes(self):
+        self.squares[19*20 + 19] = grid_info.PAINTED
+        self.assertEqual(self.viewport.update(self.squares, {"x": 2, "y": 2}, "right", {19*20 + 19}), [])
+
+    def test_full_redraws(self):
+        full = [self.viewport.surface.get_rect()]
+        self.assertEqual(self.viewport.update(self.squares, {"x": 2, "y": 2}, "right", None), full)
+        self.viewport.scroll(3, 0)
+        self.assertEqual(self.viewport.update(self.squares, {"x": 2, "y": 2}, "right", set()), full)
+        self.assertSameAsFullDraw({"x": 2, "y": 2}, "right")
+        self.viewport.draw_mismatches([(5, 5)], (255, 0, 0))
+        self.assertEqual(self.viewport.update(self.squares, {"x": 2, "y": 2}, "right", set()), full)
+
+    def test_changed_squares_of_a_run(self):
+        program_runner = runner.validate_and_start_program("right()\npaint()", synthetic.make_level(4, 2, tests=1), 0)
+        self.assertIsNone(program_runner.pop_changed_squares())
+        while not program_runner.program_done:
+            program_runner.update()
+        self.assertEqual(program_runner.pop_changed_squares(), {1})
+        self.assertEqual(program_runner.pop_changed_squares(), set())
+
+class LargeLevelTest(unittest.TestCase):
+    def test_run_length_grids(self):
+        grid = synthetic.make_render_grid(30, 7)
+        grid[3] = [grid_info.PAINTED] * 30
+        encoded = grid_info.encode_grid(grid)
+        self.assertLess(len(encoded["runs"]), 30 * 7)
+        self.assertEqual(grid_info.decode_grid(encoded, 30), grid)
+        self.assertIs(grid_info.decode_grid(grid, 30), grid)
+
+    def test_load_level(self):
+        size = grid_info.LEVEL_MAX_SIZE
+        level_data = synthetic.make_level(size, size, tests=1)
+        for test in level_data["tests"]:
+            test["shown"] = grid_info.encode_grid(test["shown"])
+            test["wanted"] = grid_info.encode_grid(test["wanted"])
+        with tempfile.TemporaryDirectory() as level_folder:
+            with open(os.path.join(level_folder, "level.json"), "w") as f:
+                json.dump(level_data, f)
+            self.assertEqual(len(runner.load_level(level_folder)["tests"][0]["wanted"]), size)
+
+            level_data["size"]["width"] = size + 1
+            with open(os.path.join(level_folder, "level.json"), "w") as f:
+                json.dump(level_data, f)
+            with self.assertRaisesRegex(Exception, "Level too big"):
+                runner.load_level(level_folder)
+
+if __name__ == "__main__":
+    unittest.main()